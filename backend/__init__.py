@@ -0,0 +1,3 @@
+"""
+Budgetly Flask backend
+"""
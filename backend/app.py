@@ -1,45 +1,501 @@
+import functools
+import hashlib
+import os
+import uuid
+from datetime import date, datetime
 
-from flask import Flask, jsonify, request
-from pymongo import MongoClient
+from flask import (Blueprint, Flask, Response, current_app, g, jsonify, request,
+                   stream_with_context)
+from backend import (auth, budget, bulk, cache, categories, compression, export,
+                     forecast, goals, importer, jsonprovider, ledger, metrics, periods,
+                     recurring, reminders, reports, rollups, store, sync)
+from backend.config import Config
+from backend.mongo import mongo
 
-app = Flask(__name__)
+api = Blueprint('api', __name__)
 
+# Ledger collection behind each URL segment
+ledger_collections = {
+    'expenses': 'expenses',
+    'income': 'incomes',
+}
+# Rollup type recorded for each ledger
+ledger_types = {
+    'expenses': 'expense',
+    'income': 'income',
+}
 
-# Connect to MongoDB (default local connection)
-client = MongoClient('mongodb://localhost:27017/')
-db = client['budgetly_db']
-collection = db['balances']
 
+def create_app(config=None):
+    """Create the Flask app. The MongoDB client is only created on first use."""
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    if config:
+        app.config.update(config)
+    app.json = jsonprovider.JSONProvider(app)
+    mongo.init_app(app)
+    app.extensions['budget_cache'] = cache.make_cache(app.config)
+    app.extensions['sync_versions'] = cache.TTLCache(app.config['CACHE_SIZE'],
+                                                     app.config['CACHE_VERSION_TTL'])
+    app.extensions['auth'] = auth.Authenticator(app.config)
+    if app.config['METRICS_ENABLED']:
+        metrics.Metrics({'budget': app.extensions['budget_cache']}).init_app(app)
+    if app.config['COMPRESSION_ENABLED']:
+        compression.Compression(app.config['COMPRESS_MIN_SIZE'], app.config['COMPRESS_LEVEL'],
+                                app.config['COMPRESS_BROTLI_QUALITY'],
+                                app.config['COMPRESS_FLUSH_BYTES']).init_app(app)
+    app.register_blueprint(api)
+    return app
 
-@app.route('/')
+
+def get_balances():
+    return mongo.collection('balances')
+
+
+def get_ledger(kind):
+    """Return the ledger collection for a URL segment"""
+    return mongo.collection(ledger_collections[kind])
+
+
+def budget_cache():
+    return current_app.extensions['budget_cache']
+
+
+def cached_version(owner):
+    """The user's change number, read at most every CACHE_VERSION_TTL seconds"""
+    versions = current_app.extensions['sync_versions']
+    version = versions.get(owner)
+    if version is None:
+        version = sync.version(mongo, owner)
+        versions.set(owner, version)
+    return version
+
+
+def forget_version(owner):
+    """Make this worker read the user's change number again after a write"""
+    current_app.extensions['sync_versions'].delete(owner)
+
+
+def get_rollups():
+    return mongo.collection('monthly_rollups')
+
+
+def get_period_totals():
+    return mongo.collection('period_totals')
+
+
+def get_recurring():
+    return mongo.collection('recurring_payments')
+
+
+def current_user():
+    """Resolve the user that owns the requested data (once per request)"""
+    if 'user' not in g:
+        g.user = current_app.extensions['auth'].resolve(request.headers)
+    return g.user
+
+
+def matching_etag(etag):
+    """The If-None-Match tag naming etag in any content encoding, or None.
+
+    That is the tag the 200 response sent the client, with the encoding
+    appended if it was compressed, so a 304 sends it back unchanged."""
+    tags = request.if_none_match
+    if tags.star_tag:
+        return etag
+    for tag in tags.as_set(include_weak=True):
+        if compression.base_etag(tag) == etag:
+            return tag
+    return None
+
+
+def not_modified(etag):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    if 'compression' in current_app.extensions:
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def versioned(view):
+    """Tag a GET with the user's change number, so a client sending the
+    tag back in If-None-Match gets a 304 before any query runs"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        owner = current_user()
+        key = hashlib.blake2b(('%s\0%s' % (owner, request.full_path)).encode(),
+                              digest_size=8).hexdigest()
+        etag = '%d-%s' % (sync.version(mongo, owner), key)
+        matched = matching_etag(etag)
+        if matched:
+            response = not_modified(matched)
+        else:
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            response.set_etag(etag)
+        # Per user, and always checked with the server before reuse
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapper
+
+
+@api.app_errorhandler(ledger.ValidationError)
+def handle_validation_error(error):
+    return jsonify({'error': str(error)}), 400
+
+
+@api.app_errorhandler(auth.AuthError)
+def handle_auth_error(error):
+    return jsonify({'error': str(error)}), 401
+
+
+@api.route('/')
 def home():
     return 'Hello, the Flask backend is ready!'
 
 
-# Example: Get balance from MongoDB
-@app.route('/api/budget', methods=['GET'])
+# Get balance, read through the budget cache. Responses carry an ETag,
+# so clients sending If-None-Match get a 304 when nothing has changed.
+# Entries are keyed on the user's change number, which every write moves
+# after changing the data: a write makes every worker's entry stale, and
+# a read racing a write can only file what it read under the older number.
+# Each worker keeps the number for CACHE_VERSION_TTL seconds, so a hit
+# does not touch the database; writes through this worker drop it at once.
+@api.route('/api/budget', methods=['GET'])
 def get_budget():
-    doc = collection.find_one()
-    if doc:
-        data = {
-            'budget': doc.get('budget', 0),
-            'currency': doc.get('currency', 'IRR')
-        }
-    else:
-        data = {'budget': 0, 'currency': 'IRR'}
-    return jsonify(data)
+    owner = current_user()
+    key = 'budget:%s:%d' % (owner, cached_version(owner))
+    cached = budget_cache().get(key)
+    if cached is None:
+        data = budget.load_budget(get_balances(), owner)
+        cached = {'data': data, 'etag': budget.budget_etag(data)}
+        budget_cache().set(key, cached)
+    matched = matching_etag(cached['etag'])
+    if matched:
+        return not_modified(matched)
+    response = jsonify(cached['data'])
+    response.set_etag(cached['etag'])
+    return response
 
 
-# Example: Set balance in MongoDB
-@app.route('/api/budget', methods=['POST'])
+# Set balance in MongoDB with one keyed upsert, so readers never see
+# the budget missing while it is being replaced.
+# Optional ?w= and ?j= set the write concern for this request.
+@api.route('/api/budget', methods=['POST'])
 def set_budget():
     req_data = request.get_json()
-    collection.delete_many({})  # Remove old balance
-    collection.insert_one(req_data)
+    write_concern = budget.parse_write_concern(request.args)
+    owner = current_user()
+    store.save_budget(mongo, owner, req_data, write_concern)
+    forget_version(owner)
     return jsonify({
         'message': 'Budget saved to MongoDB',
         'data': req_data
     })
 
+
+# Prometheus metrics for this process (404 with METRICS_ENABLED off)
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    if 'metrics' not in current_app.extensions:
+        return jsonify({'error': 'metrics are disabled'}), 404
+    return Response(current_app.extensions['metrics'].render(),
+                    content_type=metrics.CONTENT_TYPE)
+
+
+@api.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({'budget': budget_cache().stats()})
+
+
+# Ledger: list entries newest first, one page at a time.
+# Pass the returned next_cursor back as ?cursor= to get the following page.
+@api.route('/api/<any(expenses, income):kind>', methods=['GET'])
+@versioned
+def list_entries(kind):
+    args = request.args
+    start = ledger.parse_date(args['from']) if 'from' in args else None
+    end = ledger.parse_date(args['to']) if 'to' in args else None
+    query = ledger.build_query(current_user(), category=args.get('category'),
+                               start=start, end=end, cursor=args.get('cursor'))
+    page = ledger.fetch_page(get_ledger(kind), query,
+                             ledger.parse_limit(args.get('limit')))
+    return jsonify(page)
+
+
+@api.route('/api/<any(expenses, income):kind>', methods=['POST'])
+def add_entry(kind):
+    entry = store.add_entry(mongo, current_user(), ledger_types[kind], request.get_json())
+    return jsonify(ledger.serialize_entry(entry)), 201
+
+
+@api.route('/api/<any(expenses, income):kind>/<entry_id>', methods=['PUT'])
+def update_entry(kind, entry_id):
+    doc = store.update_entry(mongo, current_user(), ledger_types[kind], entry_id,
+                             request.get_json())
+    if doc is None:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify(ledger.serialize_entry(doc))
+
+
+@api.route('/api/<any(expenses, income):kind>/<entry_id>', methods=['DELETE'])
+def delete_entry(kind, entry_id):
+    if store.delete_entry(mongo, current_user(), ledger_types[kind], entry_id) is None:
+        return jsonify({'error': 'not found'}), 404
+    return '', 204
+
+
+# Ledger: bulk ingest of a JSON array (or application/x-ndjson) body.
+# Rows are validated as they stream in and written with unordered
+# insert_many batches of ?chunk_size= rows. The response is sent once the
+# whole body is read, so clients can upload without reading at the same
+# time: counts of inserted and failed rows, plus the ids of the first
+# inserted rows and the first rejected rows, each by row index.
+@api.route('/api/<any(expenses, income):kind>/bulk', methods=['POST'])
+def bulk_add_entries(kind):
+    chunk_size = bulk.parse_chunk_size(request.args.get('chunk_size'),
+                                       current_app.config['BULK_CHUNK_SIZE'])
+    if request.mimetype == 'application/x-ndjson':
+        rows = bulk.iter_ndjson(request.stream)
+    else:
+        rows = bulk.iter_json_array(request.stream)
+    owner = current_user()
+
+    def on_insert(docs):
+        store.entries_inserted(mongo, owner, ledger_types[kind], docs)
+
+    summary = bulk.summarize(bulk.ingest(get_ledger(kind), rows, owner, chunk_size,
+                                         on_insert))
+    return jsonify(summary), 400 if 'error' in summary else 200
+
+
+# Reports: category totals and monthly series for both ledgers.
+# Optional ?from= and ?to= limit the date range. Whole-month ranges are
+# read from the monthly rollups; other ranges are aggregated from the
+# raw ledgers.
+@api.route('/api/reports', methods=['GET'])
+@versioned
+def get_reports():
+    args = request.args
+    start = ledger.parse_date(args['from']) if 'from' in args else None
+    end = ledger.parse_date(args['to']) if 'to' in args else None
+    owner = current_user()
+    if rollups.is_month_aligned(start, end):
+        coll = get_rollups()
+        expenses = rollups.summarize(coll, owner, 'expense', start, end)
+        incomes = rollups.summarize(coll, owner, 'income', start, end)
+    else:
+        expenses = reports.summarize(get_ledger('expenses'), owner, start, end)
+        incomes = reports.summarize(get_ledger('income'), owner, start, end)
+    return jsonify(reports.build_report(expenses, incomes))
+
+
+# Cash-flow forecast: the stored budget projected over ?months= months
+# (default 12) from recurring payments and the average of the last
+# ?history= months (default 12) of the ledger.
+@api.route('/api/forecast', methods=['GET'])
+def get_forecast():
+    months, history = forecast.parse_args(request.args)
+    owner = current_user()
+    today = date.today()
+    payments = list(get_recurring().find(
+        {'user': owner},
+        {field: 1 for field in recurring.FIELDS if field != 'reminders'},
+    ))
+    averages = forecast.monthly_averages(get_rollups(), owner, today, history)
+    result = forecast.build_forecast(budget.load_budget(get_balances(), owner),
+                                     payments, averages, today, months)
+    return jsonify(result)
+
+
+# Export all of the user's data, streamed from MongoDB cursors.
+# ?format=csv (default) or ndjson; compressed as it streams when the
+# client accepts it.
+@api.route('/api/export', methods=['GET'])
+@versioned
+def export_data():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        raise ledger.ValidationError('format must be csv or ndjson')
+    mimetype, filename = export.FORMATS[fmt]
+    db = mongo.db
+    owner = current_user()
+    chunks = (export.iter_csv if fmt == 'csv' else export.iter_ndjson)(db, owner)
+    headers = {'Content-Disposition': 'attachment; filename=%s' % filename}
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+
+# Import data in the export format (CSV, or NDJSON with
+# Content-Type: application/x-ndjson), parsed as it streams in and
+# upserted by id in batches. Progress is checkpointed under ?import_id=;
+# re-sending the same file with the same id resumes after the last
+# written batch.
+@api.route('/api/import', methods=['POST'])
+def import_data():
+    import_id = request.args.get('import_id') or uuid.uuid4().hex
+    if request.mimetype == 'application/x-ndjson':
+        rows = importer.iter_ndjson_rows(request.stream)
+    else:
+        rows = importer.iter_csv_rows(request.stream)
+    result = importer.run_import(mongo.db, rows, current_user(), import_id,
+                                 current_app.config['IMPORT_BATCH_SIZE'])
+    return jsonify(result)
+
+
+# Categories, listed per ledger type
+@api.route('/api/categories', methods=['GET'])
+@versioned
+def list_categories():
+    owner = current_user()
+    return jsonify({
+        type_: sorted(doc['name'] for doc in mongo.collection(name).find(
+            {'user': owner}, {'name': 1, '_id': 0}))
+        for type_, name in categories.CATEGORY_COLLECTIONS.items()
+    })
+
+
+@api.route('/api/categories/<any(expense, income):type_>', methods=['POST'])
+def add_category(type_):
+    doc = store.add_category(mongo, current_user(), type_, request.get_json())
+    return jsonify(store.serialize_category(doc)), 201
+
+
+@api.route('/api/categories/<any(expense, income):type_>/<name>', methods=['DELETE'])
+def delete_category(type_, name):
+    if not store.delete_category(mongo, current_user(), type_, name):
+        return jsonify({'error': 'not found'}), 404
+    return '', 204
+
+
+# Budget goals
+@api.route('/api/budget-goals', methods=['GET'])
+@versioned
+def list_goals():
+    docs = mongo.collection('budget_goals').find({'user': current_user()},
+                                                 goals.PROJECTION)
+    return jsonify([goals.serialize_goal(doc) for doc in docs])
+
+
+@api.route('/api/budget-goals', methods=['POST'])
+def add_goal():
+    goal = store.add_goal(mongo, current_user(), request.get_json())
+    return jsonify(goals.serialize_goal(goal)), 201
+
+
+@api.route('/api/budget-goals/<goal_id>', methods=['PUT'])
+def update_goal(goal_id):
+    doc = store.update_goal(mongo, current_user(), goal_id, request.get_json())
+    if doc is None:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify(goals.serialize_goal(doc))
+
+
+@api.route('/api/budget-goals/<goal_id>', methods=['DELETE'])
+def delete_goal(goal_id):
+    if not store.delete_goal(mongo, current_user(), goal_id):
+        return jsonify({'error': 'not found'}), 404
+    return '', 204
+
+
+# Each goal's total for the current day/week/month/year, read from the
+# period buckets in one query, with the share used and the projected
+# overrun at the current pace.
+@api.route('/api/budget-goals/status', methods=['GET'])
+def get_goal_status():
+    owner = current_user()
+    docs = list(mongo.collection('budget_goals').find({'user': owner}))
+    today = datetime.utcnow()
+    wanted = {doc.get('period') for doc in docs} & set(periods.PERIODS)
+    totals = periods.current_totals(get_period_totals(), owner, today, wanted)
+    return jsonify(goals.status(docs, totals, today))
+
+
+# Recurring payments
+@api.route('/api/recurring', methods=['GET'])
+@versioned
+def list_recurring():
+    docs = get_recurring().find({'user': current_user()},
+                                {field: 1 for field in recurring.FIELDS})
+    return jsonify([recurring.serialize_payment(doc) for doc in docs])
+
+
+@api.route('/api/recurring', methods=['POST'])
+def add_recurring():
+    payment = store.add_payment(mongo, current_user(), request.get_json())
+    return jsonify(recurring.serialize_payment(payment)), 201
+
+
+@api.route('/api/recurring/<payment_id>', methods=['PUT'])
+def update_recurring(payment_id):
+    doc = store.update_payment(mongo, current_user(), payment_id, request.get_json())
+    if doc is None:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify(recurring.serialize_payment(doc))
+
+
+@api.route('/api/recurring/<payment_id>', methods=['DELETE'])
+def delete_recurring(payment_id):
+    if not store.delete_payment(mongo, current_user(), payment_id):
+        return jsonify({'error': 'not found'}), 404
+    return '', 204
+
+
+# Occurrences of all recurring payments between ?from= (default today)
+# and ?to= (default a year later), merged in date order, at most ?limit=.
+@api.route('/api/recurring/occurrences', methods=['GET'])
+def list_occurrences():
+    start, end, limit = recurring.parse_window(request.args)
+    payments = list(get_recurring().find(
+        {'user': current_user()},
+        {field: 1 for field in recurring.FIELDS if field != 'reminders'},
+    ))
+    return jsonify({'from': start.strftime(ledger.DATE_FORMAT),
+                    'to': end.strftime(ledger.DATE_FORMAT),
+                    'occurrences': list(recurring.expand(payments, start, end, limit))})
+
+
+# Reminders fired by the scheduler worker (python -m backend.reminders),
+# newest first
+@api.route('/api/notifications', methods=['GET'])
+def list_notifications():
+    docs = mongo.collection('notifications').find(
+        {'user': current_user()},
+        reminders.PROJECTION,
+        sort=[('fire_at', -1)],
+        limit=ledger.parse_limit(request.args.get('limit')),
+    )
+    return jsonify([reminders.serialize_notification(doc) for doc in docs])
+
+
+# Delta sync: changes after ?since= (the `next` token of the previous
+# sync; omit it for a full sync), oldest first, at most ?limit=.
+# Deleted documents come back as tombstones.
+@api.route('/api/sync', methods=['GET'])
+def get_changes():
+    return jsonify(sync.changes_since(mongo, current_user(),
+                                      sync.parse_token(request.args.get('since')),
+                                      sync.parse_limit(request.args.get('limit'))))
+
+
+# Delta sync: apply a batch of offline mutations in order. Each one
+# carries the `seq` it was based on and is reported as applied,
+# not_found, error, or conflict (with the server's current version).
+@api.route('/api/sync', methods=['POST'])
+def post_changes():
+    data = request.get_json()
+    mutations = sync.parse_mutations(data)
+    owner = current_user()
+    results = [store.apply_mutation(mongo, owner, index, mutation)
+               for index, mutation in enumerate(mutations)]
+    forget_version(owner)
+    since = sync.parse_token(request.args.get('since'))
+    return jsonify({'results': results,
+                    **sync.changes_since(mongo, owner, since, sync.MAX_LIMIT)})
+
+
+app = create_app()
+
+# Development server only; production runs backend.wsgi under gunicorn
 if __name__ == '__main__':
-    app.run(debug=True)
+    app.run(port=int(os.environ.get('PORT', 5000)), debug=True)
@@ -0,0 +1,157 @@
+"""
+Async (ASGI) variant of the budget and ledger API, built on Quart.
+
+Serves the same routes as backend.app for `/`, `/api/budget` and the
+expense/income ledger, with async handlers that await their database work
+instead of holding the event loop. That work is the sync app's own code
+(backend.store, ledger.fetch_page, budget.load_budget), so writes keep
+their rollups, period buckets and delta sync log, and DATABASE_BACKEND
+selects the database like it does for backend.app. Bulk ingest, reports
+and sync itself are only served by backend.app.
+
+There is no async database client here: Motor and pymongo's
+AsyncMongoClient only cover MongoDB, and the sqlite and memory backends
+and the shared write code are synchronous. Database calls run instead on
+a pool of ASYNC_DB_THREADS threads per worker (MONGO_MAX_POOL_SIZE when
+0), each holding one pooled connection while it works. This keeps slow
+clients off threads, but it does not make database concurrency cheaper:
+a worker runs at most that many queries at once, the rest queue for a
+thread, and every query still costs a thread hand-off.
+
+Requires the optional async dependencies:
+    pip install quart uvicorn
+
+Run with:
+    uvicorn backend.asgi:app --workers 4
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from quart import Blueprint, Quart, current_app, g, jsonify, request
+
+from backend import auth, budget, ledger, store
+from backend.config import Config
+from backend.mongo import MongoState
+
+api = Blueprint('async_api', __name__)
+
+ledger_collections = {
+    'expenses': 'expenses',
+    'income': 'incomes',
+}
+ledger_types = {
+    'expenses': 'expense',
+    'income': 'income',
+}
+
+
+def create_async_app(config=None):
+    """Create the Quart app. The database client is only created on first use."""
+    app = Quart(__name__)
+    app.config.from_object(Config)
+    if config:
+        app.config.update(config)
+    app.extensions['mongo'] = MongoState(app.config)
+    app.extensions['auth'] = auth.Authenticator(app.config)
+    app.register_blueprint(api)
+
+    @app.after_serving
+    async def close_client():
+        executor = app.extensions.pop('db_executor', None)
+        if executor is not None:
+            executor.shutdown(wait=False)
+        app.extensions['mongo'].close()
+
+    return app
+
+
+async def run_db(func, *args):
+    """Await func(db, *args), run on the app's database threads"""
+    app = current_app._get_current_object()
+    executor = app.extensions.get('db_executor')
+    if executor is None:
+        threads = app.config['ASYNC_DB_THREADS'] or app.config['MONGO_MAX_POOL_SIZE']
+        executor = app.extensions['db_executor'] = ThreadPoolExecutor(
+            threads, thread_name_prefix='db')
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, functools.partial(func, app.extensions['mongo'], *args))
+
+
+def current_user():
+    if 'user' not in g:
+        g.user = current_app.extensions['auth'].resolve(request.headers)
+    return g.user
+
+
+@api.app_errorhandler(ledger.ValidationError)
+async def handle_validation_error(error):
+    return jsonify({'error': str(error)}), 400
+
+
+@api.app_errorhandler(auth.AuthError)
+async def handle_auth_error(error):
+    return jsonify({'error': str(error)}), 401
+
+
+@api.route('/')
+async def home():
+    return 'Hello, the Flask backend is ready!'
+
+
+@api.route('/api/budget', methods=['GET'])
+async def get_budget():
+    owner = current_user()
+    return jsonify(await run_db(lambda db: budget.load_budget(db['balances'], owner)))
+
+
+@api.route('/api/budget', methods=['POST'])
+async def set_budget():
+    req_data = await request.get_json()
+    write_concern = budget.parse_write_concern(request.args)
+    await run_db(store.save_budget, current_user(), req_data, write_concern)
+    return jsonify({
+        'message': 'Budget saved to MongoDB',
+        'data': req_data
+    })
+
+
+@api.route('/api/<any(expenses, income):kind>', methods=['GET'])
+async def list_entries(kind):
+    args = request.args
+    start = ledger.parse_date(args['from']) if 'from' in args else None
+    end = ledger.parse_date(args['to']) if 'to' in args else None
+    query = ledger.build_query(current_user(), category=args.get('category'),
+                               start=start, end=end, cursor=args.get('cursor'))
+    limit = ledger.parse_limit(args.get('limit'))
+    page = await run_db(lambda db: ledger.fetch_page(db[ledger_collections[kind]],
+                                                     query, limit))
+    return jsonify(page)
+
+
+@api.route('/api/<any(expenses, income):kind>', methods=['POST'])
+async def add_entry(kind):
+    data = await request.get_json()
+    entry = await run_db(store.add_entry, current_user(), ledger_types[kind], data)
+    return jsonify(ledger.serialize_entry(entry)), 201
+
+
+@api.route('/api/<any(expenses, income):kind>/<entry_id>', methods=['PUT'])
+async def update_entry(kind, entry_id):
+    data = await request.get_json()
+    doc = await run_db(store.update_entry, current_user(), ledger_types[kind],
+                       entry_id, data)
+    if doc is None:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify(ledger.serialize_entry(doc))
+
+
+@api.route('/api/<any(expenses, income):kind>/<entry_id>', methods=['DELETE'])
+async def delete_entry(kind, entry_id):
+    if await run_db(store.delete_entry, current_user(), ledger_types[kind],
+                    entry_id) is None:
+        return jsonify({'error': 'not found'}), 404
+    return '', 204
+
+
+app = create_async_app()
@@ -0,0 +1,83 @@
+"""
+Resolves the user that owns a request from a signed bearer token.
+
+Tokens are `Authorization: Bearer <token>` values signed with SECRET_KEY
+(itsdangerous, which Flask already depends on), so resolving the user
+needs no database lookup. Unless AUTH_REQUIRED is set, requests without a
+token may name their user in `X-User-Id` or fall back to a single
+'default' user, as in local development.
+
+Usage:
+    python -m backend.auth issue USER_ID
+"""
+import argparse
+from typing import Any, Mapping
+
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+from backend.config import DEV_SECRET_KEY, Config
+
+DEFAULT_USER = 'default'
+MAX_USER_LENGTH = 128
+SALT = 'budgetly-auth'
+
+
+class AuthError(Exception):
+    """Missing or invalid credentials (HTTP 401)"""
+
+
+def _check_user(user: Any) -> str:
+    if not isinstance(user, str) or not 0 < len(user) <= MAX_USER_LENGTH:
+        raise AuthError('invalid user id')
+    return user
+
+
+class Authenticator:
+    """Issues and checks tokens for one app's settings"""
+
+    def __init__(self, config: Mapping[str, Any]):
+        if config['AUTH_REQUIRED'] and config['SECRET_KEY'] == DEV_SECRET_KEY:
+            raise ValueError('set SECRET_KEY when AUTH_REQUIRED is enabled')
+        self.required = config['AUTH_REQUIRED']
+        self.max_age = config['AUTH_TOKEN_MAX_AGE']
+        self.serializer = URLSafeTimedSerializer(config['SECRET_KEY'], salt=SALT)
+
+    def issue(self, user: str) -> str:
+        return self.serializer.dumps({'user': _check_user(user)})
+
+    def verify(self, token: str) -> str:
+        try:
+            data = self.serializer.loads(token, max_age=self.max_age)
+        except SignatureExpired:
+            raise AuthError('token expired')
+        except BadSignature:
+            raise AuthError('invalid token')
+        return _check_user(data.get('user') if isinstance(data, dict) else None)
+
+    def resolve(self, headers: Mapping[str, str]) -> str:
+        """The user id for a request's headers; raises AuthError"""
+        authorization = headers.get('Authorization')
+        if authorization:
+            scheme, _, token = authorization.partition(' ')
+            if scheme.lower() != 'bearer' or not token:
+                raise AuthError('expected a bearer token')
+            return self.verify(token.strip())
+        if self.required:
+            raise AuthError('missing bearer token')
+        return _check_user(headers.get('X-User-Id', DEFAULT_USER))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Issue API tokens')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    issue = subcommands.add_parser('issue', help='print a token for a user id')
+    issue.add_argument('user')
+    args = parser.parse_args(argv)
+
+    config = {name: getattr(Config, name) for name in dir(Config) if name.isupper()}
+    print(Authenticator(config).issue(args.user))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
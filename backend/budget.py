@@ -0,0 +1,98 @@
+"""
+Budget document helpers: keyed upsert and per-request write concern
+"""
+import hashlib
+import json
+import math
+from typing import Any, Dict, Mapping, Optional
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.write_concern import WriteConcern
+
+from backend.ledger import ValidationError
+
+DEFAULT_BUDGET = {'budget': 0, 'currency': 'IRR'}
+
+BUDGET_INDEXES = [
+    # One budget document per owner; also keeps concurrent upserts from
+    # inserting duplicates for the same owner
+    IndexModel([('user', ASCENDING)], name='user', unique=True),
+]
+
+
+def ensure_indexes(collection) -> None:
+    """Create the index used to key budget documents by owner"""
+    collection.create_indexes(BUDGET_INDEXES)
+
+
+def parse_write_concern(args: Mapping[str, str]) -> WriteConcern:
+    """Build a write concern from the ?w= and ?j= query parameters"""
+    w: Any = args.get('w')
+    if w is not None and w != 'majority':
+        try:
+            w = int(w)
+        except ValueError:
+            raise ValidationError("w must be an integer or 'majority'")
+        if w < 0:
+            raise ValidationError('w must not be negative')
+    j = args.get('j')
+    if j is not None:
+        j = j.lower() in ('1', 'true')
+    if w == 0 and j:
+        raise ValidationError('j cannot be combined with w=0')
+    return WriteConcern(w=w, j=j)
+
+
+def shape_budget(doc: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Return the API view of a budget document, or the default for None"""
+    if not doc:
+        return dict(DEFAULT_BUDGET)
+    return {
+        'budget': doc.get('budget', DEFAULT_BUDGET['budget']),
+        'currency': doc.get('currency', DEFAULT_BUDGET['currency']),
+    }
+
+
+def budget_etag(data: Dict[str, Any]) -> str:
+    """Strong ETag for the API view of a budget"""
+    body = json.dumps(data, sort_keys=True, default=str).encode()
+    return hashlib.sha1(body).hexdigest()
+
+
+def budget_document(owner: str, data: Any) -> Dict[str, Any]:
+    """Validate a request body and return the document to store.
+
+    Only the fields in DEFAULT_BUDGET are stored (an `_id` is ignored), so
+    a body can never turn the replacement into an update operator."""
+    if not isinstance(data, dict):
+        raise ValidationError('budget must be a JSON object')
+    unknown = sorted(set(data) - set(DEFAULT_BUDGET) - {'_id'})
+    if unknown:
+        raise ValidationError('unknown budget fields: %s' % ', '.join(map(str, unknown)))
+    doc: Dict[str, Any] = {}
+    if 'budget' in data:
+        amount = data['budget']
+        if (isinstance(amount, bool) or not isinstance(amount, (int, float))
+                or not math.isfinite(amount)):
+            raise ValidationError('budget must be a finite number')
+        doc['budget'] = amount
+    if 'currency' in data:
+        if not isinstance(data['currency'], str) or not data['currency']:
+            raise ValidationError('currency must be a non-empty string')
+        doc['currency'] = data['currency']
+    doc['user'] = owner
+    return doc
+
+
+def load_budget(collection, owner: str) -> Dict[str, Any]:
+    """Return the owner's budget, or the default when none is stored"""
+    return shape_budget(collection.find_one({'user': owner}))
+
+
+def save_budget(collection, owner: str, data: Any,
+                write_concern: WriteConcern) -> None:
+    """Replace the owner's budget document in a single upsert"""
+    doc = budget_document(owner, data)
+    collection.with_options(write_concern=write_concern).replace_one(
+        {'user': owner}, doc, upsert=True
+    )
@@ -0,0 +1,220 @@
+"""
+Bulk ingest of ledger entries from streamed JSON array or NDJSON bodies
+"""
+import codecs
+import heapq
+import json
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError
+
+from backend.ledger import ValidationError, parse_entry
+
+DEFAULT_CHUNK_SIZE = 1000
+# Rejected rows listed in an upload's summary; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+# Inserted rows whose ids are listed in an upload's summary
+MAX_REPORTED_IDS = 10000
+MAX_CHUNK_SIZE = 10000
+READ_SIZE = 64 * 1024
+NUMBER_CHARS = '0123456789.eE+-'
+
+# Each parsed row is (index in the upload, value); rows that could not be
+# decoded carry a ValidationError instead of a value
+Row = Tuple[int, Any]
+
+
+def parse_chunk_size(value: Optional[str], default: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Parse the insert_many batch size, clamped to MAX_CHUNK_SIZE"""
+    if value is None:
+        return default
+    try:
+        size = int(value)
+    except ValueError:
+        raise ValidationError('chunk_size must be an integer')
+    if size < 1:
+        raise ValidationError('chunk_size must be positive')
+    return min(size, MAX_CHUNK_SIZE)
+
+
+def iter_ndjson(stream) -> Iterator[Row]:
+    """Yield one row per non-blank line of a newline-delimited JSON stream"""
+    index = 0
+    for line in iter(stream.readline, b''):
+        if not line.strip():
+            continue
+        try:
+            yield index, json.loads(line)
+        except ValueError as error:
+            yield index, ValidationError('invalid JSON: %s' % error)
+        index += 1
+
+
+class _ArrayReader:
+    """Incremental reader over a stream that holds one JSON array"""
+
+    def __init__(self, stream, read_size: int):
+        self.stream = stream
+        self.read_size = read_size
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Read another block, dropping the consumed part of the buffer"""
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.read_size)
+        self.eof = not chunk
+        self.buf = self.buf[self.pos:] + self.utf8.decode(chunk, final=self.eof)
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character, or '' at end of input"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValidationError('malformed JSON array: expected %s'
+                                  % ' or '.join(repr(c) for c in chars))
+        self.pos += 1
+        return char
+
+    def value(self) -> Any:
+        """Decode the next value, reading more input until it is complete"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self.fill():
+                    continue
+                raise ValidationError('malformed JSON array: truncated value')
+            # A number cut off at the end of the buffer may continue in the
+            # next block, so only trust it once the character after it is seen
+            if (isinstance(value, (int, float)) and not self.eof
+                    and (end == len(self.buf) or self.buf[end] in NUMBER_CHARS)):
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_array(stream, read_size: int = READ_SIZE) -> Iterator[Row]:
+    """Yield the elements of a JSON array without loading the whole body"""
+    reader = _ArrayReader(stream, read_size)
+    reader.expect('[')
+    if reader.peek() == ']':
+        return
+    index = 0
+    while True:
+        yield index, reader.value()
+        index += 1
+        if reader.expect(',]') == ']':
+            return
+
+
+def _flush(collection, batch: List[Dict[str, Any]], indexes: List[int],
+           on_insert: Optional[Callable[[List[Dict[str, Any]]], None]]
+           ) -> Iterator[Dict[str, Any]]:
+    """Insert one batch and yield a result for each row in it"""
+    failed: Dict[int, str] = {}
+    try:
+        collection.insert_many(batch, ordered=False)
+    except BulkWriteError as error:
+        for write_error in error.details.get('writeErrors', []):
+            failed[write_error['index']] = write_error.get('errmsg', 'write failed')
+    if on_insert:
+        on_insert([doc for position, doc in enumerate(batch)
+                   if position not in failed])
+    for position, (index, doc) in enumerate(zip(indexes, batch)):
+        if position in failed:
+            yield {'index': index, 'error': failed[position]}
+        else:
+            yield {'index': index, 'id': str(doc['_id'])}
+
+
+def ingest(collection, rows: Iterator[Row], owner: str,
+           chunk_size: int = DEFAULT_CHUNK_SIZE,
+           on_insert: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+           ) -> Iterator[Dict[str, Any]]:
+    """Validate rows as they arrive and insert them in unordered batches.
+
+    Yields one result per row: {'index', 'id'} on success or
+    {'index', 'error'} on failure. Rejected rows are reported as soon as
+    they are read, inserted rows once their batch has been written, so
+    results are not necessarily in upload order. on_insert is called with
+    the documents of each batch that were written.
+    """
+    batch: List[Dict[str, Any]] = []
+    indexes: List[int] = []
+    for index, row in rows:
+        try:
+            if isinstance(row, ValidationError):
+                raise row
+            entry = parse_entry(row)
+        except ValidationError as error:
+            yield {'index': index, 'error': str(error)}
+            continue
+        entry['user'] = owner
+        batch.append(entry)
+        indexes.append(index)
+        if len(batch) >= chunk_size:
+            yield from _flush(collection, batch, indexes, on_insert)
+            batch, indexes = [], []
+    if batch:
+        yield from _flush(collection, batch, indexes, on_insert)
+
+
+def _keep_lowest(heap: List[Tuple[int, Dict[str, Any]]], result: Dict[str, Any],
+                 limit: int) -> None:
+    """Add result to heap, keeping only the limit results with the lowest indexes"""
+    item = (-result['index'], result)
+    if len(heap) < limit:
+        heapq.heappush(heap, item)
+    elif limit and item[0] > heap[0][0]:
+        heapq.heapreplace(heap, item)
+
+
+def _by_index(heap: List[Tuple[int, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    return [result for _, result in sorted(heap, reverse=True)]
+
+
+def summarize(results: Iterator[Dict[str, Any]],
+              max_errors: int = MAX_REPORTED_ERRORS,
+              max_ids: int = MAX_REPORTED_IDS) -> Dict[str, Any]:
+    """Run ingest() to the end and count its results.
+
+    ingest() reports rows out of upload order, so the summary keeps the
+    results with the lowest row indexes: 'ids' lists {'index', 'id'} for
+    the first max_ids inserted rows and 'errors' the first max_errors
+    rejected rows, both sorted by index. If the body turns out to be
+    malformed, the batches written before that point stay written and the
+    summary says so under 'error'.
+    """
+    summary: Dict[str, Any] = {'inserted': 0, 'failed': 0}
+    ids: List[Tuple[int, Dict[str, Any]]] = []
+    errors: List[Tuple[int, Dict[str, Any]]] = []
+    try:
+        for result in results:
+            if 'error' in result:
+                summary['failed'] += 1
+                _keep_lowest(errors, result, max_errors)
+            else:
+                summary['inserted'] += 1
+                _keep_lowest(ids, result, max_ids)
+    except ValidationError as error:
+        summary['error'] = str(error)
+    summary['ids'] = _by_index(ids)
+    summary['errors'] = _by_index(errors)
+    return summary
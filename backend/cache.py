@@ -0,0 +1,145 @@
+"""
+Read-through caches for small, rarely changing documents such as budgets.
+
+Two backends share one interface (get/set/delete/stats):
+
+- TTLCache: per-process LRU with expiry. Each worker has its own copy.
+- RedisCache: shared by all workers. Requires the optional `redis` package.
+
+Nothing tells one worker's TTLCache about a write made by another, so
+callers put a version that every write moves into their keys (the budget
+uses the user's sync version): a write makes every worker's old entry
+unreachable, and the TTL only bounds how long such entries stay around.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Mapping, Optional
+
+
+class CacheStats:
+    """Hit/miss counters for one cache"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def as_dict(self, size: Optional[int] = None) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        stats = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+        if size is not None:
+            stats['size'] = size
+        return stats
+
+
+class TTLCache:
+    """In-process LRU cache whose entries expire after ttl seconds"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= self.clock():
+                if item is not None:
+                    del self._data[key]
+                self._stats.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self._stats.hits += 1
+            return item[1]
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (self.clock() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._stats.as_dict(len(self._data))
+
+
+class RedisCache:
+    """Cache shared across worker processes through Redis"""
+
+    def __init__(self, url: str, ttl: float = 30.0, prefix: str = 'budgetly:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND='redis' requires the redis package")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self._stats = CacheStats()
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            self._stats.misses += 1
+            return None
+        self._stats.hits += 1
+        return json.loads(raw)
+
+    def set(self, key: str, value: Any) -> None:
+        self.client.set(self.prefix + key, json.dumps(value),
+                        px=int(self.ttl * 1000))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+    def stats(self) -> Dict[str, Any]:
+        # Counters are per process; the entries themselves are shared
+        return self._stats.as_dict()
+
+
+class NullCache:
+    """Cache that never stores anything, for CACHE_BACKEND='none'"""
+
+    def __init__(self):
+        self._stats = CacheStats()
+
+    def get(self, key: str) -> Optional[Any]:
+        self._stats.misses += 1
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def delete(self, key: str) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return self._stats.as_dict()
+
+
+def make_cache(config: Mapping[str, Any]):
+    """Build the cache backend selected by CACHE_BACKEND"""
+    backend = config['CACHE_BACKEND']
+    if backend == 'memory':
+        return TTLCache(config['CACHE_SIZE'], config['CACHE_TTL'])
+    if backend == 'redis':
+        return RedisCache(config['CACHE_REDIS_URL'], config['CACHE_TTL'])
+    if backend == 'none':
+        return NullCache()
+    raise ValueError('unknown CACHE_BACKEND %r' % backend)
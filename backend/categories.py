@@ -0,0 +1,30 @@
+"""
+Expense and income category names, one document per (user, name)
+"""
+from typing import Any
+
+from pymongo import ASCENDING, IndexModel
+
+from backend.ledger import ValidationError
+
+MAX_NAME_LENGTH = 100
+
+# Category collection for each ledger type
+CATEGORY_COLLECTIONS = {
+    'expense': 'expense_categories',
+    'income': 'income_categories',
+}
+
+CATEGORY_INDEXES = [
+    IndexModel([('user', ASCENDING), ('name', ASCENDING)], name='user_name', unique=True),
+]
+
+
+def parse_name(data: Any) -> str:
+    """Validate a request body and return the category name"""
+    name = data.get('name') if isinstance(data, dict) else None
+    if not isinstance(name, str) or not name.strip():
+        raise ValidationError('name is required')
+    if len(name) > MAX_NAME_LENGTH:
+        raise ValidationError('name must be at most %d characters' % MAX_NAME_LENGTH)
+    return name.strip()
@@ -0,0 +1,117 @@
+"""
+Negotiated response compression: brotli (when installed) or gzip.
+
+With COMPRESSION_ENABLED (the default), create_app() compresses JSON,
+NDJSON, CSV and text responses for clients whose Accept-Encoding allows
+it, preferring brotli (the optional `brotli` package) over gzip:
+
+- a response with a body of at least COMPRESS_MIN_SIZE bytes is
+  compressed whole; smaller ones gain too little to be worth the CPU
+- a streamed response (the exports) is compressed chunk
+  by chunk as it is generated, so it is never held in memory, and
+  flushed every COMPRESS_FLUSH_BYTES of input, so a client reading a
+  slow export receives complete rows along the way
+
+A compressed response is a different representation, so a strong ETag
+gets the encoding appended ("<tag>-gzip"); base_etag() strips it again
+when checking If-None-Match, and a 304 repeats the tag the client sent.
+"""
+import functools
+import gzip
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from flask import Flask, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+COMPRESSIBLE = {'application/json', 'application/x-ndjson', 'text/csv',
+                'text/plain', 'text/html'}
+
+
+def negotiate(accept_encodings) -> Optional[str]:
+    """The encoding to use for a request's Accept-Encoding, if any"""
+    return accept_encodings.best_match(ENCODINGS)
+
+
+def base_etag(tag: str) -> str:
+    """An ETag without the encoding appended by compression"""
+    for encoding in ENCODINGS:
+        if tag.endswith('-' + encoding):
+            return tag[:-len(encoding) - 1]
+    return tag
+
+
+def compress(data: bytes, encoding: str, level: int = 6, quality: int = 5) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=quality)
+    return gzip.compress(data, level, mtime=0)
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str, level: int = 6,
+                    quality: int = 5, flush_bytes: int = 65536) -> Iterator[bytes]:
+    """Compress a stream of chunks without buffering the whole body,
+    flushing the output once flush_bytes of input have gone in"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=quality)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        process, finish = compressor.compress, compressor.flush
+        flush = functools.partial(compressor.flush, zlib.Z_SYNC_FLUSH)
+    pending = 0
+    for chunk in chunks:
+        data = process(chunk)
+        pending += len(chunk)
+        if pending >= flush_bytes:
+            data += flush()
+            pending = 0
+        if data:
+            yield data
+    yield finish()
+
+
+class Compression:
+    """Compresses an app's responses"""
+
+    def __init__(self, min_size: int = 1024, level: int = 6, quality: int = 5,
+                 flush_bytes: int = 65536):
+        self.min_size = min_size
+        self.level = level
+        self.quality = quality
+        self.flush_bytes = flush_bytes
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions['compression'] = self
+        app.after_request(self._after_request)
+
+    def _after_request(self, response):
+        if (response.mimetype not in COMPRESSIBLE or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.status_code < 200 or response.status_code in (204, 304)):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_stream(response.iter_encoded(), encoding,
+                                                self.level, self.quality, self.flush_bytes)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            response.set_data(compress(data, encoding, self.level, self.quality))
+        response.headers['Content-Encoding'] = encoding
+
+        tag, weak = response.get_etag()
+        if tag and not weak:
+            response.set_etag('%s-%s' % (tag, encoding))
+        return response
@@ -0,0 +1,81 @@
+"""
+Backend configuration, read from environment variables with local defaults
+"""
+import os
+
+
+# Signs API tokens; only for local development
+DEV_SECRET_KEY = 'dev-only-secret'
+
+
+def _int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def _bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    return default if value is None else value.lower() in ('1', 'true', 'yes')
+
+
+class Config:
+    """Default settings; create_app() accepts overrides for any of them"""
+
+    # 'mongo', 'sqlite' to keep everything in the SQLITE_PATH file
+    # (':memory:' for a throwaway database), or 'memory' for the
+    # in-process stand-in used by the tests and benchmarks
+    DATABASE_BACKEND = os.environ.get('DATABASE_BACKEND', 'mongo')
+    SQLITE_PATH = os.environ.get('SQLITE_PATH', 'budgetly.sqlite3')
+
+    MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/')
+    MONGO_DB = os.environ.get('MONGO_DB', 'budgetly_db')
+
+    # Connection pool, per process. Size the pool to the number of
+    # threads serving requests; a request waits for a free connection for
+    # at most MONGO_WAIT_QUEUE_TIMEOUT_MS.
+    MONGO_MAX_POOL_SIZE = _int('MONGO_MAX_POOL_SIZE', 100)
+    MONGO_MIN_POOL_SIZE = _int('MONGO_MIN_POOL_SIZE', 0)
+    MONGO_MAX_IDLE_TIME_MS = _int('MONGO_MAX_IDLE_TIME_MS', 300000)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = _int('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000)
+    MONGO_CONNECT_TIMEOUT_MS = _int('MONGO_CONNECT_TIMEOUT_MS', 5000)
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = _int('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)
+    MONGO_SOCKET_TIMEOUT_MS = _int('MONGO_SOCKET_TIMEOUT_MS', 30000)
+
+    # Threads per backend.asgi worker that run its blocking database calls;
+    # 0 uses MONGO_MAX_POOL_SIZE, since each thread holds one connection
+    ASYNC_DB_THREADS = _int('ASYNC_DB_THREADS', 0)
+
+    # Authentication: bearer tokens signed with SECRET_KEY resolve the
+    # user. With AUTH_REQUIRED off, requests without a token may use the
+    # X-User-Id header or the 'default' user.
+    SECRET_KEY = os.environ.get('SECRET_KEY', DEV_SECRET_KEY)
+    AUTH_REQUIRED = _bool('AUTH_REQUIRED', False)
+    AUTH_TOKEN_MAX_AGE = _int('AUTH_TOKEN_MAX_AGE', 30 * 24 * 3600)
+
+    BULK_CHUNK_SIZE = _int('BULK_CHUNK_SIZE', 1000)
+    IMPORT_BATCH_SIZE = _int('IMPORT_BATCH_SIZE', 1000)
+
+    # Encode responses with orjson when it is installed
+    JSON_FAST_ENCODER = _bool('JSON_FAST_ENCODER', True)
+
+    # Compress responses of at least COMPRESS_MIN_SIZE bytes (and every
+    # streamed response) with brotli or gzip; brotli needs `pip install brotli`
+    COMPRESSION_ENABLED = _bool('COMPRESSION_ENABLED', True)
+    COMPRESS_MIN_SIZE = _int('COMPRESS_MIN_SIZE', 1024)
+    COMPRESS_LEVEL = _int('COMPRESS_LEVEL', 6)
+    COMPRESS_BROTLI_QUALITY = _int('COMPRESS_BROTLI_QUALITY', 5)
+    # Streamed responses are flushed after this many bytes of input
+    COMPRESS_FLUSH_BYTES = _int('COMPRESS_FLUSH_BYTES', 65536)
+
+    # Request, MongoDB and cache metrics on GET /metrics
+    METRICS_ENABLED = _bool('METRICS_ENABLED', True)
+
+    # Read-through cache for GET /api/budget: 'memory' (per process),
+    # 'redis' (shared by all workers) or 'none'
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+    CACHE_TTL = float(os.environ.get('CACHE_TTL', 30))
+    CACHE_SIZE = _int('CACHE_SIZE', 10000)
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    # Each worker remembers a user's change number, which keys the budget
+    # cache, for this many seconds; writes made through another worker can
+    # be served stale for up to this long
+    CACHE_VERSION_TTL = float(os.environ.get('CACHE_VERSION_TTL', 1))
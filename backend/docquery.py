@@ -0,0 +1,439 @@
+"""
+MongoDB query semantics in Python, for storage backends other than MongoDB.
+
+Covers what the app sends to its collections: filters with comparison,
+$in/$nin, $exists, $ne, $or/$and/$nor; updates with $set, $unset, $inc,
+$min, $max and $setOnInsert; projections; sorts; and aggregation
+pipelines made of $match, $group, $sort, $skip, $limit, $project, $count
+and $facet with field paths, $dateTrunc and the usual accumulators.
+
+Values compare like in MongoDB: by type bracket first (null < numbers <
+strings < objects < arrays < ObjectId < booleans < dates), then by value.
+"""
+import heapq
+from collections import abc
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from bson import ObjectId
+
+Sort = Sequence[Tuple[str, int]]
+
+_MISSING = object()
+
+
+class QueryError(ValueError):
+    """A filter, update or pipeline this engine does not support"""
+
+
+# Brackets of the exact types documents hold, looked up before the
+# isinstance() checks below
+_BRACKETS = {type(None): 0, int: 1, float: 1, str: 2, dict: 3, list: 4, tuple: 4,
+             ObjectId: 6, bool: 7, datetime: 8}
+
+
+def _bracket(value: Any) -> int:
+    bracket = _BRACKETS.get(type(value))
+    if bracket is not None:
+        return bracket
+    if value is None or value is _MISSING:
+        return 0
+    if isinstance(value, bool):
+        return 7
+    if isinstance(value, (int, float)):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, abc.Mapping):
+        return 3
+    if isinstance(value, (list, tuple)):
+        return 4
+    if isinstance(value, ObjectId):
+        return 6
+    if isinstance(value, datetime):
+        return 8
+    return 5
+
+
+def compare(a: Any, b: Any) -> int:
+    """-1, 0 or 1, ordering values of any type like MongoDB"""
+    bracket_a, bracket_b = _bracket(a), _bracket(b)
+    if bracket_a != bracket_b:
+        return -1 if bracket_a < bracket_b else 1
+    if bracket_a == 0:
+        return 0
+    if bracket_a == 3:
+        return compare(list(a.items()), list(b.items()))
+    if bracket_a == 4:
+        for x, y in zip(a, b):
+            order = compare(x, y)
+            if order:
+                return order
+        return compare(len(a), len(b))
+    return (a > b) - (a < b)
+
+
+def sort_key(value: Any) -> Tuple[Any, ...]:
+    """A key that orders values like compare() does, for sorted() and heapq"""
+    bracket = _bracket(value)
+    if bracket == 0:
+        return (0,)
+    if bracket == 3:
+        return (3, tuple((4, (sort_key(key), sort_key(item))) for key, item in value.items()))
+    if bracket == 4:
+        return (4, tuple(sort_key(item) for item in value))
+    return (bracket, value)
+
+
+def get_path(doc: Any, path: str, default: Any = None) -> Any:
+    """The value at a dotted path, or `default` when it is missing"""
+    value = doc
+    for part in path.split('.'):
+        if isinstance(value, abc.Mapping) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return default
+    return value
+
+
+def _set_path(doc: Dict[str, Any], path: str, value: Any) -> None:
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset_path(doc: Dict[str, Any], path: str) -> None:
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+# Filters
+
+def _equals(value: Any, wanted: Any) -> bool:
+    if isinstance(value, list) and not isinstance(wanted, list):
+        return any(_equals(item, wanted) for item in value)
+    if value is _MISSING:
+        return wanted is None
+    return _bracket(value) == _bracket(wanted) and compare(value, wanted) == 0
+
+
+def _ordered(value: Any, wanted: Any, test) -> bool:
+    if isinstance(value, list):
+        return any(_ordered(item, wanted, test) for item in value)
+    if value is _MISSING or _bracket(value) != _bracket(wanted):
+        return False
+    return test(compare(value, wanted))
+
+
+_COMPARISONS = {
+    '$gt': lambda order: order > 0,
+    '$gte': lambda order: order >= 0,
+    '$lt': lambda order: order < 0,
+    '$lte': lambda order: order <= 0,
+}
+
+
+def is_operators(condition: Any) -> bool:
+    return (isinstance(condition, abc.Mapping) and bool(condition)
+            and all(key.startswith('$') for key in condition))
+
+
+def _field_matches(value: Any, condition: Any) -> bool:
+    if not is_operators(condition):
+        return _equals(value, condition)
+    for op, wanted in condition.items():
+        if op == '$eq':
+            ok = _equals(value, wanted)
+        elif op == '$ne':
+            ok = not _equals(value, wanted)
+        elif op in _COMPARISONS:
+            ok = _ordered(value, wanted, _COMPARISONS[op])
+        elif op == '$in':
+            ok = any(_equals(value, item) for item in wanted)
+        elif op == '$nin':
+            ok = not any(_equals(value, item) for item in wanted)
+        elif op == '$exists':
+            ok = (value is not _MISSING) == bool(wanted)
+        elif op == '$not':
+            ok = not _field_matches(value, wanted)
+        else:
+            raise QueryError('unsupported query operator %s' % op)
+        if not ok:
+            return False
+    return True
+
+
+def matches(doc: Mapping[str, Any], query: Optional[Mapping[str, Any]]) -> bool:
+    """Whether a document matches a MongoDB filter"""
+    for key, condition in (query or {}).items():
+        if key == '$or':
+            ok = any(matches(doc, branch) for branch in condition)
+        elif key == '$and':
+            ok = all(matches(doc, branch) for branch in condition)
+        elif key == '$nor':
+            ok = not any(matches(doc, branch) for branch in condition)
+        elif key.startswith('$'):
+            raise QueryError('unsupported query operator %s' % key)
+        else:
+            ok = _field_matches(get_path(doc, key, _MISSING), condition)
+        if not ok:
+            return False
+    return True
+
+
+def equality_fields(query: Optional[Mapping[str, Any]]) -> Dict[str, Any]:
+    """Fields a filter pins to one value; an upsert inserts them"""
+    fields: Dict[str, Any] = {}
+    for key, condition in (query or {}).items():
+        if key == '$and':
+            for branch in condition:
+                fields.update(equality_fields(branch))
+        elif key.startswith('$'):
+            continue
+        elif not is_operators(condition):
+            fields[key] = condition
+        elif '$eq' in condition:
+            fields[key] = condition['$eq']
+    return fields
+
+
+# Updates
+
+def is_replacement(update: Mapping[str, Any]) -> bool:
+    return not any(key.startswith('$') for key in update)
+
+
+def apply_update(doc: Dict[str, Any], update: Mapping[str, Any],
+                 inserting: bool = False) -> Dict[str, Any]:
+    """Return `doc` with an update document applied (doc is not modified)"""
+    if is_replacement(update):
+        result = {'_id': doc['_id']} if '_id' in doc else {}
+        result.update(update)
+        return result
+    result = deep_copy(doc)
+    for op, fields in update.items():
+        for path, value in fields.items():
+            current = get_path(result, path, _MISSING)
+            if op == '$set':
+                _set_path(result, path, value)
+            elif op == '$setOnInsert':
+                if inserting:
+                    _set_path(result, path, value)
+            elif op == '$unset':
+                _unset_path(result, path)
+            elif op == '$inc':
+                _set_path(result, path, value if current is _MISSING else current + value)
+            elif op == '$min':
+                if current is _MISSING or compare(value, current) < 0:
+                    _set_path(result, path, value)
+            elif op == '$max':
+                if current is _MISSING or compare(value, current) > 0:
+                    _set_path(result, path, value)
+            else:
+                raise QueryError('unsupported update operator %s' % op)
+    return result
+
+
+def upsert_document(query: Mapping[str, Any], update: Mapping[str, Any]) -> Dict[str, Any]:
+    """The document an upsert inserts when nothing matches `query`"""
+    seed: Dict[str, Any] = {}
+    for path, value in equality_fields(query).items():
+        _set_path(seed, path, deep_copy(value))
+    if is_replacement(update):
+        doc = dict(update)
+        if '_id' not in doc and '_id' in seed:
+            doc['_id'] = seed['_id']
+        return doc
+    return apply_update(seed, update, inserting=True)
+
+
+def deep_copy(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: deep_copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [deep_copy(item) for item in value]
+    return value
+
+
+# Projections and sorting
+
+def project(doc: Dict[str, Any], projection: Optional[Mapping[str, Any]]) -> Dict[str, Any]:
+    if not projection:
+        return doc
+    include_id = projection.get('_id', 1)
+    fields = {key: bool(value) for key, value in projection.items() if key != '_id'}
+    if fields and all(fields.values()):
+        result = {'_id': doc['_id']} if include_id and '_id' in doc else {}
+        for path in fields:
+            value = get_path(doc, path, _MISSING)
+            if value is not _MISSING:
+                _set_path(result, path, value)
+        return result
+    result = deep_copy(doc)
+    for path in fields:
+        _unset_path(result, path)
+    if not include_id:
+        result.pop('_id', None)
+    return result
+
+
+def normalize_sort(key_or_list: Any, direction: Optional[int] = None) -> List[Tuple[str, int]]:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, abc.Mapping):
+        return list(key_or_list.items())
+    return [(key, value) for key, value in key_or_list]
+
+
+def sort_docs(docs: Iterable[Any], sort: Sort, limit: int = 0) -> List[Any]:
+    """Documents in `sort` order (stable), only the first `limit` if set"""
+    paths = [path for path, _ in sort]
+    descending = {direction < 0 for _, direction in sort}
+    if len(descending) == 1:
+        reverse = descending.pop()
+
+        def key(doc):
+            return tuple(sort_key(get_path(doc, path)) for path in paths)
+        if limit:
+            return (heapq.nlargest if reverse else heapq.nsmallest)(limit, docs, key=key)
+        return sorted(docs, key=key, reverse=reverse)
+    # Mixed directions: one stable pass per field, the last field first
+    docs = list(docs)
+    for path, direction in reversed(sort):
+        docs.sort(key=lambda doc: sort_key(get_path(doc, path)), reverse=direction < 0)
+    return docs[:limit] if limit else docs
+
+
+# Aggregation
+
+def _date_trunc(value: Any, unit: str) -> Optional[datetime]:
+    if not isinstance(value, datetime):
+        return None
+    if unit == 'year':
+        return datetime(value.year, 1, 1)
+    if unit == 'month':
+        return datetime(value.year, value.month, 1)
+    if unit == 'day':
+        return datetime(value.year, value.month, value.day)
+    raise QueryError('unsupported $dateTrunc unit %s' % unit)
+
+
+def evaluate(doc: Any, expr: Any) -> Any:
+    """Value of an aggregation expression for one document"""
+    if isinstance(expr, str) and expr.startswith('$'):
+        return get_path(doc, expr[1:])
+    if isinstance(expr, abc.Mapping):
+        if len(expr) == 1:
+            op, args = next(iter(expr.items()))
+            if op == '$dateTrunc':
+                return _date_trunc(evaluate(doc, args['date']), args['unit'])
+            if op == '$literal':
+                return args
+            if op in ('$add', '$multiply'):
+                values = [evaluate(doc, arg) for arg in args]
+                if any(value is None for value in values):
+                    return None
+                result = values[0]
+                for value in values[1:]:
+                    result = result + value if op == '$add' else result * value
+                return result
+            if op.startswith('$'):
+                raise QueryError('unsupported expression operator %s' % op)
+        return {key: evaluate(doc, value) for key, value in expr.items()}
+    return expr
+
+
+def _accumulate(docs: List[Any], spec: Mapping[str, Any]) -> Any:
+    op, expr = next(iter(spec.items()))
+    values = [evaluate(doc, expr) for doc in docs]
+    numbers = [v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool)]
+    if op == '$sum':
+        return sum(numbers)
+    if op == '$avg':
+        return sum(numbers) / len(numbers) if numbers else None
+    if op in ('$min', '$max'):
+        present = [v for v in values if v is not None]
+        if not present:
+            return None
+        return (min if op == '$min' else max)(present, key=sort_key)
+    if op == '$first':
+        return values[0] if values else None
+    if op == '$last':
+        return values[-1] if values else None
+    if op == '$push':
+        return values
+    if op == '$addToSet':
+        unique: List[Any] = []
+        for value in values:
+            if not any(_equals(value, seen) for seen in unique):
+                unique.append(value)
+        return unique
+    raise QueryError('unsupported accumulator %s' % op)
+
+
+def _group_key(value: Any) -> Any:
+    if isinstance(value, dict):
+        return tuple((key, _group_key(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(_group_key(item) for item in value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def group(docs: Iterable[Any], spec: Mapping[str, Any]) -> List[Dict[str, Any]]:
+    groups: Dict[Any, Tuple[Any, List[Any]]] = {}
+    for doc in docs:
+        group_id = evaluate(doc, spec['_id'])
+        key = _group_key(group_id)
+        if key not in groups:
+            groups[key] = (group_id, [])
+        groups[key][1].append(doc)
+    return [dict({'_id': group_id},
+                 **{field: _accumulate(members, acc)
+                    for field, acc in spec.items() if field != '_id'})
+            for group_id, members in groups.values()]
+
+
+def aggregate(docs: Iterable[Any], pipeline: Sequence[Mapping[str, Any]]) -> List[Any]:
+    """Run an aggregation pipeline over documents"""
+    docs = list(docs)
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == '$match':
+            docs = [doc for doc in docs if matches(doc, spec)]
+        elif name == '$group':
+            docs = group(docs, spec)
+        elif name == '$sort':
+            docs = sort_docs(docs, normalize_sort(spec))
+        elif name == '$skip':
+            docs = docs[spec:]
+        elif name == '$limit':
+            docs = docs[:spec]
+        elif name == '$project':
+            docs = [_project_stage(doc, spec) for doc in docs]
+        elif name == '$count':
+            docs = [{spec: len(docs)}] if docs else []
+        elif name == '$facet':
+            docs = [{field: aggregate(docs, sub) for field, sub in spec.items()}]
+        else:
+            raise QueryError('unsupported pipeline stage %s' % name)
+    return docs
+
+
+def _project_stage(doc: Dict[str, Any], spec: Mapping[str, Any]) -> Dict[str, Any]:
+    if all(value in (0, 1, True, False) for value in spec.values()):
+        return project(doc, spec)
+    result = {'_id': doc.get('_id')} if spec.get('_id', 1) else {}
+    for field, expr in spec.items():
+        if field == '_id' and expr in (0, 1, True, False):
+            continue
+        result[field] = get_path(doc, field) if expr in (1, True) else evaluate(doc, expr)
+    return result
@@ -0,0 +1,298 @@
+"""
+The pymongo collection API over a document store, shared by the storage
+backends other than MongoDB (backend.sqlite and backend.memory).
+
+DocumentCollection implements find, the write methods, bulk_write and
+aggregate with backend.docquery on top of a few primitives a backend
+provides: `_transaction()` for a write context, `_select` for matching
+(key, document) pairs in sort order, and `_insert`, `_rewrite` and
+`_remove` for single documents inside a write.
+"""
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from pymongo import IndexModel, ReturnDocument
+from pymongo.errors import BulkWriteError, WriteError
+from pymongo.results import (BulkWriteResult, DeleteResult, InsertManyResult,
+                             InsertOneResult, UpdateResult)
+
+from backend import docquery
+
+
+class BulkRecorder:
+    """Collects bulk_write operations through pymongo's _add_to_bulk protocol"""
+
+    def __init__(self):
+        self.ops: List[Tuple[str, Any]] = []
+
+    def add_insert(self, document, *args, **kwargs):
+        self.ops.append(('insert', document))
+
+    def add_update(self, selector, update, multi=False, upsert=False, *args, **kwargs):
+        self.ops.append(('update', (selector, update, multi, upsert)))
+
+    def add_replace(self, selector, replacement, upsert=False, *args, **kwargs):
+        self.ops.append(('update', (selector, replacement, False, upsert)))
+
+    def add_delete(self, selector, limit, *args, **kwargs):
+        self.ops.append(('delete', (selector, limit == 0)))
+
+
+class Cursor:
+    """The part of pymongo's Cursor the app uses"""
+
+    def __init__(self, collection: 'DocumentCollection', query: Optional[Mapping[str, Any]],
+                 projection: Optional[Mapping[str, Any]] = None, sort: Any = None,
+                 limit: int = 0, skip: int = 0):
+        self.collection = collection
+        self.query = query or {}
+        self.projection = projection
+        self._sort = docquery.normalize_sort(sort) if sort else []
+        self._limit = limit
+        self._skip = skip
+        self._iter: Optional[Iterator[Dict[str, Any]]] = None
+
+    def sort(self, key_or_list: Any, direction: Optional[int] = None) -> 'Cursor':
+        self._sort = docquery.normalize_sort(key_or_list, direction)
+        return self
+
+    def limit(self, limit: int) -> 'Cursor':
+        self._limit = limit
+        return self
+
+    def skip(self, skip: int) -> 'Cursor':
+        self._skip = skip
+        return self
+
+    def batch_size(self, batch_size: int) -> 'Cursor':
+        return self
+
+    def _documents(self) -> Iterator[Dict[str, Any]]:
+        limit = self._skip + self._limit if self._limit else 0
+        rows = self.collection._select(self.query, self._sort, limit=limit)
+        for position, (_, doc) in enumerate(rows):
+            if position < self._skip:
+                continue
+            if self._limit and position >= self._skip + self._limit:
+                break
+            yield docquery.project(doc, self.projection)
+
+    def __iter__(self) -> 'Cursor':
+        return self
+
+    def __next__(self) -> Dict[str, Any]:
+        if self._iter is None:
+            self._iter = self._documents()
+        return next(self._iter)
+
+    def close(self) -> None:
+        self._iter = iter(())
+
+
+class DocumentCollection:
+    """pymongo collection methods on top of the primitives of one backend.
+
+    `_select` must return documents the caller may keep (a copy or a
+    freshly decoded one), and may stop after `limit` of them when it is
+    set; `_insert` must set a missing _id."""
+
+    name: str
+    full_name: str
+
+    # Primitives
+
+    def _transaction(self):
+        raise NotImplementedError
+
+    def _select(self, query: Mapping[str, Any], sort: docquery.Sort = (),
+                txn: Any = None, limit: int = 0) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+        raise NotImplementedError
+
+    def _insert(self, txn: Any, doc: Dict[str, Any]) -> Any:
+        raise NotImplementedError
+
+    def _rewrite(self, txn: Any, key: Any, doc: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def _remove(self, txn: Any, key: Any) -> None:
+        raise NotImplementedError
+
+    def _aggregate_fast(self, query: Mapping[str, Any],
+                        pipeline: List[Mapping[str, Any]]) -> Optional[List[Any]]:
+        """Results of `pipeline` after a $match on `query`, or None to run it in Python"""
+        return None
+
+    def create_indexes(self, models: Sequence[IndexModel]) -> List[str]:
+        raise NotImplementedError
+
+    # Options and indexes
+
+    def with_options(self, **kwargs) -> 'DocumentCollection':
+        # Every write is acknowledged once it returns
+        return self
+
+    def create_index(self, keys: Any, **kwargs) -> str:
+        return self.create_indexes([IndexModel(keys, **kwargs)])[0]
+
+    # Reads
+
+    def find(self, filter: Optional[Mapping[str, Any]] = None, projection: Any = None,
+             sort: Any = None, limit: int = 0, skip: int = 0, **kwargs) -> Cursor:
+        if isinstance(projection, (list, tuple)):
+            projection = {field: 1 for field in projection}
+        return Cursor(self, filter, projection, sort, limit, skip)
+
+    def find_one(self, filter: Any = None, *args, **kwargs) -> Optional[Dict[str, Any]]:
+        if filter is not None and not isinstance(filter, Mapping):
+            filter = {'_id': filter}
+        return next(self.find(filter, *args, **dict(kwargs, limit=1)), None)
+
+    def count_documents(self, filter: Mapping[str, Any], **kwargs) -> int:
+        return sum(1 for _ in self._select(filter))
+
+    # Writes
+
+    def _update(self, txn: Any, query: Mapping[str, Any], update: Mapping[str, Any],
+                multi: bool = False, upsert: bool = False, sort: Any = None
+                ) -> Dict[str, Any]:
+        """Update matches; returns n, nModified, upserted, before and after"""
+        result: Dict[str, Any] = {'n': 0, 'nModified': 0, 'upserted': None,
+                                  'before': None, 'after': None}
+        for key, doc in list(self._select(query, sort or (), txn)):
+            new = docquery.apply_update(doc, update)
+            if '_id' in new and new['_id'] != doc['_id']:
+                raise WriteError("the field '_id' is immutable", 66)
+            new['_id'] = doc['_id']
+            result['n'] += 1
+            if new != doc:
+                self._rewrite(txn, key, new)
+                result['nModified'] += 1
+            result['before'], result['after'] = doc, new
+            if not multi:
+                break
+        if not result['n'] and upsert:
+            doc = docquery.upsert_document(query, update)
+            result['upserted'] = self._insert(txn, doc)
+            result['n'], result['after'] = 1, doc
+        return result
+
+    def _delete(self, txn: Any, query: Mapping[str, Any], multi: bool = False,
+                sort: Any = None) -> Tuple[int, Optional[Dict[str, Any]]]:
+        deleted, last = 0, None
+        for key, doc in list(self._select(query, sort or (), txn)):
+            self._remove(txn, key)
+            deleted, last = deleted + 1, doc
+            if not multi:
+                break
+        return deleted, last
+
+    def insert_one(self, document: Dict[str, Any], **kwargs) -> InsertOneResult:
+        with self._transaction() as txn:
+            return InsertOneResult(self._insert(txn, document), True)
+
+    def insert_many(self, documents: Sequence[Dict[str, Any]], ordered: bool = True,
+                    **kwargs) -> InsertManyResult:
+        documents = list(documents)
+        self._bulk([('insert', doc) for doc in documents], ordered)
+        return InsertManyResult([doc['_id'] for doc in documents], True)
+
+    def _update_result(self, result: Dict[str, Any]) -> UpdateResult:
+        raw = {'n': result['n'], 'nModified': result['nModified'],
+               'updatedExisting': result['upserted'] is None and result['n'] > 0}
+        if result['upserted'] is not None:
+            raw['upserted'] = result['upserted']
+        return UpdateResult(raw, True)
+
+    def update_one(self, filter: Mapping[str, Any], update: Mapping[str, Any],
+                   upsert: bool = False, **kwargs) -> UpdateResult:
+        with self._transaction() as txn:
+            return self._update_result(self._update(txn, filter, update, False, upsert))
+
+    def update_many(self, filter: Mapping[str, Any], update: Mapping[str, Any],
+                    upsert: bool = False, **kwargs) -> UpdateResult:
+        with self._transaction() as txn:
+            return self._update_result(self._update(txn, filter, update, True, upsert))
+
+    def replace_one(self, filter: Mapping[str, Any], replacement: Mapping[str, Any],
+                    upsert: bool = False, **kwargs) -> UpdateResult:
+        return self.update_one(filter, replacement, upsert)
+
+    def delete_one(self, filter: Mapping[str, Any], **kwargs) -> DeleteResult:
+        with self._transaction() as txn:
+            return DeleteResult({'n': self._delete(txn, filter)[0]}, True)
+
+    def delete_many(self, filter: Mapping[str, Any], **kwargs) -> DeleteResult:
+        with self._transaction() as txn:
+            return DeleteResult({'n': self._delete(txn, filter, multi=True)[0]}, True)
+
+    def find_one_and_update(self, filter: Mapping[str, Any], update: Mapping[str, Any],
+                            projection: Any = None, sort: Any = None, upsert: bool = False,
+                            return_document: bool = ReturnDocument.BEFORE,
+                            **kwargs) -> Optional[Dict[str, Any]]:
+        sort = docquery.normalize_sort(sort) if sort else None
+        with self._transaction() as txn:
+            result = self._update(txn, filter, update, upsert=upsert, sort=sort)
+        doc = result['after'] if return_document == ReturnDocument.AFTER else result['before']
+        return None if doc is None else docquery.project(doc, projection)
+
+    def find_one_and_replace(self, filter: Mapping[str, Any], replacement: Mapping[str, Any],
+                             **kwargs) -> Optional[Dict[str, Any]]:
+        return self.find_one_and_update(filter, replacement, **kwargs)
+
+    def find_one_and_delete(self, filter: Mapping[str, Any], projection: Any = None,
+                            sort: Any = None, **kwargs) -> Optional[Dict[str, Any]]:
+        sort = docquery.normalize_sort(sort) if sort else None
+        with self._transaction() as txn:
+            doc = self._delete(txn, filter, sort=sort)[1]
+        return None if doc is None else docquery.project(doc, projection)
+
+    def bulk_write(self, requests: Sequence[Any], ordered: bool = True,
+                   **kwargs) -> BulkWriteResult:
+        recorder = BulkRecorder()
+        for request in requests:
+            request._add_to_bulk(recorder)
+        return BulkWriteResult(self._bulk(recorder.ops, ordered), True)
+
+    def _bulk(self, ops: Sequence[Tuple[str, Any]], ordered: bool) -> Dict[str, Any]:
+        details: Dict[str, Any] = {
+            'writeErrors': [], 'writeConcernErrors': [], 'nInserted': 0, 'nUpserted': 0,
+            'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'upserted': []}
+        with self._transaction() as txn:
+            for index, (kind, args) in enumerate(ops):
+                try:
+                    if kind == 'insert':
+                        self._insert(txn, args)
+                        details['nInserted'] += 1
+                    elif kind == 'update':
+                        selector, update, multi, upsert = args
+                        result = self._update(txn, selector, update, multi, upsert)
+                        if result['upserted'] is not None:
+                            details['nUpserted'] += 1
+                            details['upserted'].append({'index': index,
+                                                        '_id': result['upserted']})
+                        else:
+                            details['nMatched'] += result['n']
+                            details['nModified'] += result['nModified']
+                    else:
+                        selector, multi = args
+                        details['nRemoved'] += self._delete(txn, selector, multi)[0]
+                except WriteError as error:
+                    details['writeErrors'].append({'index': index, 'code': error.code,
+                                                   'errmsg': str(error), 'op': args})
+                    if ordered:
+                        break
+        if details['writeErrors']:
+            raise BulkWriteError(details)
+        return details
+
+    # Aggregation
+
+    def aggregate(self, pipeline: Sequence[Mapping[str, Any]], **kwargs) -> Iterator[Any]:
+        pipeline = list(pipeline)
+        query: Mapping[str, Any] = {}
+        if pipeline and '$match' in pipeline[0]:
+            query, pipeline = pipeline[0]['$match'], pipeline[1:]
+        results = self._aggregate_fast(query, pipeline)
+        if results is None:
+            docs = (doc for _, doc in self._select(query))
+            results = docquery.aggregate(docs, pipeline)
+        return iter(results)
@@ -0,0 +1,110 @@
+"""
+Streaming export of all of a user's data as CSV sections or NDJSON
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from backend import jsonprovider
+from backend.ledger import DATE_FORMAT
+
+# Flush the output buffer once it holds this many characters
+FLUSH_SIZE = 64 * 1024
+BATCH_SIZE = 1000
+
+# (title, collection, key, [(column, field)]); the key names the section
+# in NDJSON output and in the import endpoint
+SECTIONS: List[Tuple[str, str, str, List[Tuple[str, str]]]] = [
+    ('Expense Categories', 'expense_categories', 'expense_categories',
+     [('name', 'name')]),
+    ('Income Categories', 'income_categories', 'income_categories',
+     [('name', 'name')]),
+    ('Expenses', 'expenses', 'expenses',
+     [('id', '_id'), ('category', 'category'), ('value', 'value'), ('date', 'date')]),
+    ('Incomes', 'incomes', 'incomes',
+     [('id', '_id'), ('category', 'category'), ('value', 'value'), ('date', 'date')]),
+    ('Budget Goals', 'budget_goals', 'budget_goals',
+     [('id', '_id'), ('type', 'type'), ('period', 'period'), ('amount', 'amount')]),
+    ('Recurring Payments', 'recurring_payments', 'recurring_payments',
+     [('id', '_id'), ('type', 'type'), ('category', 'category'), ('value', 'value'),
+      ('start_date', 'startDate'), ('frequency', 'frequency'),
+      ('note', 'description'), ('reminders', 'reminders')]),
+]
+
+FORMATS = {
+    'csv': ('text/csv', 'budgetly_export.csv'),
+    'ndjson': ('application/x-ndjson', 'budgetly_export.ndjson'),
+}
+
+
+def _value(value: Any) -> Any:
+    """Convert a stored value to a JSON-compatible export value"""
+    if isinstance(value, datetime):
+        return value.strftime(DATE_FORMAT)
+    if value is None or isinstance(value, (str, int, float, bool, list, dict)):
+        return value
+    return str(value)
+
+
+def _cell(value: Any) -> Any:
+    """Convert a stored value to a CSV cell; lists and objects become JSON"""
+    value = _value(value)
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, separators=(',', ':'))
+    return value
+
+
+def _documents(db, name: str, fields: List[Tuple[str, str]], owner: str) -> Iterable[Dict]:
+    projection = {field: 1 for _, field in fields}
+    return db[name].find({'user': owner}, projection, batch_size=BATCH_SIZE)
+
+
+def _drain(buf: io.StringIO) -> str:
+    data = buf.getvalue()
+    buf.seek(0)
+    buf.truncate()
+    return data
+
+
+def iter_csv(db, owner: str) -> Iterator[str]:
+    """Yield the CSV export in chunks of roughly FLUSH_SIZE characters.
+
+    Each section is a title line, a header line and one quoted row per
+    document, followed by a blank line.
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    for title, name, _, fields in SECTIONS:
+        writer.writerow([title])
+        writer.writerow([column for column, _ in fields])
+        if name == SECTIONS[0][1]:
+            # Send the first header straight away rather than after a full chunk
+            yield _drain(buf)
+        for doc in _documents(db, name, fields, owner):
+            writer.writerow([_cell(doc.get(field)) for _, field in fields])
+            if buf.tell() >= FLUSH_SIZE:
+                yield _drain(buf)
+        writer.writerow([])
+    yield _drain(buf)
+
+
+def iter_ndjson(db, owner: str) -> Iterator[str]:
+    """Yield the NDJSON export: one {"section": ..., ...} object per line"""
+    chunk: List[str] = []
+    size = 0
+    for _, name, key, fields in SECTIONS:
+        for doc in _documents(db, name, fields, owner):
+            row = {'section': key}
+            for column, field in fields:
+                row[column] = _value(doc.get(field))
+            line = jsonprovider.dumps(row) + '\n'
+            chunk.append(line)
+            size += len(line)
+            if size >= FLUSH_SIZE:
+                yield ''.join(chunk)
+                chunk, size = [], 0
+    if chunk:
+        yield ''.join(chunk)
+
@@ -0,0 +1,184 @@
+"""
+Cash-flow forecast: projects the stored budget balance forward month by
+month from recurring payments plus historical monthly averages.
+
+Recurring payments are turned into an occurrence-count matrix (payments x
+months) with NumPy broadcasting, so the cost does not depend on how many
+individual occurrences fall inside the horizon. Categories that have a
+recurring payment of the same type are left out of the historical
+averages, since their past entries are mostly those payments.
+"""
+from datetime import date, datetime
+from typing import Any, Dict, List, Mapping, Tuple
+
+import numpy as np
+
+from backend import recurring
+from backend.ledger import ValidationError
+
+DEFAULT_MONTHS = 12
+MAX_MONTHS = 120
+DEFAULT_HISTORY = 12
+MAX_HISTORY = 60
+
+# Days between occurrences of the fixed-length frequencies
+STEP_DAYS = {'daily': 1, 'weekly': 7}
+
+
+def _int_arg(args: Mapping[str, str], name: str, default: int, maximum: int) -> int:
+    try:
+        value = int(args.get(name, default))
+    except ValueError:
+        raise ValidationError('%s must be an integer' % name)
+    if not 1 <= value <= maximum:
+        raise ValidationError('%s must be between 1 and %d' % (name, maximum))
+    return value
+
+
+def parse_args(args: Mapping[str, str]) -> Tuple[int, int]:
+    """Parse ?months= (the horizon) and ?history= (months to average)"""
+    return (_int_arg(args, 'months', DEFAULT_MONTHS, MAX_MONTHS),
+            _int_arg(args, 'history', DEFAULT_HISTORY, MAX_HISTORY))
+
+
+def month_grid(today: date, months: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Month starts and the first and last day counted in each month.
+
+    The current month only counts from today onwards. Days are numpy
+    datetime64[D] values, months datetime64[M].
+    """
+    starts = np.datetime64(today, 'M') + np.arange(months)
+    first = np.maximum(starts.astype('datetime64[D]'), np.datetime64(today, 'D'))
+    last = (starts + 1).astype('datetime64[D]') - 1
+    return starts, first, last
+
+
+def payment_arrays(payments: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """The payments' start days and frequencies as arrays"""
+    begin = np.array([p['startDate'] for p in payments], dtype='datetime64[D]')
+    frequency = np.array([p['frequency'] for p in payments], dtype=object)
+    return begin, frequency
+
+
+def occurrence_matrix(begin: np.ndarray, frequency: np.ndarray, today: date,
+                      months: int) -> np.ndarray:
+    """Occurrences of each payment (start day, frequency) in each month
+    from today, as a (payments x months) integer matrix"""
+    starts, first, last = month_grid(today, months)
+    counts = np.zeros((len(begin), months), dtype=np.int64)
+
+    # Daily and weekly: count the arithmetic progression inside each month
+    for name, step in STEP_DAYS.items():
+        rows = np.flatnonzero(frequency == name)
+        if not len(rows):
+            continue
+        s = begin[rows, None].astype(np.int64)
+        lo = np.maximum(first[None, :].astype(np.int64), s)
+        hi = last[None, :].astype(np.int64)
+        head = s + -(-(lo - s) // step) * step
+        counts[rows] = np.where(hi >= head, (hi - head) // step + 1, 0)
+
+    # Monthly and yearly: at most one occurrence a month, on the start day
+    # clamped to the month's length
+    rows = np.flatnonzero((frequency == 'monthly') | (frequency == 'yearly'))
+    if len(rows):
+        begin_month = begin[rows].astype('datetime64[M]')
+        offset = (starts[None, :] - begin_month[:, None]).astype(np.int64)
+        due = offset >= 0
+        yearly = (frequency[rows] == 'yearly')[:, None]
+        due &= ~yearly | (offset % 12 == 0)
+        # In the current month the occurrence may already have passed
+        day = (begin[rows] - begin_month.astype('datetime64[D]')).astype(np.int64)
+        month_length = int(((starts[0] + 1).astype('datetime64[D]')
+                             - starts[0].astype('datetime64[D]')).astype(np.int64))
+        elapsed = int((first[0] - starts[0].astype('datetime64[D]')).astype(np.int64))
+        due[:, 0] &= np.minimum(day, month_length - 1) >= elapsed
+        counts[rows] = due
+    return counts
+
+
+def _month_datetime(month: np.datetime64) -> datetime:
+    day = month.astype('datetime64[D]').astype(date)
+    return datetime(day.year, day.month, 1)
+
+
+def _by_category(categories: List[str], amounts: np.ndarray) -> Dict[str, float]:
+    if not categories:
+        return {}
+    names, codes = np.unique(np.array(categories, dtype=object), return_inverse=True)
+    return dict(zip(names.tolist(), np.bincount(codes, weights=amounts).tolist()))
+
+
+def monthly_averages(rollup_collection, user: str, today: date,
+                     history: int) -> Dict[str, Dict[str, float]]:
+    """Average monthly total per (type, category) over the last `history`
+    full months, or since the user's first rollup if that is later"""
+    current = np.datetime64(today, 'M')
+    docs = list(rollup_collection.find(
+        {'user': user, 'month': {'$gte': _month_datetime(current - history),
+                                 '$lt': _month_datetime(current)},
+         'count': {'$gt': 0}},
+        {'type': 1, 'category': 1, 'month': 1, 'total': 1},
+    ))
+    averages: Dict[str, Dict[str, float]] = {'expense': {}, 'income': {}}
+    if not docs:
+        return averages
+    earliest = min(np.datetime64(doc['month'], 'M') for doc in docs)
+    span = int((current - earliest).astype(np.int64))
+    for type_ in averages:
+        rows = [doc for doc in docs if doc['type'] == type_]
+        totals = _by_category([doc['category'] for doc in rows],
+                              np.array([doc['total'] for doc in rows], dtype=float))
+        averages[type_] = {category: total / span for category, total in totals.items()}
+    return averages
+
+
+def _round(values: np.ndarray) -> List[float]:
+    return np.round(values, 2).tolist()
+
+
+def build_forecast(budget: Dict[str, Any], payments: List[Dict[str, Any]],
+                   averages: Dict[str, Dict[str, float]], today: date,
+                   months: int) -> Dict[str, Any]:
+    """Project the balance over `months` months starting with today's month"""
+    begin, frequency = payment_arrays(payments)
+    counts = occurrence_matrix(begin, frequency, today, months)
+    values = np.array([float(p.get('value') or 0) for p in payments], dtype=float)
+    starts, first, last = month_grid(today, months)
+    # Share of each month that is still ahead (only the current month is partial)
+    weights = ((last - first).astype(np.int64) + 1) / \
+        ((last - starts.astype('datetime64[D]')).astype(np.int64) + 1)
+
+    totals = {}
+    categories = {}
+    for type_ in recurring.TYPES:
+        rows = [i for i, p in enumerate(payments) if p['type'] == type_]
+        recurring_monthly = values[rows] @ counts[rows] if rows else np.zeros(months)
+        recurring_categories = {payments[i]['category'] for i in rows}
+        average = {c: v for c, v in averages.get(type_, {}).items()
+                   if c not in recurring_categories}
+        totals[type_] = recurring_monthly + sum(average.values()) * weights
+
+        horizon = _by_category([payments[i]['category'] for i in rows],
+                               values[rows] * counts[rows].sum(axis=1))
+        for category, monthly in average.items():
+            horizon[category] = monthly * float(weights.sum())
+        categories[type_] = [{'category': c, 'total': round(t, 2)} for c, t in
+                             sorted(horizon.items(), key=lambda item: (-item[1], item[0]))]
+
+    try:
+        start_balance = float(budget.get('budget') or 0)
+    except (TypeError, ValueError):
+        start_balance = 0.0
+    net = totals['income'] - totals['expense']
+    return {
+        'start_balance': start_balance,
+        'currency': budget.get('currency'),
+        'months': [str(m) for m in starts],
+        'income': _round(totals['income']),
+        'expenses': _round(totals['expense']),
+        'net': _round(net),
+        'balance': _round(start_balance + np.cumsum(net)),
+        'categories': {'expenses': categories['expense'],
+                       'incomes': categories['income']},
+    }
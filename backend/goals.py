@@ -0,0 +1,66 @@
+"""
+Budget goals: validation and status against the current period's totals
+"""
+from datetime import datetime
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, IndexModel
+
+from backend.ledger import DATE_FORMAT, ValidationError
+from backend.periods import PERIODS, period_end, period_start
+
+TYPES = ('expense', 'income')
+
+GOAL_INDEXES = [
+    IndexModel([('user', ASCENDING), ('_id', ASCENDING)], name='user_id'),
+]
+
+# Fields read by serialize_goal
+PROJECTION = {'type': 1, 'period': 1, 'amount': 1}
+
+
+def parse_goal(data: Any) -> Dict[str, Any]:
+    """Validate a request body and return the fields to store"""
+    if not isinstance(data, dict):
+        raise ValidationError('goal must be a JSON object')
+    if data.get('type') not in TYPES:
+        raise ValidationError('type must be expense or income')
+    if data.get('period') not in PERIODS:
+        raise ValidationError('period must be one of %s' % ', '.join(PERIODS))
+    amount = data.get('amount')
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or amount < 0:
+        raise ValidationError('amount must be a non-negative number')
+    return {'type': data['type'], 'period': data['period'], 'amount': float(amount)}
+
+
+def serialize_goal(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {'id': str(doc['_id']), 'type': doc.get('type'),
+            'period': doc.get('period'), 'amount': doc.get('amount')}
+
+
+def goal_status(goal: Dict[str, Any], total: float, today: datetime) -> Dict[str, Any]:
+    """How much of a goal the current period has used, and where the period
+    ends up if it keeps the same daily pace"""
+    period = goal['period']
+    start = period_start(today, period)
+    end = period_end(start, period)
+    elapsed = (today - start).days + 1
+    length = (end - start).days + 1
+    amount = goal.get('amount') or 0
+    projected = total * length / elapsed
+    return dict(serialize_goal(goal), **{
+        'start': start.strftime(DATE_FORMAT),
+        'end': end.strftime(DATE_FORMAT),
+        'total': round(total, 2),
+        'percent_used': round(total / amount * 100, 1) if amount else None,
+        'projected': round(projected, 2),
+        'projected_overrun': round(max(projected - amount, 0), 2),
+    })
+
+
+def status(goals: List[Dict[str, Any]], totals: Dict[tuple, float],
+           today: datetime) -> List[Dict[str, Any]]:
+    """Status of every goal, from current_totals() keyed by (type, period)"""
+    today = datetime(today.year, today.month, today.day)
+    return [goal_status(goal, totals.get((goal['type'], goal['period']), 0.0), today)
+            for goal in goals]
@@ -0,0 +1,66 @@
+"""
+Gunicorn settings for serving the API in production:
+
+    SECRET_KEY=... gunicorn -c python:backend.gunicorn_conf backend.wsgi:app
+
+The app requires bearer tokens (see backend.wsgi), so SECRET_KEY must be
+set. Pre-fork workers each run a pool of threads (the gthread worker), since
+requests mostly wait on MongoDB. Every worker builds its own MongoClient
+on its first request, after the fork, with a pool of one connection
+per thread (unless MONGO_MAX_POOL_SIZE is set).
+
+Each setting can be overridden from the environment:
+
+    WEB_CONCURRENCY        workers (default 2 per CPU + 1, at most 16)
+    GUNICORN_THREADS       threads per worker (default 4)
+    GUNICORN_BIND          listen address (default 0.0.0.0:$PORT, PORT=8000)
+    GUNICORN_KEEPALIVE     seconds an idle keep-alive connection stays open
+                           (default 5; raise it behind a load balancer that
+                           reuses connections for longer)
+    GUNICORN_TIMEOUT       seconds before a silent worker is restarted (30)
+    GUNICORN_GRACEFUL_TIMEOUT  seconds workers get to finish their requests
+                           on restart or shutdown (30)
+    GUNICORN_MAX_REQUESTS  recycle a worker after this many requests, with
+                           up to 10% jitter (default 0: never)
+    GUNICORN_PRELOAD       import the app once before forking (default off,
+                           so a HUP reloads new code)
+
+Graceful restarts: `kill -HUP <master pid>` starts new workers with the
+current code and settings and lets the old ones finish their requests;
+`kill -TERM` stops after in-flight requests are done.
+"""
+import multiprocessing
+import os
+
+MAX_WORKERS = 16
+
+
+def _int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def default_workers(cpus: int) -> int:
+    return min(2 * cpus + 1, MAX_WORKERS)
+
+
+wsgi_app = 'backend.wsgi:app'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:%s' % os.environ.get('PORT', '8000'))
+
+worker_class = 'gthread'
+workers = _int('WEB_CONCURRENCY', default_workers(multiprocessing.cpu_count()))
+threads = _int('GUNICORN_THREADS', 4)
+
+keepalive = _int('GUNICORN_KEEPALIVE', 5)
+timeout = _int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = _int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+max_requests = _int('GUNICORN_MAX_REQUESTS', 0)
+max_requests_jitter = max_requests // 10
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '').lower() in ('1', 'true', 'yes')
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+
+# A worker never needs more pooled connections than it has threads. This
+# file is read before the app is imported, so backend.config sees it.
+os.environ.setdefault('MONGO_MAX_POOL_SIZE', str(threads))
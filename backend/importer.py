@@ -0,0 +1,289 @@
+"""
+Streaming, resumable import of the export format (CSV sections or NDJSON)
+"""
+import csv
+import io
+import json
+import math
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+
+from backend import bulk, periods, reminders, rollups, store, sync
+from backend.export import SECTIONS
+from backend.goals import parse_goal
+from backend.ledger import ValidationError, parse_entry
+from backend.recurring import parse_payment
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_ERRORS = 100
+
+# Ledger collection -> rollup type
+LEDGER_TYPES = {name: type_ for type_, name in rollups.LEDGER_COLLECTIONS.items()}
+
+# Section key -> (collection, [(column, field)])
+SECTION_FIELDS = {key: (name, fields) for _, name, key, fields in SECTIONS}
+SECTION_TITLES = {title: key for title, _, key, _ in SECTIONS}
+
+# (row number, section key, {column: value}); unparseable rows carry a
+# ValidationError in place of the section key
+Row = Tuple[int, Any, Dict[str, Any]]
+
+
+def _csv_records(stream) -> Iterator[List[str]]:
+    """Parse CSV records, rejecting bodies that are not UTF-8 or not CSV"""
+    reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8', newline=''))
+    while True:
+        try:
+            cells = next(reader)
+        except StopIteration:
+            return
+        except UnicodeDecodeError:
+            raise ValidationError('import is not valid UTF-8 after line %d'
+                                  % reader.line_num)
+        except csv.Error as error:
+            raise ValidationError('malformed CSV at line %d: %s'
+                                  % (reader.line_num, error))
+        yield cells
+
+
+def iter_csv_rows(stream) -> Iterator[Row]:
+    """Yield data rows from a CSV export, tagged with their section"""
+    section: Optional[str] = None
+    header: Optional[List[str]] = None
+    index = 0
+    for cells in _csv_records(stream):
+        if not cells or cells == ['']:
+            section = header = None
+            continue
+        if section is None:
+            if len(cells) != 1 or cells[0] not in SECTION_TITLES:
+                raise ValidationError('unknown section %r' % cells[0])
+            section = SECTION_TITLES[cells[0]]
+            continue
+        if header is None:
+            header = cells
+            continue
+        if len(cells) != len(header):
+            yield index, ValidationError('expected %d columns' % len(header)), {}
+        else:
+            yield index, section, dict(zip(header, cells))
+        index += 1
+
+
+def iter_ndjson_rows(stream) -> Iterator[Row]:
+    """Yield rows from an NDJSON export"""
+    for index, value in bulk.iter_ndjson(stream):
+        if isinstance(value, ValidationError):
+            yield index, value, {}
+        elif not isinstance(value, dict) or value.get('section') not in SECTION_FIELDS:
+            yield index, ValidationError('missing or unknown section'), {}
+        else:
+            yield index, value['section'], value
+
+
+def _number(value: Any, name: str) -> float:
+    if isinstance(value, bool):
+        raise ValidationError('%s must be a number' % name)
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValidationError('%s must be a number' % name)
+    if not math.isfinite(number):
+        raise ValidationError('%s must be a finite number' % name)
+    return number
+
+
+def _object_id(value: Any) -> ObjectId:
+    if not value:
+        return ObjectId()
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        raise ValidationError('invalid id')
+
+
+def to_document(section: str, row: Dict[str, Any], owner: str) -> Dict[str, Any]:
+    """Validate one row and return the document to store for it"""
+    if section in ('expense_categories', 'income_categories'):
+        name = row.get('name')
+        if not isinstance(name, str) or not name:
+            raise ValidationError('name is required')
+        return {'user': owner, 'name': name}
+
+    if section in ('expenses', 'incomes'):
+        doc = parse_entry(dict(row, value=_number(row.get('value'), 'value')))
+    elif section == 'budget_goals':
+        doc = parse_goal(dict(row, amount=_number(row.get('amount'), 'amount')))
+    else:
+        reminders = row.get('reminders') or []
+        if isinstance(reminders, str):
+            try:
+                reminders = json.loads(reminders)
+            except ValueError:
+                raise ValidationError('reminders must be JSON')
+        doc = parse_payment({
+            'type': row.get('type'), 'category': row.get('category'),
+            'value': _number(row.get('value'), 'value'),
+            'startDate': row.get('start_date'), 'frequency': row.get('frequency'),
+            'description': row.get('note'), 'reminders': reminders,
+        })
+    doc['_id'] = _object_id(row.get('id'))
+    doc['user'] = owner
+    return doc
+
+
+def to_operation(section: str, doc: Dict[str, Any]) -> ReplaceOne:
+    """The idempotent upsert that stores a document from to_document()"""
+    if section in ('expense_categories', 'income_categories'):
+        return ReplaceOne({'user': doc['user'], 'name': doc['name']}, doc, upsert=True)
+    return ReplaceOne({'_id': doc['_id'], 'user': doc['user']}, doc, upsert=True)
+
+
+class Importer:
+    """Writes rows in batches and checkpoints progress after each batch"""
+
+    def __init__(self, db, owner: str, import_id: str,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        self.db = db
+        self.owner = owner
+        self.import_id = import_id
+        self.batch_size = batch_size
+        self.checkpoints = db['import_checkpoints']
+        # The user field lets a sharded cluster route this to one shard
+        self.key = {'_id': '%s:%s' % (owner, import_id), 'user': owner}
+        # Section key -> {document key: (row number, document)} waiting to
+        # be written; a later row with the same key replaces the earlier one
+        self.batches: Dict[str, Dict[Any, Tuple[int, Dict[str, Any]]]] = {}
+        self.pending = 0
+        self.last_index = -1
+        self.written = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.error_count = 0
+
+    def load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        return self.checkpoints.find_one(self.key)
+
+    def error(self, index: int, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'row': index, 'error': message})
+
+    def add(self, index: int, section: str, doc: Dict[str, Any]) -> None:
+        batch = self.batches.setdefault(section, {})
+        key = doc['_id'] if '_id' in doc else doc['name']
+        if key not in batch:
+            self.pending += 1
+        batch[key] = (index, doc)
+        self.last_index = index
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def previous(self, name: str, batch: List[Tuple[int, Dict[str, Any]]]
+                 ) -> Dict[Any, Dict[str, Any]]:
+        """The stored versions of the ledger entries a batch is about to replace.
+
+        They are read just before the write, so an edit to the same entry
+        landing in between is counted twice; `python -m backend.rollups
+        verify` reports that drift."""
+        if name not in LEDGER_TYPES:
+            return {}
+        found = self.db[name].find(
+            {'_id': {'$in': [doc['_id'] for _, doc in batch]}, 'user': self.owner},
+            {'user': 1, 'category': 1, 'date': 1, 'value': 1})
+        return {doc['_id']: doc for doc in found}
+
+    def record_written(self, name: str, docs: List[Dict[str, Any]],
+                        previous: Dict[Any, Dict[str, Any]]) -> None:
+        """Move the rollups, period buckets and reminder schedule by what a
+        batch wrote, as the store.py write helpers do, and log it for sync"""
+        if name in LEDGER_TYPES:
+            type_ = LEDGER_TYPES[name]
+            old = [previous[doc['_id']] for doc in docs if doc['_id'] in previous]
+            rollups.record_replaced(self.db['monthly_rollups'], type_, old, docs)
+            periods.record_replaced(self.db['period_totals'], type_, old, docs)
+        elif name == 'recurring_payments':
+            now = datetime.utcnow()
+            ops = [op for payment in docs for op in reminders.schedule_ops(payment, now)]
+            if ops:
+                self.db['reminder_schedule'].bulk_write(ops, ordered=False)
+        doc_id, serialize = store.SYNCED[name]
+        sync.record(self.db, self.owner, name,
+                    [(doc_id(doc), serialize(doc)) for doc in docs])
+
+    def flush(self, status: str = 'running') -> None:
+        """Write pending rows, then record how far the import has got"""
+        for section, pending in self.batches.items():
+            name = SECTION_FIELDS[section][0]
+            batch = list(pending.values())
+            previous = self.previous(name, batch)
+            failed = set()
+            try:
+                result = self.db[name].bulk_write(
+                    [to_operation(section, doc) for _, doc in batch], ordered=False)
+                self.written += result.upserted_count + result.matched_count
+            except BulkWriteError as error:
+                details = error.details
+                self.written += details.get('nUpserted', 0) + details.get('nMatched', 0)
+                for write_error in details.get('writeErrors', []):
+                    failed.add(write_error['index'])
+                    self.error(batch[write_error['index']][0],
+                               write_error.get('errmsg', 'write failed'))
+            self.record_written(name, [doc for position, (_, doc) in enumerate(batch)
+                                        if position not in failed], previous)
+        self.batches = {}
+        self.pending = 0
+        self.checkpoints.update_one(
+            self.key,
+            {'$set': {'user': self.owner, 'rows_done': self.last_index + 1,
+                      'status': status, 'updated_at': datetime.utcnow()}},
+            upsert=True,
+        )
+
+
+def run_import(db, rows: Iterator[Row], owner: str, import_id: str,
+               batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, Any]:
+    """Import rows, skipping any already covered by this import's checkpoint"""
+    started = time.perf_counter()
+    importer = Importer(db, owner, import_id, batch_size)
+    checkpoint = importer.load_checkpoint() or {}
+    resume_from = checkpoint.get('rows_done', 0)
+    if checkpoint.get('status') == 'done':
+        return dict(checkpoint.get('result', {}), import_id=import_id,
+                    already_complete=True)
+
+    rows_seen = 0
+    for index, section, row in rows:
+        rows_seen = index + 1
+        if index < resume_from:
+            continue
+        if isinstance(section, ValidationError):
+            importer.error(index, str(section))
+            continue
+        try:
+            importer.add(index, section, to_document(section, row, owner))
+        except ValidationError as error:
+            importer.error(index, str(error))
+    importer.last_index = rows_seen - 1
+    importer.flush()
+
+    seconds = time.perf_counter() - started
+    processed = max(rows_seen - resume_from, 0)
+    result = {
+        'import_id': import_id,
+        'rows': rows_seen,
+        'resumed_from': resume_from,
+        'written': importer.written,
+        'error_count': importer.error_count,
+        'errors': importer.errors,
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(processed / seconds, 1) if seconds else None,
+    }
+    importer.checkpoints.update_one(importer.key,
+                                    {'$set': {'status': 'done', 'result': result}})
+    return result
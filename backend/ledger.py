@@ -0,0 +1,156 @@
+"""
+Expense/income ledger helpers: validation, indexes and cursor pagination
+"""
+import base64
+import json
+import math
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+DATE_FORMAT = '%Y-%m-%d'
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Newest first; _id breaks ties between entries on the same day
+SORT_ORDER = [('date', DESCENDING), ('_id', DESCENDING)]
+
+# Fields read by serialize_entry (and encode_cursor), so pages leave the
+# owner and any other stored fields in the database
+PROJECTION = {'category': 1, 'value': 1, 'date': 1}
+
+LEDGER_INDEXES = [
+    IndexModel([('user', ASCENDING), ('date', DESCENDING), ('_id', DESCENDING)],
+               name='user_date'),
+    IndexModel([('user', ASCENDING), ('category', ASCENDING),
+                ('date', DESCENDING), ('_id', DESCENDING)],
+               name='user_category_date'),
+]
+
+
+class ValidationError(ValueError):
+    """Raised when a ledger entry or query parameter is invalid"""
+
+
+def ensure_indexes(collection) -> None:
+    """Create the compound indexes used by ledger queries"""
+    collection.create_indexes(LEDGER_INDEXES)
+
+
+def parse_date(value: Any) -> datetime:
+    """Parse a YYYY-MM-DD string into a datetime"""
+    if not isinstance(value, str):
+        raise ValidationError('date must be a YYYY-MM-DD string')
+    try:
+        return datetime.strptime(value[:10], DATE_FORMAT)
+    except ValueError:
+        raise ValidationError('date must be a YYYY-MM-DD string')
+
+
+def parse_entry(data: Any) -> Dict[str, Any]:
+    """Validate a request body and return the fields to store"""
+    if not isinstance(data, dict):
+        raise ValidationError('entry must be a JSON object')
+    category = data.get('category')
+    if not isinstance(category, str) or not category:
+        raise ValidationError('category is required')
+    value = data.get('value')
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValidationError('value must be a number')
+    if not math.isfinite(value):
+        raise ValidationError('value must be a finite number')
+    return {
+        'category': category,
+        'value': float(value),
+        'date': parse_date(data.get('date')),
+    }
+
+
+def serialize_entry(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a stored document into the shape used by the frontend"""
+    return {
+        'id': str(doc['_id']),
+        'category': doc.get('category'),
+        'value': doc.get('value'),
+        'date': doc['date'].strftime(DATE_FORMAT),
+    }
+
+
+def parse_object_id(value: str) -> ObjectId:
+    """Parse an entry id from the URL"""
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        raise ValidationError('invalid id')
+
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    """Encode the sort key of the last returned entry as an opaque cursor"""
+    key = [doc['date'].isoformat(), str(doc['_id'])]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        date, oid = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(date), ObjectId(oid)
+    except (ValueError, TypeError, InvalidId):
+        raise ValidationError('invalid cursor')
+
+
+def parse_limit(value: Optional[str]) -> int:
+    """Parse the page size, clamped to MAX_PAGE_SIZE"""
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValidationError('limit must be an integer')
+    if limit < 1:
+        raise ValidationError('limit must be positive')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def build_query(user: str, category: Optional[str] = None,
+                start: Optional[datetime] = None, end: Optional[datetime] = None,
+                cursor: Optional[str] = None) -> Dict[str, Any]:
+    """Build a filter that can be answered from the (user, [category,] date) indexes"""
+    query: Dict[str, Any] = {'user': user}
+    if category:
+        query['category'] = category
+    date_range: Dict[str, Any] = {}
+    if start:
+        date_range['$gte'] = start
+    if end:
+        date_range['$lte'] = end
+    if date_range:
+        query['date'] = date_range
+    if cursor:
+        last_date, last_id = decode_cursor(cursor)
+        query['$or'] = [
+            {'date': {'$lt': last_date}},
+            {'date': last_date, '_id': {'$lt': last_id}},
+        ]
+    return query
+
+
+def fetch_page(collection, query: Dict[str, Any], limit: int) -> Dict[str, Any]:
+    """Fetch one page of entries and the cursor for the next one"""
+    docs = list(collection.find(query, PROJECTION).sort(SORT_ORDER).limit(limit + 1))
+    return build_page(docs, limit)
+
+
+def build_page(docs: List[Dict[str, Any]], limit: int) -> Dict[str, Any]:
+    """Shape up to limit + 1 sorted documents into a page"""
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1])
+    return {
+        'items': [serialize_entry(doc) for doc in docs],
+        'next_cursor': next_cursor,
+    }
@@ -0,0 +1,379 @@
+"""
+Append-only storage engine for the local data layer (the db.ts function API).
+
+db.ts keeps each collection as one JSON array under a localStorage key, so
+every write parses and re-serializes the whole collection. LogStore
+appends one JSON line per operation to a log file instead and keeps the
+live records in memory, keyed by id; opening a store replays its log.
+Once the log holds COMPACT_RATIO times more lines than there are live
+records it is rewritten with one line per record, so its size stays
+proportional to the data.
+
+Each collection is an IndexedCollection: a dict by id plus secondary
+indexes (category and date for the ledgers), so updates and deletes by id
+are O(1) and date ranges are read without scanning every record.
+
+LocalDB exposes the same functions as db.ts (and tests/mock_db.py) on
+top of a LogStore:
+
+    db = LocalDB(LogStore('budgetly.log'))
+    db.addExpense('Food', 12.5, '2024-03-04')
+"""
+import bisect
+import json
+import os
+import uuid
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+COMPACT_RATIO = 2
+# Logs shorter than this are never compacted
+COMPACT_MIN_LINES = 1000
+
+# Secondary indexes per collection
+COLLECTIONS: Dict[str, Tuple[str, ...]] = {
+    'expense_categories': (),
+    'income_categories': (),
+    'expenses': ('category', 'date'),
+    'incomes': ('category', 'date'),
+    'budget_goals': ('type', 'period'),
+    'recurring_payments': ('category', 'startDate'),
+}
+
+
+def _copy(value: Any) -> Any:
+    """A copy of a record, which holds JSON values"""
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+class IndexedCollection:
+    """Records by id, plus secondary indexes on some of their fields.
+
+    Each secondary index maps a field value to the ids holding it (a dict
+    used as an ordered set, so removing one is O(1)) and keeps the distinct
+    values sorted for range queries. Indexed fields have few distinct
+    values (categories, days), so keeping them sorted is cheap. Records
+    that are not dicts, or lack a field, are left out of its index."""
+
+    def __init__(self, indexes: Iterable[str] = ()):
+        self.records: Dict[str, Any] = {}
+        self.indexes: Dict[str, Dict[Any, Dict[str, None]]] = {
+            field: {} for field in indexes}
+        self.keys: Dict[str, List[Any]] = {field: [] for field in self.indexes}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, id_: str) -> bool:
+        return id_ in self.records
+
+    def get(self, id_: str) -> Optional[Any]:
+        return self.records.get(id_)
+
+    def values(self) -> List[Any]:
+        return list(self.records.values())
+
+    def _unindex(self, id_: str, doc: Any) -> None:
+        if not isinstance(doc, dict):
+            return
+        for field, index in self.indexes.items():
+            value = doc.get(field)
+            ids = index.get(value)
+            if ids is None:
+                continue
+            ids.pop(id_, None)
+            if not ids:
+                del index[value]
+                keys = self.keys[field]
+                del keys[bisect.bisect_left(keys, value)]
+
+    def _index(self, id_: str, doc: Any) -> None:
+        if not isinstance(doc, dict):
+            return
+        for field, index in self.indexes.items():
+            value = doc.get(field)
+            if value is None:
+                continue
+            ids = index.get(value)
+            if ids is None:
+                ids = index[value] = {}
+                bisect.insort(self.keys[field], value)
+            ids[id_] = None
+
+    def put(self, id_: str, doc: Any) -> None:
+        old = self.records.get(id_)
+        if old is not None:
+            self._unindex(id_, old)
+        self.records[id_] = doc
+        self._index(id_, doc)
+
+    def delete(self, id_: str) -> bool:
+        doc = self.records.pop(id_, None)
+        if doc is None:
+            return False
+        self._unindex(id_, doc)
+        return True
+
+    def clear(self) -> None:
+        self.records.clear()
+        for field in self.indexes:
+            self.indexes[field].clear()
+            self.keys[field].clear()
+
+    def find(self, field: str, value: Any) -> List[Any]:
+        """Records whose `field` equals `value`, oldest first"""
+        return [self.records[id_] for id_ in self.indexes[field].get(value, ())]
+
+    def range(self, field: str, start: Any = None, end: Any = None) -> List[Any]:
+        """Records with start <= `field` <= end (either bound optional),
+        ordered by that field"""
+        keys = self.keys[field]
+        low = 0 if start is None else bisect.bisect_left(keys, start)
+        high = len(keys) if end is None else bisect.bisect_right(keys, end)
+        index, records = self.indexes[field], self.records
+        return [records[id_] for key in keys[low:high] for id_ in index[key]]
+
+
+class LogStore:
+    """Records per collection, persisted as an append-only operation log.
+
+    `path=None` keeps everything in memory. With `fsync=True` every write
+    is flushed to disk before it returns."""
+
+    def __init__(self, path: Optional[str] = None, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self.collections: Dict[str, IndexedCollection] = {
+            name: IndexedCollection(indexes) for name, indexes in COLLECTIONS.items()}
+        self.lines = 0
+        self._file = None
+        if path is not None:
+            self._replay()
+            self._file = open(path, 'a', encoding='utf-8')
+
+    def _replay(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        good = 0
+        with open(self.path, 'rb') as log:
+            for raw in log:
+                try:
+                    self._apply(json.loads(raw))
+                except ValueError:
+                    # A write cut short by a crash; drop it and what follows
+                    break
+                good += len(raw)
+                self.lines += 1
+        if good < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as log:
+                log.truncate(good)
+
+    def collection(self, name: str) -> IndexedCollection:
+        if name not in self.collections:
+            self.collections[name] = IndexedCollection()
+        return self.collections[name]
+
+    def _apply(self, op: Dict[str, Any]) -> None:
+        records = self.collection(op['c'])
+        if op['op'] == 'put':
+            records.put(op['id'], op['doc'])
+        elif op['op'] == 'del':
+            records.delete(op['id'])
+        else:
+            records.clear()
+
+    def _append(self, op: Dict[str, Any]) -> None:
+        self._apply(op)
+        if self._file is None:
+            return
+        self._file.write(json.dumps(op, separators=(',', ':')) + '\n')
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.lines += 1
+        if self.lines >= COMPACT_MIN_LINES and self.lines > COMPACT_RATIO * self.size():
+            self.compact()
+
+    # Reads return copies and writes store one, so changing a record the
+    # caller holds cannot move it out from under the secondary indexes
+
+    def get(self, collection: str, id_: str) -> Optional[Any]:
+        return _copy(self.collection(collection).get(id_))
+
+    def values(self, collection: str) -> List[Any]:
+        """Live records in insertion order"""
+        return _copy(self.collection(collection).values())
+
+    def find(self, collection: str, field: str, value: Any) -> List[Any]:
+        return _copy(self.collection(collection).find(field, value))
+
+    def range(self, collection: str, field: str, start: Any = None,
+              end: Any = None) -> List[Any]:
+        return _copy(self.collection(collection).range(field, start, end))
+
+    def put(self, collection: str, id_: str, doc: Any) -> None:
+        self._append({'c': collection, 'op': 'put', 'id': id_, 'doc': _copy(doc)})
+
+    def delete(self, collection: str, id_: str) -> bool:
+        if id_ not in self.collection(collection):
+            return False
+        self._append({'c': collection, 'op': 'del', 'id': id_})
+        return True
+
+    def clear(self, collection: Optional[str] = None) -> None:
+        names = [collection] if collection else list(self.collections)
+        for name in names:
+            self._append({'c': name, 'op': 'clear'})
+
+    def size(self) -> int:
+        return sum(len(records) for records in self.collections.values())
+
+    def _snapshot(self) -> Iterator[Dict[str, Any]]:
+        for name, records in self.collections.items():
+            for id_, doc in records.records.items():
+                yield {'c': name, 'op': 'put', 'id': id_, 'doc': doc}
+
+    def compact(self) -> None:
+        """Rewrite the log with one line per live record"""
+        if self._file is None:
+            return
+        self._file.close()
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as out:
+            for op in self._snapshot():
+                out.write(json.dumps(op, separators=(',', ':')) + '\n')
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, self.path)
+        self.lines = self.size()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def generateId() -> str:
+    return str(uuid.uuid4())
+
+
+class LocalDB:
+    """The db.ts function API, one O(1) log append per write"""
+
+    def __init__(self, store: Optional[LogStore] = None):
+        self.store = store if store is not None else LogStore()
+
+    # Categories are their own ids
+
+    def addExpenseCategory(self, category: str) -> None:
+        if self.store.get('expense_categories', category) is None:
+            self.store.put('expense_categories', category, category)
+
+    def getExpenseCategories(self, callback: Callable[[List[str]], None]) -> None:
+        callback(self.getExpenseCategoriesList())
+
+    def getExpenseCategoriesList(self) -> List[str]:
+        return self.store.values('expense_categories')
+
+    def deleteExpenseCategory(self, category: str) -> None:
+        self.store.delete('expense_categories', category)
+
+    def addIncomeCategory(self, category: str) -> None:
+        if self.store.get('income_categories', category) is None:
+            self.store.put('income_categories', category, category)
+
+    def getIncomeCategories(self, callback: Callable[[List[str]], None]) -> None:
+        callback(self.getIncomeCategoriesList())
+
+    def getIncomeCategoriesList(self) -> List[str]:
+        return self.store.values('income_categories')
+
+    def deleteIncomeCategory(self, category: str) -> None:
+        self.store.delete('income_categories', category)
+
+    # Expenses and incomes
+
+    def _add_entry(self, collection: str, category: str, value: float, date: str) -> None:
+        entry = {'id': generateId(), 'category': category, 'value': value, 'date': date}
+        self.store.put(collection, entry['id'], entry)
+
+    def addExpense(self, category: str, value: float, date: str) -> None:
+        self._add_entry('expenses', category, value, date)
+
+    def getExpenses(self, callback: Callable[[List[Dict[str, Any]]], None]) -> None:
+        callback(self.getExpensesList())
+
+    def getExpensesList(self) -> List[Dict[str, Any]]:
+        return self.store.values('expenses')
+
+    def addIncome(self, category: str, value: float, date: str) -> None:
+        self._add_entry('incomes', category, value, date)
+
+    def getIncomes(self, callback: Callable[[List[Dict[str, Any]]], None]) -> None:
+        callback(self.getIncomesList())
+
+    def getIncomesList(self) -> List[Dict[str, Any]]:
+        return self.store.values('incomes')
+
+    # Indexed queries on the ledgers ('expenses' or 'incomes'); not in db.ts
+
+    def getEntriesByCategory(self, collection: str, category: str) -> List[Dict[str, Any]]:
+        return self.store.find(collection, 'category', category)
+
+    def getEntriesBetween(self, collection: str, start: Optional[str] = None,
+                          end: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Entries dated start..end (inclusive, YYYY-MM-DD), oldest first"""
+        return self.store.range(collection, 'date', start, end)
+
+    # Budget goals
+
+    def addBudgetGoal(self, type_: str, period: str, amount: float) -> None:
+        goal = {'id': generateId(), 'type': type_, 'period': period, 'amount': amount}
+        self.store.put('budget_goals', goal['id'], goal)
+
+    def getBudgetGoals(self, callback: Callable[[List[Dict[str, Any]]], None]) -> None:
+        callback(self.getBudgetGoalsList())
+
+    def getBudgetGoalsList(self) -> List[Dict[str, Any]]:
+        return self.store.values('budget_goals')
+
+    def updateBudgetGoal(self, id_: str, amount: float) -> None:
+        goal = self.store.get('budget_goals', id_)
+        if goal is not None:
+            self.store.put('budget_goals', id_, dict(goal, amount=amount))
+
+    def deleteBudgetGoal(self, id_: str) -> None:
+        self.store.delete('budget_goals', id_)
+
+    # Recurring payments
+
+    def addRecurringPayment(self, type_: str, category: str, value: float, startDate: str,
+                            frequency: str, description: str,
+                            reminders: List[Dict[str, Any]]) -> None:
+        payment = {'id': generateId(), 'type': type_, 'category': category, 'value': value,
+                   'startDate': startDate, 'frequency': frequency,
+                   'description': description, 'reminders': reminders}
+        self.store.put('recurring_payments', payment['id'], payment)
+
+    def getRecurringPayments(self, callback: Callable[[List[Dict[str, Any]]], None]) -> None:
+        callback(self.getRecurringPaymentsList())
+
+    def getRecurringPaymentsList(self) -> List[Dict[str, Any]]:
+        return self.store.values('recurring_payments')
+
+    def updateRecurringPayment(self, id_: str, type_: str, category: str, value: float,
+                               startDate: str, frequency: str, description: str,
+                               reminders: List[Dict[str, Any]]) -> None:
+        payment = self.store.get('recurring_payments', id_)
+        if payment is not None:
+            self.store.put('recurring_payments', id_, dict(
+                payment, type=type_, category=category, value=value,
+                startDate=startDate, frequency=frequency,
+                description=description, reminders=reminders))
+
+    def deleteRecurringPayment(self, id_: str) -> None:
+        self.store.delete('recurring_payments', id_)
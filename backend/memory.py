@@ -0,0 +1,284 @@
+"""
+An in-process stand-in for MongoDB, for hermetic tests and benchmarks.
+
+With DATABASE_BACKEND=memory, `mongo.collection(name)` returns a
+MemoryCollection, so the whole API runs without a database server;
+nothing is persisted, and every MemoryClient starts out empty.
+
+Documents are kept in a dict by _id as BSON would give them back: deep
+copies, with datetimes as naive UTC at millisecond precision, and values
+BSON cannot encode are refused on write. Unique indexes are enforced,
+and the leading field of every index gets a hash map from value to
+documents, so a filter that pins that field (in practice the user) only
+looks at the documents it names. Filters, updates and pipelines follow
+backend.docquery.
+"""
+import itertools
+import threading
+from collections import abc
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Mapping, Sequence, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidDocument
+from pymongo import IndexModel
+from pymongo.errors import DuplicateKeyError
+
+from backend import docquery
+from backend.documents import DocumentCollection
+
+_SCALARS = (str, int, float, bool, bytes, ObjectId, type(None))
+
+
+def to_bson(value: Any) -> Any:
+    """A copy of `value` as it would come back from MongoDB"""
+    if isinstance(value, _SCALARS):
+        return value
+    if isinstance(value, (dict, abc.Mapping)):
+        return {key: to_bson(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_bson(item) for item in value]
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    raise InvalidDocument('cannot encode object: %r, of type: %r' % (value, type(value)))
+
+
+def _key(value: Any) -> Any:
+    """A hashable stand-in for a value, for the _id map and the indexes"""
+    if isinstance(value, dict):
+        return ('\x00object',) + tuple((key, _key(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return ('\x00array',) + tuple(_key(item) for item in value)
+    return value
+
+
+def _bucket_keys(value: Any) -> List[Any]:
+    # Like a multikey index: an array is found by any of its elements
+    keys = [_key(value)]
+    if isinstance(value, list):
+        keys.extend(_key(item) for item in value)
+    return list(dict.fromkeys(keys))
+
+
+class _UniqueIndex:
+    def __init__(self, fields: List[str]):
+        self.fields = fields
+        self.entries: Dict[Tuple[Any, ...], Any] = {}
+        # Set once a document has an array in an indexed field: a lookup
+        # by one element then cannot use `entries`
+        self.multikey = False
+
+    def key(self, doc: Mapping[str, Any]) -> Tuple[Any, ...]:
+        values = [docquery.get_path(doc, path) for path in self.fields]
+        if any(isinstance(value, list) for value in values):
+            self.multikey = True
+        return tuple(_key(value) for value in values)
+
+
+class MemoryCollection(DocumentCollection):
+    """A dict of documents with the pymongo collection methods the app uses"""
+
+    def __init__(self, database: 'MemoryDatabase', name: str):
+        self.database = database
+        self.name = name
+        self.full_name = '%s.%s' % (database.name, name)
+        self.client = database.client
+        self._lock = threading.RLock()
+        self._docs: Dict[Any, Dict[str, Any]] = {}
+        # field -> value -> ids, in insertion order
+        self._buckets: Dict[str, Dict[Any, Dict[Any, None]]] = {}
+        self._unique: Dict[str, _UniqueIndex] = {}
+
+    def __repr__(self) -> str:
+        return 'MemoryCollection(%r)' % self.full_name
+
+    # Indexes
+
+    def create_indexes(self, models: Sequence[IndexModel]) -> List[str]:
+        names = []
+        with self._lock:
+            for model in models:
+                spec = model.document
+                keys = list(spec['key'].items())
+                name = spec.get('name') or '_'.join('%s_%s' % key for key in keys)
+                fields = [path for path, _ in keys]
+                if spec.get('unique') and name not in self._unique:
+                    index = _UniqueIndex(fields)
+                    for doc_id, doc in self._docs.items():
+                        key = index.key(doc)
+                        if key in index.entries:
+                            raise self._duplicate(name, key)
+                        index.entries[key] = doc_id
+                    self._unique[name] = index
+                if fields[0] != '_id' and fields[0] not in self._buckets:
+                    buckets: Dict[Any, Dict[Any, None]] = {}
+                    for doc_id, doc in self._docs.items():
+                        for value in _bucket_keys(docquery.get_path(doc, fields[0])):
+                            buckets.setdefault(value, {})[doc_id] = None
+                    self._buckets[fields[0]] = buckets
+                names.append(name)
+        return names
+
+    def drop(self) -> None:
+        self.database.drop_collection(self.name)
+
+    def _duplicate(self, index: str, key: Any) -> DuplicateKeyError:
+        return DuplicateKeyError('E11000 duplicate key error collection: %s index: %s dup key: %r'
+                                 % (self.full_name, index, key), 11000)
+
+    def _check_unique(self, doc: Mapping[str, Any], own_id: Any = None) -> None:
+        for name, index in self._unique.items():
+            key = index.key(doc)
+            if index.entries.get(key, own_id) != own_id:
+                raise self._duplicate(name, key)
+
+    def _add(self, doc_id: Any, doc: Dict[str, Any]) -> None:
+        self._docs[doc_id] = doc
+        for index in self._unique.values():
+            index.entries[index.key(doc)] = doc_id
+        for path, buckets in self._buckets.items():
+            for value in _bucket_keys(docquery.get_path(doc, path)):
+                buckets.setdefault(value, {})[doc_id] = None
+
+    def _discard(self, doc_id: Any) -> None:
+        doc = self._docs.pop(doc_id)
+        for index in self._unique.values():
+            index.entries.pop(index.key(doc), None)
+        for path, buckets in self._buckets.items():
+            for value in _bucket_keys(docquery.get_path(doc, path)):
+                bucket = buckets[value]
+                del bucket[doc_id]
+                if not bucket:
+                    del buckets[value]
+
+    # Reads
+
+    def _candidates(self, query: Mapping[str, Any]) -> List[Dict[str, Any]]:
+        """The documents a filter can match, narrowed by _id or an index"""
+        pinned = docquery.equality_fields(query)
+        if '_id' in pinned:
+            doc = self._docs.get(_key(pinned['_id']))
+            return [doc] if doc is not None else []
+        for index in self._unique.values():
+            if not index.multikey and all(path in pinned for path in index.fields):
+                doc_id = index.entries.get(tuple(_key(pinned[path]) for path in index.fields))
+                return [self._docs[doc_id]] if doc_id is not None else []
+        for path, buckets in self._buckets.items():
+            if path in pinned:
+                ids = buckets.get(_key(pinned[path]), ())
+                return [self._docs[doc_id] for doc_id in ids]
+        return list(self._docs.values())
+
+    def _matches(self, query: Mapping[str, Any]) -> Iterator[Dict[str, Any]]:
+        """The stored documents matching a filter, shared with the collection"""
+        # Stored documents are replaced, never changed, so a snapshot of
+        # the candidates can be filtered outside the lock
+        with self._lock:
+            candidates = self._candidates(query or {})
+        return (doc for doc in candidates if docquery.matches(doc, query))
+
+    def _select(self, query: Mapping[str, Any], sort: docquery.Sort = (),
+                txn: Any = None, limit: int = 0) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+        """(_id key, document) of every match, in `sort` order"""
+        found = self._matches(query)
+        if sort:
+            found = docquery.sort_docs(found, sort, limit)
+        elif limit:
+            found = itertools.islice(found, limit)
+        # Only what is handed out is copied
+        for doc in found:
+            yield _key(doc['_id']), docquery.deep_copy(doc)
+
+    def count_documents(self, filter: Mapping[str, Any], **kwargs) -> int:
+        return sum(1 for _ in self._matches(filter))
+
+    def estimated_document_count(self, **kwargs) -> int:
+        return len(self._docs)
+
+    # Writes
+
+    def _transaction(self):
+        return self._lock
+
+    def _insert(self, txn: Any, doc: Dict[str, Any]) -> Any:
+        if '_id' not in doc:
+            doc['_id'] = ObjectId()
+        stored = to_bson(doc)
+        doc_id = _key(stored['_id'])
+        with self._lock:
+            if doc_id in self._docs:
+                raise self._duplicate('_id_', (doc_id,))
+            self._check_unique(stored)
+            self._add(doc_id, stored)
+        return doc['_id']
+
+    def _rewrite(self, txn: Any, doc_id: Any, doc: Dict[str, Any]) -> None:
+        stored = to_bson(doc)
+        with self._lock:
+            self._check_unique(stored, doc_id)
+            self._discard(doc_id)
+            self._add(doc_id, stored)
+
+    def _remove(self, txn: Any, doc_id: Any) -> None:
+        with self._lock:
+            self._discard(doc_id)
+
+
+class MemoryDatabase:
+    """Collections of one in-memory database"""
+
+    def __init__(self, client: 'MemoryClient', name: str):
+        self.client = client
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        with self.client._lock:
+            if name not in self._collections:
+                self._collections[name] = MemoryCollection(self, name)
+            return self._collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, **kwargs) -> MemoryCollection:
+        return self[name]
+
+    def list_collection_names(self) -> List[str]:
+        return list(self._collections)
+
+    def drop_collection(self, name: str) -> None:
+        with self.client._lock:
+            self._collections.pop(name, None)
+
+
+class MemoryClient:
+    """Stands in for MongoClient: `client[db_name]` is a database in this process"""
+
+    def __init__(self, *args, **kwargs):
+        self._lock = threading.RLock()
+        self._databases: Dict[str, MemoryDatabase] = {}
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        with self._lock:
+            if name not in self._databases:
+                self._databases[name] = MemoryDatabase(self, name)
+            return self._databases[name]
+
+    def get_database(self, name: str, **kwargs) -> MemoryDatabase:
+        return self[name]
+
+    def list_database_names(self) -> List[str]:
+        return list(self._databases)
+
+    def drop_database(self, name: str) -> None:
+        with self._lock:
+            self._databases.pop(name, None)
+
+    def close(self) -> None:
+        with self._lock:
+            self._databases = {}
@@ -0,0 +1,322 @@
+"""
+Request, MongoDB and cache metrics in the Prometheus text format.
+
+With METRICS_ENABLED (the default), create_app() times every request and
+registers pymongo command and connection pool listeners on the client,
+and GET /metrics reports:
+
+- budgetly_http_request_duration_seconds{route,method,status}: histogram,
+  labelled with the URL rule rather than the path, so ids in URLs do not
+  create new series
+- budgetly_http_requests_in_flight: gauge
+- budgetly_mongo_command_duration_seconds{command} and
+  budgetly_mongo_command_failures_total{command}
+- budgetly_mongo_pool_checkout_wait_seconds: histogram, and
+  budgetly_mongo_pool_checkout_failures_total{reason}
+- budgetly_cache_{hits,misses,evictions}_total and
+  budgetly_cache_hit_ratio{cache}
+
+Recording takes no lock shared between requests: every thread updates
+its own shard of each metric, and a scrape adds the shards up. Values are
+per process, so scrape every worker (or sum them in Prometheus).
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from flask import Flask, g, request
+from pymongo import monitoring
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; from a cache hit to a request stuck behind a slow query
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(str(value)))
+                             for name, value in zip(names, values))
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Sharded:
+    """A metric whose state is kept per thread and merged on collection"""
+
+    kind = ''
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: List[Tuple[threading.Thread, Dict[Labels, Any]]] = []
+        # Shards of threads that have exited, merged into one
+        self._retired: Dict[Labels, Any] = {}
+
+    def _shard(self) -> Dict[Labels, Any]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _merge(self, into: Dict[Labels, Any], shard: Dict[Labels, Any]) -> None:
+        raise NotImplementedError
+
+    def _collect(self) -> Dict[Labels, Any]:
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    self._merge(self._retired, shard)
+            self._shards = live
+            total: Dict[Labels, Any] = {}
+            self._merge(total, self._retired)
+            for _, shard in live:
+                # Copying the items is one step under the GIL, so it is safe
+                # while the owning thread keeps recording
+                self._merge(total, dict(shard.items()))
+        return total
+
+    def render(self) -> List[str]:
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.kind)]
+        for labels, value in sorted(self._collect().items()):
+            lines.extend(self._lines(labels, value))
+        return lines
+
+    def _lines(self, labels: Labels, value: Any) -> List[str]:
+        return ['%s%s %s' % (self.name, _format_labels(self.labelnames, labels),
+                             _format_value(value))]
+
+
+class Counter(_Sharded):
+    """A value that only goes up"""
+
+    kind = 'counter'
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def _merge(self, into, shard):
+        for labels, value in shard.items():
+            into[labels] = into.get(labels, 0) + value
+
+
+class Gauge(Counter):
+    """A value that goes up and down, such as requests in flight"""
+
+    kind = 'gauge'
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Sharded):
+    """Counts of observations per bucket, with their sum"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str) -> None:
+        shard = self._shard()
+        # One count per bucket plus +Inf, then the sum
+        state = shard.get(labels)
+        if state is None:
+            state = shard[labels] = [0] * (len(self.buckets) + 2)
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def _merge(self, into, shard):
+        for labels, state in shard.items():
+            total = into.get(labels)
+            if total is None:
+                into[labels] = list(state)
+            else:
+                into[labels] = [a + b for a, b in zip(total, state)]
+
+    def _lines(self, labels, state):
+        names = self.labelnames + ('le',)
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), state):
+            cumulative += count
+            lines.append('%s_bucket%s %d' % (self.name, _format_labels(
+                names, labels + (_format_value(bound),)), cumulative))
+        suffix = _format_labels(self.labelnames, labels)
+        lines.append('%s_sum%s %s' % (self.name, suffix, _format_value(state[-1])))
+        lines.append('%s_count%s %d' % (self.name, suffix, cumulative))
+        return lines
+
+
+class Callback:
+    """Values read from elsewhere at scrape time, e.g. cache statistics"""
+
+    def __init__(self, name: str, help: str, kind: str, labelnames: Sequence[str],
+                 collect: Callable[[], Iterable[Tuple[Labels, float]]]):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.kind)]
+        for labels, value in self.collect():
+            lines.append('%s%s %s' % (self.name, _format_labels(self.labelnames, labels),
+                                      _format_value(value)))
+        return lines
+
+
+class CommandListener(monitoring.CommandListener):
+    """Times every MongoDB command by name"""
+
+    def __init__(self, metrics: 'Metrics'):
+        self.metrics = metrics
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.metrics.mongo_commands.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        self.metrics.mongo_commands.observe(event.duration_micros / 1e6, event.command_name)
+        self.metrics.mongo_failures.inc(event.command_name)
+
+
+class PoolListener(monitoring.ConnectionPoolListener):
+    """Times how long requests wait to check a connection out of the pool"""
+
+    def __init__(self, metrics: 'Metrics'):
+        self.metrics = metrics
+        # A checkout starts and ends on the requesting thread
+        self._local = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def _waited(self) -> float:
+        started = getattr(self._local, 'started', None)
+        return 0.0 if started is None else time.perf_counter() - started
+
+    def connection_checked_out(self, event):
+        self.metrics.pool_wait.observe(self._waited())
+
+    def connection_check_out_failed(self, event):
+        self.metrics.pool_wait.observe(self._waited())
+        self.metrics.pool_failures.inc(str(event.reason))
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+
+class Metrics:
+    """The metrics of one app"""
+
+    def __init__(self, caches: Optional[Mapping[str, Any]] = None):
+        self.requests = Histogram('budgetly_http_request_duration_seconds',
+                                  'Time to handle a request', ('route', 'method', 'status'))
+        self.in_flight = Gauge('budgetly_http_requests_in_flight',
+                               'Requests being handled')
+        self.mongo_commands = Histogram('budgetly_mongo_command_duration_seconds',
+                                        'MongoDB command round trips', ('command',))
+        self.mongo_failures = Counter('budgetly_mongo_command_failures_total',
+                                      'MongoDB commands that failed', ('command',))
+        self.pool_wait = Histogram('budgetly_mongo_pool_checkout_wait_seconds',
+                                   'Time waiting for a pooled MongoDB connection')
+        self.pool_failures = Counter('budgetly_mongo_pool_checkout_failures_total',
+                                     'Connection checkouts that failed', ('reason',))
+        self.caches = dict(caches or {})
+        self.metrics: List[Any] = [self.requests, self.in_flight, self.mongo_commands,
+                                   self.mongo_failures, self.pool_wait, self.pool_failures]
+        for stat in ('hits', 'misses', 'evictions'):
+            self.metrics.append(Callback(
+                'budgetly_cache_%s_total' % stat, 'Cache %s' % stat, 'counter', ('cache',),
+                lambda stat=stat: self._cache_stats(stat)))
+        self.metrics.append(Callback('budgetly_cache_hit_ratio', 'Cache hits per lookup',
+                                     'gauge', ('cache',),
+                                     lambda: self._cache_stats('hit_ratio')))
+
+    def _cache_stats(self, stat: str) -> List[Tuple[Labels, float]]:
+        return [((name,), cache.stats()[stat]) for name, cache in self.caches.items()]
+
+    def listeners(self) -> List[Any]:
+        """pymongo event listeners feeding these metrics"""
+        return [CommandListener(self), PoolListener(self)]
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def init_app(self, app: Flask) -> None:
+        """Time the app's requests and its MongoDB client"""
+        app.extensions['metrics'] = self
+        app.extensions['mongo'].listeners.extend(self.listeners())
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self) -> None:
+        g.metrics_started = time.perf_counter()
+        self.in_flight.inc()
+
+    def _after_request(self, response):
+        g.metrics_status = response.status_code
+        return response
+
+    def _teardown_request(self, exc) -> None:
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        self.in_flight.dec()
+        rule = request.url_rule
+        self.requests.observe(time.perf_counter() - started,
+                              rule.rule if rule is not None else '<unmatched>',
+                              request.method, str(g.pop('metrics_status', 500)))
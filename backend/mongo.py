@@ -0,0 +1,139 @@
+"""
+Lazily created, fork-aware MongoClient shared by all requests of an app
+
+DATABASE_BACKEND=sqlite swaps in backend.sqlite.SQLiteClient, which offers
+the same collection API on a local SQLite file, and DATABASE_BACKEND=memory
+backend.memory.MemoryClient, which keeps the data in this process.
+"""
+import os
+import threading
+from typing import Any, Dict, List, Mapping, Sequence
+
+from flask import Flask, current_app
+from pymongo import IndexModel, MongoClient
+
+from backend import (budget, categories, goals, ledger, periods, recurring,
+                     reminders, rollups, sync)
+from backend.memory import MemoryClient
+from backend.sqlite import SQLiteClient
+
+# Indexes to create the first time each collection is used
+COLLECTION_INDEXES: Dict[str, List[IndexModel]] = {
+    'balances': budget.BUDGET_INDEXES,
+    'expenses': ledger.LEDGER_INDEXES,
+    'incomes': ledger.LEDGER_INDEXES,
+    'monthly_rollups': rollups.ROLLUP_INDEXES,
+    'period_totals': periods.PERIOD_INDEXES,
+    'expense_categories': categories.CATEGORY_INDEXES,
+    'income_categories': categories.CATEGORY_INDEXES,
+    'budget_goals': goals.GOAL_INDEXES,
+    'recurring_payments': recurring.RECURRING_INDEXES,
+    'reminder_schedule': reminders.SCHEDULE_INDEXES,
+    'notifications': reminders.NOTIFICATION_INDEXES,
+    'sync_log': sync.SYNC_LOG_INDEXES,
+    'sync_counters': sync.SYNC_COUNTER_INDEXES,
+}
+
+
+def make_client(config: Mapping[str, Any], listeners: Sequence[Any] = ()):
+    """Build the client selected by DATABASE_BACKEND. pymongo event
+    listeners only apply to MongoDB."""
+    backend = config['DATABASE_BACKEND']
+    if backend == 'mongo':
+        return MongoClient(config['MONGO_URI'], connect=False, event_listeners=list(listeners),
+                           **client_options(config))
+    if backend == 'sqlite':
+        return SQLiteClient(config['SQLITE_PATH'])
+    if backend == 'memory':
+        return MemoryClient()
+    raise ValueError('unknown DATABASE_BACKEND %r' % backend)
+
+
+def client_options(config: Mapping[str, Any]) -> Dict[str, Any]:
+    """MongoClient keyword arguments for the pool and timeout settings"""
+    return {
+        'maxPoolSize': config['MONGO_MAX_POOL_SIZE'],
+        'minPoolSize': config['MONGO_MIN_POOL_SIZE'],
+        'maxIdleTimeMS': config['MONGO_MAX_IDLE_TIME_MS'],
+        'waitQueueTimeoutMS': config['MONGO_WAIT_QUEUE_TIMEOUT_MS'],
+        'connectTimeoutMS': config['MONGO_CONNECT_TIMEOUT_MS'],
+        'serverSelectionTimeoutMS': config['MONGO_SERVER_SELECTION_TIMEOUT_MS'],
+        'socketTimeoutMS': config['MONGO_SOCKET_TIMEOUT_MS'],
+    }
+
+
+class MongoState:
+    """The client for one app in one process.
+
+    The client is created on first use rather than at import time, and
+    again in any process forked after that (e.g. pre-fork WSGI workers),
+    since a MongoClient must not be shared across fork.
+    """
+
+    def __init__(self, config: Mapping[str, Any]):
+        self.config = config
+        self.db_name = config['MONGO_DB']
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+        self._indexed = set()
+        # pymongo event listeners for clients created from now on
+        self.listeners: List[Any] = []
+
+    @property
+    def client(self) -> MongoClient:
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    # Never close a client inherited from the parent; its
+                    # sockets still belong to the parent process
+                    self._client = make_client(self.config, self.listeners)
+                    self._pid = os.getpid()
+                    self._indexed = set()
+        return self._client
+
+    @property
+    def db(self):
+        return self.client[self.db_name]
+
+    def collection(self, name: str):
+        """Return a collection, creating its indexes on first use"""
+        coll = self.db[name]
+        if name not in self._indexed and name in COLLECTION_INDEXES:
+            coll.create_indexes(COLLECTION_INDEXES[name])
+            self._indexed.add(name)
+        return coll
+
+    def __getitem__(self, name: str):
+        # Lets helpers that take a Database use indexed collections
+        return self.collection(name)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+
+
+class Mongo:
+    """Flask extension giving request handlers the current app's MongoState"""
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions['mongo'] = MongoState(app.config)
+
+    @property
+    def state(self) -> MongoState:
+        return current_app.extensions['mongo']
+
+    @property
+    def db(self):
+        return self.state.db
+
+    def collection(self, name: str):
+        return self.state.collection(name)
+
+    def __getitem__(self, name: str):
+        return self.state[name]
+
+
+mongo = Mongo()
@@ -0,0 +1,157 @@
+"""
+Period buckets: per (user, type, period, start) ledger totals for the
+current day, week, month and year, kept up to date with $inc on every
+ledger write like the monthly rollups. Budget goals read the buckets of
+the periods they cover in a single indexed query.
+
+Weeks start on Monday.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Tuple
+
+from pymongo import ASCENDING, IndexModel, UpdateOne
+
+from backend.rollups import LEDGER_COLLECTIONS
+
+PERIODS = ('daily', 'weekly', 'monthly', 'yearly')
+
+PERIOD_INDEXES = [
+    IndexModel([('user', ASCENDING), ('period', ASCENDING),
+                ('start', ASCENDING), ('type', ASCENDING)],
+               name='user_period_start_type', unique=True),
+]
+
+# (user, type, period, start)
+Key = Tuple[str, str, str, datetime]
+
+
+def period_start(date: datetime, period: str) -> datetime:
+    """Truncate a date to the start of its day, week, month or year"""
+    day = datetime(date.year, date.month, date.day)
+    if period == 'daily':
+        return day
+    if period == 'weekly':
+        return day - timedelta(days=day.weekday())
+    if period == 'monthly':
+        return day.replace(day=1)
+    return day.replace(month=1, day=1)
+
+
+def period_end(start: datetime, period: str) -> datetime:
+    """The last day of the period starting at `start`"""
+    if period == 'daily':
+        return start
+    if period == 'weekly':
+        return start + timedelta(days=6)
+    if period == 'monthly':
+        following = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+        return following - timedelta(days=1)
+    return datetime(start.year, 12, 31)
+
+
+def _keys(type_: str, entry: Dict[str, Any]) -> List[Key]:
+    return [(entry['user'], type_, period, period_start(entry['date'], period))
+            for period in PERIODS]
+
+
+def _inc(key: Key, total: float, count: int) -> UpdateOne:
+    user, type_, period, start = key
+    return UpdateOne({'user': user, 'type': type_, 'period': period, 'start': start},
+                     {'$inc': {'total': total, 'count': count}}, upsert=True)
+
+
+def insert_ops(type_: str, entry: Dict[str, Any]) -> List[UpdateOne]:
+    """Bucket updates for a new ledger entry"""
+    return [_inc(key, entry['value'], 1) for key in _keys(type_, entry)]
+
+
+def delete_ops(type_: str, entry: Dict[str, Any]) -> List[UpdateOne]:
+    """Bucket updates for a deleted ledger entry"""
+    return [_inc(key, -entry['value'], -1) for key in _keys(type_, entry)]
+
+
+def update_ops(type_: str, old: Dict[str, Any], new: Dict[str, Any]) -> List[UpdateOne]:
+    """Bucket updates that move an edited entry's value between buckets"""
+    ops = []
+    for old_key, new_key in zip(_keys(type_, old), _keys(type_, new)):
+        if old_key == new_key:
+            if new['value'] != old['value']:
+                ops.append(_inc(new_key, new['value'] - old['value'], 0))
+        else:
+            ops += [_inc(old_key, -old['value'], -1), _inc(new_key, new['value'], 1)]
+    return ops
+
+
+def batch_ops(type_: str, entries: Iterable[Dict[str, Any]]) -> List[UpdateOne]:
+    """Bucket updates for a batch of new entries, one per touched bucket"""
+    return replace_ops(type_, [], entries)
+
+
+def replace_ops(type_: str, old: Iterable[Dict[str, Any]],
+                new: Iterable[Dict[str, Any]]) -> List[UpdateOne]:
+    """Bucket updates for a batch of entries written over the `old` ones,
+    one per bucket whose total or count changes"""
+    deltas: Dict[Key, List[Any]] = defaultdict(lambda: [0.0, 0])
+    for sign, entries in ((-1, old), (1, new)):
+        for entry in entries:
+            for key in _keys(type_, entry):
+                delta = deltas[key]
+                delta[0] += sign * entry['value']
+                delta[1] += sign
+    return [_inc(key, total, count) for key, (total, count) in deltas.items()
+            if total or count]
+
+
+def apply(collection, ops: List[UpdateOne]) -> None:
+    """Write bucket updates in one round trip"""
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+
+
+def record_insert(collection, type_: str, entry: Dict[str, Any]) -> None:
+    apply(collection, insert_ops(type_, entry))
+
+
+def record_delete(collection, type_: str, entry: Dict[str, Any]) -> None:
+    apply(collection, delete_ops(type_, entry))
+
+
+def record_update(collection, type_: str, old: Dict[str, Any],
+                  new: Dict[str, Any]) -> None:
+    apply(collection, update_ops(type_, old, new))
+
+
+def record_many(collection, type_: str, entries: Iterable[Dict[str, Any]]) -> None:
+    apply(collection, batch_ops(type_, entries))
+
+
+def record_replaced(collection, type_: str, old: Iterable[Dict[str, Any]],
+                    new: Iterable[Dict[str, Any]]) -> None:
+    apply(collection, replace_ops(type_, old, new))
+
+
+def current_totals(collection, user: str, today: datetime,
+                   periods: Iterable[str] = PERIODS) -> Dict[Tuple[str, str], float]:
+    """Totals of the periods containing today, keyed by (type, period).
+
+    All periods are read in one query on the (user, period, start) index.
+    """
+    wanted = [{'period': period, 'start': period_start(today, period)}
+              for period in set(periods)]
+    totals: Dict[Tuple[str, str], float] = {}
+    if not wanted:
+        return totals
+    for doc in collection.find({'user': user, '$or': wanted},
+                               {'type': 1, 'period': 1, 'total': 1}):
+        totals[doc['type'], doc['period']] = doc['total']
+    return totals
+
+
+def rebuild(db, user: str) -> None:
+    """Recompute a user's buckets from the raw ledgers"""
+    collection = db['period_totals']
+    collection.delete_many({'user': user})
+    for type_, name in LEDGER_COLLECTIONS.items():
+        entries = db[name].find({'user': user}, {'user': 1, 'date': 1, 'value': 1})
+        apply(collection, batch_ops(type_, entries))
@@ -0,0 +1,184 @@
+"""
+Recurring payments: validation and the occurrence expansion engine.
+
+Occurrences inside a window are computed directly from the start date
+(the n-th monthly occurrence is start + n months, clamped to the end of
+the month) instead of stepping a date forward from the start, so there
+is no drift (Jan 31 -> Feb 29 -> Mar 31) and the cost only depends on
+the number of occurrences inside the window.
+"""
+import calendar
+import heapq
+import itertools
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from pymongo import ASCENDING, IndexModel
+
+from backend.ledger import DATE_FORMAT, ValidationError, parse_date
+
+FREQUENCIES = ('daily', 'weekly', 'monthly', 'yearly')
+TYPES = ('expense', 'income')
+DEFAULT_LIMIT = 10000
+MAX_LIMIT = 100000
+MAX_WINDOW_DAYS = 366 * 10
+
+RECURRING_INDEXES = [
+    IndexModel([('user', ASCENDING), ('_id', ASCENDING)], name='user_id'),
+]
+
+# Fields returned by the API, and projected when reading payments
+FIELDS = ('type', 'category', 'value', 'startDate', 'frequency',
+          'description', 'reminders')
+
+
+def parse_payment(data: Any) -> Dict[str, Any]:
+    """Validate a request body and return the fields to store"""
+    if not isinstance(data, dict):
+        raise ValidationError('payment must be a JSON object')
+    if data.get('type') not in TYPES:
+        raise ValidationError('type must be expense or income')
+    category = data.get('category')
+    if not isinstance(category, str) or not category:
+        raise ValidationError('category is required')
+    value = data.get('value')
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValidationError('value must be a number')
+    if data.get('frequency') not in FREQUENCIES:
+        raise ValidationError('frequency must be one of %s' % ', '.join(FREQUENCIES))
+    start = parse_date(data.get('startDate'))
+    reminders = data.get('reminders') or []
+    if not isinstance(reminders, list) or not all(
+            isinstance(r, dict) and all(isinstance(r.get(k, 0), (int, float))
+                                        for k in ('days', 'hours'))
+            for r in reminders):
+        raise ValidationError('reminders must be a list of {days, hours}')
+    return {
+        'type': data['type'],
+        'category': category,
+        'value': float(value),
+        'startDate': start.strftime(DATE_FORMAT),
+        'frequency': data['frequency'],
+        'description': str(data.get('description') or ''),
+        'reminders': [{'days': r.get('days', 0), 'hours': r.get('hours', 0)}
+                      for r in reminders],
+    }
+
+
+def serialize_payment(doc: Dict[str, Any]) -> Dict[str, Any]:
+    result = {'id': str(doc['_id'])}
+    result.update((field, doc.get(field)) for field in FIELDS)
+    return result
+
+
+def add_months(start: date, months: int) -> date:
+    """start + months, clamped to the last day of the target month"""
+    month_index = start.month - 1 + months
+    year, month = start.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
+
+
+def nth_occurrence(start: date, frequency: str, n: int) -> date:
+    """The n-th occurrence (0 is the start date itself)"""
+    if frequency == 'daily':
+        return start + timedelta(days=n)
+    if frequency == 'weekly':
+        return start + timedelta(days=7 * n)
+    if frequency == 'monthly':
+        return add_months(start, n)
+    return add_months(start, 12 * n)
+
+
+def first_index(start: date, frequency: str, window_start: date) -> int:
+    """Index of the first occurrence on or after window_start"""
+    if window_start <= start:
+        return 0
+    if frequency in ('daily', 'weekly'):
+        step = 1 if frequency == 'daily' else 7
+        return -(-(window_start - start).days // step)
+    months = (window_start.year - start.year) * 12 + window_start.month - start.month
+    n = months if frequency == 'monthly' else months // 12
+    if nth_occurrence(start, frequency, n) < window_start:
+        n += 1
+    return n
+
+
+def _ordinals(start: date, frequency: str, window_start: date,
+              window_end: date) -> Iterator[int]:
+    """Occurrences in [window_start, window_end] as proleptic ordinals"""
+    n = first_index(start, frequency, window_start)
+    if frequency in ('daily', 'weekly'):
+        step = 1 if frequency == 'daily' else 7
+        return iter(range(nth_occurrence(start, frequency, n).toordinal(),
+                          window_end.toordinal() + 1, step))
+    return _calendar_ordinals(start, frequency, n, window_end)
+
+
+def _calendar_ordinals(start: date, frequency: str, n: int,
+                       window_end: date) -> Iterator[int]:
+    while True:
+        when = nth_occurrence(start, frequency, n)
+        if when > window_end:
+            return
+        yield when.toordinal()
+        n += 1
+
+
+def occurrences(start: date, frequency: str, window_start: date,
+                window_end: date) -> Iterator[date]:
+    """Occurrence dates in [window_start, window_end], in order"""
+    return map(date.fromordinal, _ordinals(start, frequency, window_start, window_end))
+
+
+def payment_start(payment: Dict[str, Any]) -> date:
+    """The start date of a stored payment"""
+    return datetime.strptime(payment['startDate'], DATE_FORMAT).date()
+
+
+def expand(payments: List[Dict[str, Any]], window_start: date, window_end: date,
+           limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Merge every payment's occurrences into one date-ordered stream.
+
+    Each payment contributes an ordered stream of (ordinal, position)
+    tuples; heapq.merge keeps one head per payment on a heap, so merging
+    k payments costs O(log k) per occurrence and stops as soon as limit
+    occurrences have been produced.
+    """
+    streams = []
+    fields = []
+    for payment in payments:
+        ordinals = _ordinals(payment_start(payment), payment['frequency'],
+                             window_start, window_end)
+        streams.append(zip(ordinals, itertools.repeat(len(fields))))
+        fields.append({
+            'payment_id': str(payment['_id']),
+            'type': payment.get('type'),
+            'category': payment.get('category'),
+            'value': payment.get('value'),
+            'description': payment.get('description', ''),
+        })
+    labels: Dict[int, str] = {}
+    for ordinal, position in itertools.islice(heapq.merge(*streams), limit):
+        label = labels.get(ordinal)
+        if label is None:
+            label = labels[ordinal] = date.fromordinal(ordinal).isoformat()
+        yield {'date': label, **fields[position]}
+
+
+def parse_window(args) -> tuple:
+    """Parse ?from=, ?to= (default: one year from today) and ?limit="""
+    window_start = (parse_date(args['from']).date() if 'from' in args
+                    else date.today())
+    window_end = (parse_date(args['to']).date() if 'to' in args
+                  else add_months(window_start, 12))
+    if window_end < window_start:
+        raise ValidationError('to must not be before from')
+    if (window_end - window_start).days > MAX_WINDOW_DAYS:
+        raise ValidationError('window must be at most %d days' % MAX_WINDOW_DAYS)
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ValidationError('limit must be an integer')
+    if limit < 1:
+        raise ValidationError('limit must be positive')
+    return window_start, window_end, min(limit, MAX_LIMIT)
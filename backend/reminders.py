@@ -0,0 +1,225 @@
+"""
+Reminder scheduler: fires due reminders of recurring payments.
+
+Each (payment, reminder) pair has one document in `reminder_schedule`
+holding its next fire time, indexed on `fire_at`. The worker pops due
+entries in `fire_at` order a batch at a time, delivers them (by default
+into `notifications`) and moves each entry to its following occurrence.
+Creating, editing or deleting a payment only rewrites that payment's
+entries.
+
+Times are naive UTC; an occurrence is due at midnight of its date and a
+reminder fires `days`/`hours` before that.
+
+Usage:
+    python -m backend.reminders [--once] [--batch-size N] [--poll-interval SECONDS]
+"""
+import argparse
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pymongo import (ASCENDING, DESCENDING, DeleteMany, DeleteOne, IndexModel,
+                     MongoClient, ReplaceOne, UpdateOne)
+
+from backend import recurring
+from backend.config import Config
+from backend.ledger import DATE_FORMAT
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_POLL_INTERVAL = 60.0
+# Longest gap between two occurrences (yearly), twice over, so the next
+# occurrence after any instant is always inside the search window
+SEARCH_DAYS = 2 * 366
+
+SCHEDULE_INDEXES = [
+    IndexModel([('fire_at', ASCENDING)], name='fire_at'),
+    IndexModel([('user', ASCENDING), ('payment_id', ASCENDING),
+                ('reminder', ASCENDING)],
+               name='user_payment_reminder', unique=True),
+]
+NOTIFICATION_INDEXES = [
+    IndexModel([('user', ASCENDING), ('fire_at', DESCENDING)], name='user_fire_at'),
+]
+
+# Payment fields copied into each schedule entry, so firing an entry and
+# moving it on never has to read the payment
+PAYMENT_FIELDS = ('user', 'type', 'category', 'value', 'description', 'frequency')
+
+
+def reminder_offset(reminder: Dict[str, Any]) -> timedelta:
+    return timedelta(days=reminder.get('days') or 0, hours=reminder.get('hours') or 0)
+
+
+# Fields read by serialize_notification
+PROJECTION = {field: 1 for field in ('payment_id', 'type', 'category', 'value',
+                                     'description', 'occurs_at', 'fire_at')}
+
+
+def serialize_notification(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': str(doc['_id']),
+        'payment_id': str(doc['payment_id']),
+        'type': doc.get('type'),
+        'category': doc.get('category'),
+        'value': doc.get('value'),
+        'description': doc.get('description'),
+        'date': doc['occurs_at'].strftime(DATE_FORMAT),
+        'fire_at': doc['fire_at'].isoformat(),
+    }
+
+
+def next_fire(start: date, frequency: str, offset: timedelta,
+              after: datetime) -> Optional[Tuple[datetime, datetime]]:
+    """(occurrence, fire time) of the first reminder that fires after `after`"""
+    window_start = (after + offset).date()
+    window_end = window_start + timedelta(days=SEARCH_DAYS)
+    for when in recurring.occurrences(start, frequency, window_start, window_end):
+        occurs_at = datetime(when.year, when.month, when.day)
+        if occurs_at - offset > after:
+            return occurs_at, occurs_at - offset
+    return None
+
+
+def schedule_ops(payment: Dict[str, Any], now: datetime) -> List[Any]:
+    """Write operations that replace one payment's schedule entries"""
+    start = recurring.payment_start(payment)
+    reminders = payment.get('reminders') or []
+    owner = {'user': payment['user'], 'payment_id': payment['_id']}
+    ops: List[Any] = [DeleteMany(dict(owner, reminder={'$gte': len(reminders)}))]
+    for index, reminder in enumerate(reminders):
+        key = dict(owner, reminder=index)
+        offset = reminder_offset(reminder)
+        upcoming = next_fire(start, payment['frequency'], offset, now)
+        if upcoming is None:
+            ops.append(DeleteOne(key))
+            continue
+        entry = dict(key, start=datetime(start.year, start.month, start.day),
+                     offset=offset.total_seconds(), occurs_at=upcoming[0],
+                     fire_at=upcoming[1])
+        entry.update((field, payment.get(field)) for field in PAYMENT_FIELDS)
+        ops.append(ReplaceOne(key, entry, upsert=True))
+    return ops
+
+
+def schedule(collection, payment: Dict[str, Any], now: datetime) -> None:
+    """Reschedule one payment after it was created or edited"""
+    collection.bulk_write(schedule_ops(payment, now), ordered=False)
+
+
+def unschedule(collection, user: str, payment_id) -> None:
+    """Drop the schedule of a deleted payment"""
+    collection.delete_many({'user': user, 'payment_id': payment_id})
+
+
+def rebuild(db, user: str, now: datetime) -> None:
+    """Recreate a user's schedule from their recurring payments"""
+    collection = db['reminder_schedule']
+    collection.delete_many({'user': user})
+    # The schedule was just emptied, so skip each payment's DeleteMany
+    ops = [op for payment in db['recurring_payments'].find({'user': user})
+           for op in schedule_ops(payment, now)[1:]]
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+
+
+class Scheduler:
+    """Pops due schedule entries in batches and hands them to `deliver`.
+
+    `clock` returns the current naive UTC time; tests pass a fake one.
+    Run a single worker per database: entries are moved on after they
+    are delivered, so two workers could deliver the same entry.
+    """
+
+    def __init__(self, db, clock: Callable[[], datetime] = datetime.utcnow,
+                 deliver: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        self.schedule = db['reminder_schedule']
+        self.notifications = db['notifications']
+        self.clock = clock
+        self.deliver = deliver or self.notify
+        self.batch_size = batch_size
+
+    def notify(self, entries: List[Dict[str, Any]]) -> None:
+        """Default delivery: store one notification per fired reminder"""
+        self.notifications.insert_many([{
+            'user': entry['user'],
+            'payment_id': entry['payment_id'],
+            'type': entry.get('type'),
+            'category': entry.get('category'),
+            'value': entry.get('value'),
+            'description': entry.get('description'),
+            'occurs_at': entry['occurs_at'],
+            'fire_at': entry['fire_at'],
+        } for entry in entries])
+
+    def run_due(self) -> int:
+        """Fire every entry that is due now; return how many fired"""
+        fired = 0
+        while True:
+            now = self.clock()
+            batch = list(self.schedule.find({'fire_at': {'$lte': now}})
+                         .sort('fire_at', ASCENDING).limit(self.batch_size))
+            if not batch:
+                return fired
+            self.deliver(batch)
+            self.schedule.bulk_write([self._advance(entry, now) for entry in batch],
+                                     ordered=False)
+            fired += len(batch)
+
+    def _advance(self, entry: Dict[str, Any], now: datetime):
+        """Move an entry to its next fire time after now. Missed
+        occurrences (e.g. while the worker was down) are skipped.
+        The filter on fire_at leaves entries rescheduled by an edit alone."""
+        key = {'user': entry['user'], '_id': entry['_id'], 'fire_at': entry['fire_at']}
+        upcoming = next_fire(entry['start'].date(), entry['frequency'],
+                             timedelta(seconds=entry['offset']), now)
+        if upcoming is None:
+            return DeleteOne(key)
+        return UpdateOne(key, {'$set': {'occurs_at': upcoming[0],
+                                        'fire_at': upcoming[1]}})
+
+    def next_fire_at(self) -> Optional[datetime]:
+        entry = self.schedule.find_one({}, sort=[('fire_at', ASCENDING)])
+        return entry['fire_at'] if entry else None
+
+    def run_forever(self, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                    sleep: Callable[[float], None] = time.sleep,
+                    stop: Callable[[], bool] = lambda: False) -> None:
+        """Fire due entries, then sleep until the next one (or poll_interval,
+        whichever is sooner, so entries added by the app are picked up)"""
+        while not stop():
+            self.run_due()
+            upcoming = self.next_fire_at()
+            delay = poll_interval
+            if upcoming is not None:
+                delay = min(delay, max((upcoming - self.clock()).total_seconds(), 0))
+            sleep(delay)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the reminder scheduler worker')
+    parser.add_argument('--once', action='store_true',
+                        help='fire due reminders and exit')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL)
+    parser.add_argument('--uri', default=Config.MONGO_URI)
+    parser.add_argument('--db', default=Config.MONGO_DB)
+    args = parser.parse_args(argv)
+
+    db = MongoClient(args.uri)[args.db]
+    db['reminder_schedule'].create_indexes(SCHEDULE_INDEXES)
+    db['notifications'].create_indexes(NOTIFICATION_INDEXES)
+    scheduler = Scheduler(db, batch_size=args.batch_size)
+    if args.once:
+        print('%d reminder(s) fired' % scheduler.run_due())
+        return 0
+    try:
+        scheduler.run_forever(args.poll_interval)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,64 @@
+"""
+Report aggregations: category totals and monthly series for the charts
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+MONTH_FORMAT = '%Y-%m'
+
+
+def build_pipeline(user: str, start: Optional[datetime] = None,
+                   end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Aggregate one ledger collection into category and month totals"""
+    match: Dict[str, Any] = {'user': user}
+    date_range: Dict[str, Any] = {}
+    if start:
+        date_range['$gte'] = start
+    if end:
+        date_range['$lte'] = end
+    if date_range:
+        match['date'] = date_range
+    return [
+        {'$match': match},
+        {'$facet': {
+            'categories': [
+                {'$group': {'_id': '$category', 'total': {'$sum': '$value'}}},
+                {'$sort': {'total': -1, '_id': 1}},
+            ],
+            'months': [
+                {'$group': {
+                    '_id': {'$dateTrunc': {'date': '$date', 'unit': 'month'}},
+                    'total': {'$sum': '$value'},
+                }},
+                {'$sort': {'_id': 1}},
+            ],
+        }},
+    ]
+
+
+def summarize(collection, user: str, start: Optional[datetime] = None,
+              end: Optional[datetime] = None) -> Dict[str, Any]:
+    """Run the report pipeline against one ledger collection"""
+    result = next(collection.aggregate(build_pipeline(user, start, end)))
+    return {
+        'categories': [{'category': row['_id'], 'total': row['total']}
+                       for row in result['categories']],
+        'months': {row['_id'].strftime(MONTH_FORMAT): row['total']
+                   for row in result['months']},
+    }
+
+
+def build_report(expenses: Dict[str, Any], incomes: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape two summaries into the pie and line chart series"""
+    months = sorted(set(expenses['months']) | set(incomes['months']))
+    return {
+        'categories': {
+            'expenses': expenses['categories'],
+            'incomes': incomes['categories'],
+        },
+        'monthly': {
+            'labels': months,
+            'expenses': [expenses['months'].get(m, 0) for m in months],
+            'incomes': [incomes['months'].get(m, 0) for m in months],
+        },
+    }
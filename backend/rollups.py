@@ -0,0 +1,247 @@
+"""
+Monthly rollups: per (user, type, category, month) totals kept up to date
+with atomic $inc on every ledger write, plus a verify/rebuild command.
+
+The ledger write and its $inc are separate operations, so a crash between
+them leaves the rollups off by one entry; `verify` reports such drift and
+`rebuild` repairs it from the raw ledger.
+
+Usage:
+    python -m backend.rollups verify [--user USER]
+    python -m backend.rollups rebuild [--user USER]
+"""
+import argparse
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, IndexModel, MongoClient, UpdateOne
+
+from backend.config import Config
+
+MONTH_FORMAT = '%Y-%m'
+
+# Ledger collection behind each rollup type
+LEDGER_COLLECTIONS = {
+    'expense': 'expenses',
+    'income': 'incomes',
+}
+
+ROLLUP_INDEXES = [
+    IndexModel([('user', ASCENDING), ('type', ASCENDING),
+                ('month', ASCENDING), ('category', ASCENDING)],
+               name='user_type_month_category', unique=True),
+]
+
+# (user, type, category, month)
+Key = Tuple[str, str, str, datetime]
+
+
+def ensure_indexes(collection) -> None:
+    """Create the unique index that keys rollup documents"""
+    collection.create_indexes(ROLLUP_INDEXES)
+
+
+def month_start(date: datetime) -> datetime:
+    """Truncate a date to the first day of its month"""
+    return datetime(date.year, date.month, 1)
+
+
+def _key(type_: str, entry: Dict[str, Any]) -> Key:
+    return entry['user'], type_, entry['category'], month_start(entry['date'])
+
+
+def _filter(key: Key) -> Dict[str, Any]:
+    user, type_, category, month = key
+    return {'user': user, 'type': type_, 'category': category, 'month': month}
+
+
+def _inc(key: Key, total: float, count: int) -> UpdateOne:
+    return UpdateOne(_filter(key), {'$inc': {'total': total, 'count': count}},
+                     upsert=True)
+
+
+def insert_ops(type_: str, entry: Dict[str, Any]) -> List[UpdateOne]:
+    """Rollup updates for a new ledger entry"""
+    return [_inc(_key(type_, entry), entry['value'], 1)]
+
+
+def delete_ops(type_: str, entry: Dict[str, Any]) -> List[UpdateOne]:
+    """Rollup updates for a deleted ledger entry"""
+    return [_inc(_key(type_, entry), -entry['value'], -1)]
+
+
+def update_ops(type_: str, old: Dict[str, Any], new: Dict[str, Any]) -> List[UpdateOne]:
+    """Rollup updates that move an edited entry's value between rollups"""
+    old_key, new_key = _key(type_, old), _key(type_, new)
+    if old_key == new_key:
+        if new['value'] == old['value']:
+            return []
+        return [_inc(new_key, new['value'] - old['value'], 0)]
+    return [_inc(old_key, -old['value'], -1), _inc(new_key, new['value'], 1)]
+
+
+def batch_ops(type_: str, entries: Iterable[Dict[str, Any]]) -> List[UpdateOne]:
+    """Rollup updates for a batch of new entries, one per touched rollup"""
+    return replace_ops(type_, [], entries)
+
+
+def replace_ops(type_: str, old: Iterable[Dict[str, Any]],
+                new: Iterable[Dict[str, Any]]) -> List[UpdateOne]:
+    """Rollup updates for a batch of entries written over the `old` ones,
+    one per rollup whose total or count changes"""
+    deltas: Dict[Key, List[Any]] = defaultdict(lambda: [0.0, 0])
+    for sign, entries in ((-1, old), (1, new)):
+        for entry in entries:
+            delta = deltas[_key(type_, entry)]
+            delta[0] += sign * entry['value']
+            delta[1] += sign
+    return [_inc(key, total, count) for key, (total, count) in deltas.items()
+            if total or count]
+
+
+def apply(collection, ops: List[UpdateOne]) -> None:
+    """Write rollup updates in one round trip"""
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+
+
+def record_insert(collection, type_: str, entry: Dict[str, Any]) -> None:
+    apply(collection, insert_ops(type_, entry))
+
+
+def record_delete(collection, type_: str, entry: Dict[str, Any]) -> None:
+    apply(collection, delete_ops(type_, entry))
+
+
+def record_update(collection, type_: str, old: Dict[str, Any],
+                  new: Dict[str, Any]) -> None:
+    apply(collection, update_ops(type_, old, new))
+
+
+def record_many(collection, type_: str, entries: Iterable[Dict[str, Any]]) -> None:
+    apply(collection, batch_ops(type_, entries))
+
+
+def record_replaced(collection, type_: str, old: Iterable[Dict[str, Any]],
+                    new: Iterable[Dict[str, Any]]) -> None:
+    apply(collection, replace_ops(type_, old, new))
+
+
+def is_month_aligned(start: Optional[datetime], end: Optional[datetime]) -> bool:
+    """Whether a date range covers whole months, so rollups can answer it"""
+    if start and start.day != 1:
+        return False
+    if end:
+        following = datetime(end.year + end.month // 12, end.month % 12 + 1, 1)
+        if (following - end).days != 1:
+            return False
+    return True
+
+
+def summarize(collection, user: str, type_: str, start: Optional[datetime] = None,
+              end: Optional[datetime] = None) -> Dict[str, Any]:
+    """Build a report summary (see reports.summarize) from rollup documents"""
+    query: Dict[str, Any] = {'user': user, 'type': type_, 'count': {'$gt': 0}}
+    month_range: Dict[str, Any] = {}
+    if start:
+        month_range['$gte'] = month_start(start)
+    if end:
+        month_range['$lte'] = month_start(end)
+    if month_range:
+        query['month'] = month_range
+    categories: Dict[str, float] = defaultdict(float)
+    months: Dict[str, float] = defaultdict(float)
+    for doc in collection.find(query, {'category': 1, 'month': 1, 'total': 1}):
+        categories[doc['category']] += doc['total']
+        months[doc['month'].strftime(MONTH_FORMAT)] += doc['total']
+    ordered = sorted(categories.items(), key=lambda item: (-item[1], item[0]))
+    return {
+        'categories': [{'category': c, 'total': t} for c, t in ordered],
+        'months': dict(months),
+    }
+
+
+def _expected(db, user: Optional[str]) -> Dict[Key, Tuple[float, int]]:
+    """Recompute rollup totals from the raw ledgers"""
+    expected = {}
+    match = {'user': user} if user else {}
+    for type_, name in LEDGER_COLLECTIONS.items():
+        pipeline = [
+            {'$match': match},
+            {'$group': {
+                '_id': {
+                    'user': '$user',
+                    'category': '$category',
+                    'month': {'$dateTrunc': {'date': '$date', 'unit': 'month'}},
+                },
+                'total': {'$sum': '$value'},
+                'count': {'$sum': 1},
+            }},
+        ]
+        for row in db[name].aggregate(pipeline):
+            group = row['_id']
+            key = (group['user'], type_, group['category'], group['month'])
+            expected[key] = (row['total'], row['count'])
+    return expected
+
+
+def _differs(actual: Tuple[float, int], expected: Tuple[float, int]) -> bool:
+    # Totals are float sums built up in a different order, so allow for rounding
+    tolerance = 1e-6 * max(1.0, abs(expected[0]))
+    return actual[1] != expected[1] or abs(actual[0] - expected[0]) > tolerance
+
+
+def verify(db, user: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Compare stored rollups with the raw ledgers and return any drift"""
+    expected = _expected(db, user)
+    actual = {}
+    for doc in db['monthly_rollups'].find({'user': user} if user else {}):
+        key = (doc['user'], doc['type'], doc['category'], doc['month'])
+        actual[key] = (doc.get('total', 0), doc.get('count', 0))
+    drift = []
+    for key in sorted(set(expected) | set(actual), key=str):
+        want = expected.get(key, (0, 0))
+        have = actual.get(key, (0, 0))
+        if _differs(have, want):
+            drift.append(dict(_filter(key), expected_total=want[0],
+                              expected_count=want[1], total=have[0], count=have[1]))
+    return drift
+
+
+def rebuild(db, user: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Repair every drifted rollup from the raw ledgers; returns what changed"""
+    drift = verify(db, user)
+    if drift:
+        db['monthly_rollups'].bulk_write([
+            UpdateOne({k: d[k] for k in ('user', 'type', 'category', 'month')},
+                      {'$set': {'total': d['expected_total'],
+                                'count': d['expected_count']}},
+                      upsert=True)
+            for d in drift
+        ], ordered=False)
+    return drift
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Verify or rebuild monthly rollups')
+    parser.add_argument('command', choices=['verify', 'rebuild'])
+    parser.add_argument('--user', help='only check this user')
+    parser.add_argument('--uri', default=Config.MONGO_URI)
+    parser.add_argument('--db', default=Config.MONGO_DB)
+    args = parser.parse_args(argv)
+
+    db = MongoClient(args.uri)[args.db]
+    ensure_indexes(db['monthly_rollups'])
+    drift = (rebuild if args.command == 'rebuild' else verify)(db, args.user)
+    for d in drift:
+        print('%s %s %s %s: total %s (expected %s), count %s (expected %s)' % (
+            d['user'], d['type'], d['category'], d['month'].strftime(MONTH_FORMAT),
+            d['total'], d['expected_total'], d['count'], d['expected_count']))
+    action = 'repaired' if args.command == 'rebuild' else 'drifted'
+    print('%d rollup(s) %s' % (len(drift), action))
+    return 1 if drift and args.command == 'verify' else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,66 @@
+"""
+Shards every collection on a hashed `user` key.
+
+Each document carries the `user` it belongs to and every request filters
+on it, so with {user: 'hashed'} a request is routed to the one shard
+holding that tenant, and tenants spread evenly however their ids are
+assigned. Unique indexes all start with `user`, which a sharded cluster
+requires. The only cross-tenant query is the reminder worker's scan of
+due entries, which goes to every shard.
+
+Usage:
+    python -m backend.sharding [--dry-run]
+"""
+import argparse
+from typing import Any, Dict, List
+
+from pymongo import HASHED, IndexModel, MongoClient
+
+from backend.config import Config
+from backend.mongo import COLLECTION_INDEXES
+
+SHARD_KEY = {'user': HASHED}
+SHARD_KEY_INDEX = IndexModel([('user', HASHED)], name='user_hashed')
+
+# Collections without indexes of their own that are still per user
+EXTRA_COLLECTIONS = ('import_checkpoints',)
+
+
+def sharded_collections() -> List[str]:
+    return sorted(set(COLLECTION_INDEXES) | set(EXTRA_COLLECTIONS))
+
+
+def shard_commands(db_name: str) -> List[Dict[str, Any]]:
+    """Admin commands that shard the database, in order"""
+    commands: List[Dict[str, Any]] = [{'enableSharding': db_name}]
+    commands += [{'shardCollection': '%s.%s' % (db_name, name), 'key': SHARD_KEY}
+                 for name in sharded_collections()]
+    return commands
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Shard collections on a hashed user key')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='print the admin commands instead of running them')
+    parser.add_argument('--uri', default=Config.MONGO_URI)
+    parser.add_argument('--db', default=Config.MONGO_DB)
+    args = parser.parse_args(argv)
+
+    commands = shard_commands(args.db)
+    if args.dry_run:
+        for command in commands:
+            print(command)
+        return 0
+    client = MongoClient(args.uri)
+    db = client[args.db]
+    for name in sharded_collections():
+        # Existing collections need the shard key index before sharding
+        db[name].create_indexes(COLLECTION_INDEXES.get(name, []) + [SHARD_KEY_INDEX])
+    for command in commands:
+        client.admin.command(command)
+        print('ok', command)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,574 @@
+"""
+SQLite storage behind the pymongo collection API, for small self-hosted
+deployments and for running the app without a MongoDB server.
+
+With DATABASE_BACKEND=sqlite, `mongo.collection(name)` returns a
+SQLiteCollection, so the routes, store helpers, importer and rollup
+commands run unchanged. One file holds one database.
+
+Each collection is a table of documents stored as JSON, plus one column
+per field that an index names. Those columns are filled by SQL from the
+JSON on every write, and the indexes are built on them from the same
+IndexModels as MongoDB (the ledgers also get REPORT_INDEXES, which cover
+the report queries). Dates and ObjectIds are stored as tagged strings
+that sort like the originals.
+
+Filters are narrowed in SQL where a condition maps onto a column and
+then checked in Python with backend.docquery, so results follow MongoDB's
+matching rules; querying an array field by element is not supported.
+Pipelines that only $match and $group by fields, such as the reports and
+rollup verification, run as one GROUP BY statement.
+
+The database runs in WAL mode, so readers do not wait for the writer.
+Every thread has its own connection, and the sqlite3 statement cache
+keeps the (deterministic) SQL for each query shape prepared.
+"""
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError
+
+from backend import docquery
+from backend.documents import DocumentCollection
+
+STATEMENT_CACHE = 256
+FETCH_SIZE = 256
+
+_DATE = '\x01d'
+_OBJECT_ID = '\x01o'
+# Tagged values of one type sort between their tag and the next character
+_TAG_RANGES = {datetime: (_DATE, '\x01e'), ObjectId: (_OBJECT_ID, '\x01p')}
+
+# Covering indexes for the report and rollup aggregations
+REPORT_INDEXES = [
+    IndexModel([('user', ASCENDING), ('date', ASCENDING), ('category', ASCENDING),
+                ('value', ASCENDING)], name='report'),
+]
+EXTRA_INDEXES: Dict[str, List[IndexModel]] = {
+    'expenses': REPORT_INDEXES,
+    'incomes': REPORT_INDEXES,
+}
+
+
+# Encoding
+
+def encode(value: Any) -> Any:
+    """A scalar as stored in SQLite (and inside the JSON documents)"""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        # MongoDB keeps milliseconds
+        value = value.replace(microsecond=value.microsecond // 1000 * 1000)
+        return _DATE + value.isoformat(timespec='microseconds')
+    if isinstance(value, ObjectId):
+        return _OBJECT_ID + str(value)
+    return value
+
+
+def _default(value: Any) -> Any:
+    encoded = encode(value)
+    if encoded is value:
+        raise TypeError('cannot store %r' % type(value).__name__)
+    return encoded
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, str) and value[:1] == '\x01':
+        if value.startswith(_DATE):
+            return datetime.fromisoformat(value[2:])
+        if value.startswith(_OBJECT_ID):
+            return ObjectId(value[2:])
+    elif isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def _decode_object(obj: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: _decode(value) for key, value in obj.items()}
+
+
+def dumps(doc: Mapping[str, Any]) -> str:
+    return json.dumps(doc, default=_default, separators=(',', ':'))
+
+
+def loads(text: str) -> Dict[str, Any]:
+    return json.loads(text, object_hook=_decode_object)
+
+
+def _quote(name: str) -> str:
+    return '"%s"' % name.replace('"', '""')
+
+
+def _json_path(path: str) -> str:
+    return '$' + ''.join('."%s"' % part for part in path.split('.'))
+
+
+def _column_name(path: str) -> str:
+    return 'f.' + path
+
+
+# Filters to SQL. Conditions that have no SQL form are left to Python;
+# `exact` tells whether the SQL alone selects exactly the matching rows.
+
+class _Where:
+    def __init__(self, columns: Mapping[str, str]):
+        self.columns = columns
+        self.params: List[Any] = []
+        self.exact = True
+
+    def column(self, path: str) -> str:
+        if path == '_id':
+            return '_id'
+        if path in self.columns:
+            return self.columns[path]
+        return 'json_extract(doc, %s)' % ("'%s'" % _json_path(path).replace("'", "''"))
+
+    def query(self, query: Optional[Mapping[str, Any]]) -> List[str]:
+        parts: List[str] = []
+        for key, condition in (query or {}).items():
+            if key == '$and':
+                for branch in condition:
+                    parts.extend(self.query(branch))
+            elif key == '$or':
+                # A branch without SQL conditions matches any row
+                branches = [' AND '.join(self.query(branch)) for branch in condition]
+                if branches and all(branches):
+                    parts.append('(%s)' % ' OR '.join(branches))
+            elif key.startswith('$'):
+                self.exact = False
+            else:
+                parts.extend(self.field(key, condition))
+        return parts
+
+    def _scalar(self, value: Any) -> bool:
+        return isinstance(value, (str, int, float, datetime, ObjectId)) \
+            and not isinstance(value, bool)
+
+    def _equal(self, column: str, value: Any) -> Optional[str]:
+        if value is None:
+            return '%s IS NULL' % column
+        if not self._scalar(value):
+            return None
+        self.params.append(encode(value))
+        return '%s = ?' % column
+
+    def _guard(self, column: str, value: Any) -> Optional[str]:
+        """Restrict a range to values of the bound's type"""
+        for type_, (low, high) in _TAG_RANGES.items():
+            if isinstance(value, type_):
+                self.params.extend((low, high))
+                return '%s >= ? AND %s < ?' % (column, column)
+        if isinstance(value, (int, float)):
+            return "typeof(%s) IN ('integer', 'real')" % column
+        self.params.append('\x02')
+        return "typeof(%s) = 'text' AND %s >= ?" % (column, column)
+
+    def field(self, path: str, condition: Any) -> List[str]:
+        column = self.column(path)
+        if not docquery.is_operators(condition):
+            condition = {'$eq': condition}
+        parts = []
+        for op, value in condition.items():
+            part = None
+            if op == '$eq':
+                part = self._equal(column, value)
+            elif op in _RANGE_OPS and self._scalar(value):
+                guard = self._guard(column, value)
+                self.params.append(encode(value))
+                part = '%s AND %s %s ?' % (guard, column, _RANGE_OPS[op])
+            elif op == '$in' and all(v is None or self._scalar(v) for v in value):
+                values = [encode(v) for v in value if v is not None]
+                alternatives = []
+                if values:
+                    alternatives.append('%s IN (%s)' % (column, ', '.join('?' * len(values))))
+                    self.params.extend(values)
+                if len(values) < len(value):
+                    alternatives.append('%s IS NULL' % column)
+                part = '(%s)' % ' OR '.join(alternatives) if alternatives else '0'
+            if part is None:
+                self.exact = False
+            else:
+                parts.append(part)
+        return parts
+
+
+_RANGE_OPS = {'$gt': '>', '$gte': '>=', '$lt': '<', '$lte': '<='}
+
+
+class SQLiteCollection(DocumentCollection):
+    """A table of JSON documents with the pymongo collection methods the app uses"""
+
+    def __init__(self, database: 'SQLiteDatabase', name: str):
+        self.database = database
+        self.name = name
+        self.full_name = '%s.%s' % (database.name, name)
+        self.table = _quote(name)
+        self.client = database.client
+        self.columns: Dict[str, str] = {}
+        self._ensure_table()
+
+    def __repr__(self) -> str:
+        return 'SQLiteCollection(%r)' % self.full_name
+
+    def with_options(self, **kwargs) -> 'SQLiteCollection':
+        # Every commit is durable at synchronous=NORMAL in WAL mode
+        return self
+
+    # Schema
+
+    def _ensure_table(self) -> None:
+        with self.client.transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS %s (_id PRIMARY KEY, doc TEXT NOT NULL)'
+                         % self.table)
+            self._load_columns(conn)
+        for model in EXTRA_INDEXES.get(self.name, ()):
+            self.create_indexes([model])
+
+    def _load_columns(self, conn) -> None:
+        # Another process may have added columns since
+        for row in conn.execute('PRAGMA table_info(%s)' % self.table):
+            if row[1].startswith('f.'):
+                self.columns[row[1][2:]] = _quote(row[1])
+
+    def _add_column(self, conn, path: str) -> None:
+        column = _quote(_column_name(path))
+        conn.execute('ALTER TABLE %s ADD COLUMN %s' % (self.table, column))
+        conn.execute('UPDATE %s SET %s = json_extract(doc, ?)' % (self.table, column),
+                     (_json_path(path),))
+        self.columns[path] = column
+
+    def create_indexes(self, models: Sequence[IndexModel]) -> List[str]:
+        names = []
+        with self.client.transaction() as conn:
+            self._load_columns(conn)
+            for model in models:
+                spec = model.document
+                keys = list(spec['key'].items())
+                columns = []
+                for path, direction in keys:
+                    if path != '_id' and path not in self.columns:
+                        self._add_column(conn, path)
+                    column = '_id' if path == '_id' else self.columns[path]
+                    columns.append(column + (' DESC' if direction == -1 else ''))
+                name = spec.get('name') or '_'.join('%s_%s' % key for key in keys)
+                conn.execute('CREATE %sINDEX IF NOT EXISTS %s ON %s (%s)' % (
+                    'UNIQUE ' if spec.get('unique') else '',
+                    _quote('%s.%s' % (self.name, name)), self.table, ', '.join(columns)))
+                names.append(name)
+        return names
+
+    def drop(self) -> None:
+        self.database.drop_collection(self.name)
+
+    # Reads
+
+    def _select(self, query: Mapping[str, Any], sort: Sequence[Tuple[str, int]] = (),
+                conn=None, limit: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """(rowid, document) of every match, in `sort` order"""
+        where = _Where(self.columns)
+        parts = where.query(query)
+        sql = 'SELECT rowid, doc FROM %s' % self.table
+        if parts:
+            sql += ' WHERE ' + ' AND '.join(parts)
+        if sort:
+            sql += ' ORDER BY ' + ', '.join(
+                '%s %s' % (where.column(path), 'DESC' if direction == -1 else 'ASC')
+                for path, direction in sort)
+        if limit and where.exact:
+            sql += ' LIMIT %d' % limit
+        for rowid, text in self.client.rows(sql, where.params, conn):
+            doc = loads(text)
+            if where.exact or docquery.matches(doc, query):
+                yield rowid, doc
+
+    def estimated_document_count(self, **kwargs) -> int:
+        return next(iter(self.client.rows('SELECT count(*) FROM %s' % self.table, ())))[0]
+
+    # Writes
+
+    def _transaction(self):
+        return self.client.transaction()
+
+    def _insert(self, conn, doc: Dict[str, Any]) -> Any:
+        if '_id' not in doc:
+            doc['_id'] = ObjectId()
+        text = dumps(doc)
+        columns = ''.join(', ' + column for column in self.columns.values())
+        values = ''.join(', json_extract(:doc, :p%d)' % i for i in range(len(self.columns)))
+        params = {'id': encode(doc['_id']), 'doc': text}
+        params.update(('p%d' % i, _json_path(path)) for i, path in enumerate(self.columns))
+        self._execute(conn, 'INSERT INTO %s (_id, doc%s) VALUES (:id, :doc%s)'
+                      % (self.table, columns, values), params)
+        return doc['_id']
+
+    def _rewrite(self, conn, rowid: int, doc: Dict[str, Any]) -> None:
+        assignments = ''.join(', %s = json_extract(:doc, :p%d)' % (column, i)
+                              for i, column in enumerate(self.columns.values()))
+        params = {'rowid': rowid, 'doc': dumps(doc)}
+        params.update(('p%d' % i, _json_path(path)) for i, path in enumerate(self.columns))
+        self._execute(conn, 'UPDATE %s SET doc = :doc%s WHERE rowid = :rowid'
+                      % (self.table, assignments), params)
+
+    def _remove(self, conn, rowid: int) -> None:
+        conn.execute('DELETE FROM %s WHERE rowid = ?' % self.table, (rowid,))
+
+    def _execute(self, conn, sql: str, params: Any) -> None:
+        try:
+            conn.execute(sql, params)
+        except sqlite3.IntegrityError as error:
+            raise DuplicateKeyError('E11000 duplicate key error collection: %s (%s)'
+                                    % (self.full_name, error), 11000)
+
+    # Aggregation
+
+    def _aggregate_fast(self, query: Mapping[str, Any],
+                        pipeline: List[Mapping[str, Any]]) -> Optional[List[Any]]:
+        return self._aggregate_in_sql(query, pipeline)
+
+    def _aggregate_in_sql(self, query: Mapping[str, Any],
+                          pipeline: List[Mapping[str, Any]]) -> Optional[List[Any]]:
+        """Run [$group, ...] or [$facet of such] as GROUP BY, if possible"""
+        if len(pipeline) == 1 and '$facet' in pipeline[0]:
+            facets = {}
+            for field, sub in pipeline[0]['$facet'].items():
+                facets[field] = self._aggregate_in_sql(query, list(sub))
+                if facets[field] is None:
+                    return None
+            return [facets]
+        if not pipeline or '$group' not in pipeline[0] or any(
+                name not in ('$sort', '$skip', '$limit') for stage in pipeline[1:]
+                for name in stage):
+            return None
+        rows = self._group_in_sql(query, pipeline[0]['$group'])
+        if rows is None:
+            return None
+        return docquery.aggregate(rows, pipeline[1:])
+
+    def _group_in_sql(self, query: Mapping[str, Any],
+                      spec: Mapping[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        where = _Where(self.columns)
+        parts = where.query(query)
+        if not where.exact:
+            return None
+        keys: List[Tuple[Tuple[str, ...], str]] = []
+        if not _group_keys(where, spec['_id'], (), keys):
+            return None
+        sums = []
+        for field, accumulator in spec.items():
+            if field == '_id':
+                continue
+            (op, expr), = accumulator.items()
+            if op != '$sum':
+                return None
+            if isinstance(expr, (int, float)) and not isinstance(expr, bool):
+                sums.append((field, 'count(*) * %r' % expr))
+            elif isinstance(expr, str) and expr.startswith('$'):
+                column = where.column(expr[1:])
+                sums.append((field, "sum(CASE WHEN typeof(%s) IN ('integer', 'real') "
+                                    "THEN %s END)" % (column, column)))
+            else:
+                return None
+        # The row count tells a group from the one row an ungrouped
+        # aggregate returns for no documents
+        select = [sql for _, sql in keys] + [sql for _, sql in sums] + ['count(*)']
+        sql = 'SELECT %s FROM %s' % (', '.join(select), self.table)
+        if parts:
+            sql += ' WHERE ' + ' AND '.join(parts)
+        if keys:
+            sql += ' GROUP BY ' + ', '.join(str(i + 1) for i in range(len(keys)))
+        results = []
+        for row in self.client.rows(sql, where.params):
+            if not row[-1]:
+                continue
+            if not keys:
+                group_id = None
+            elif not keys[0][0]:
+                group_id = _decode(row[0])
+            else:
+                group_id = {}
+                for (path, _), value in zip(keys, row):
+                    _set_nested(group_id, path, _decode(value))
+            doc = {'_id': group_id}
+            for (field, _), value in zip(sums, row[len(keys):]):
+                doc[field] = value or 0
+            results.append(doc)
+        return results
+
+
+def _set_nested(doc: Dict[str, Any], path: Tuple[str, ...], value: Any) -> None:
+    for part in path[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[path[-1]] = value
+
+
+_TRUNCATE = {
+    'year': (6, '-01-01T00:00:00.000000'),
+    'month': (9, '-01T00:00:00.000000'),
+    'day': (12, 'T00:00:00.000000'),
+}
+
+
+def _group_keys(where: _Where, expr: Any, path: Tuple[str, ...],
+                keys: List[Tuple[Tuple[str, ...], str]]) -> bool:
+    """Add (key path, SQL) for each part of a $group _id; False if unsupported"""
+    if isinstance(expr, str) and expr.startswith('$'):
+        keys.append((path, where.column(expr[1:])))
+        return True
+    if isinstance(expr, Mapping) and len(expr) == 1 and '$dateTrunc' in expr:
+        args = expr['$dateTrunc']
+        date = args.get('date')
+        if args.get('unit') not in _TRUNCATE or set(args) != {'date', 'unit'} \
+                or not (isinstance(date, str) and date.startswith('$')):
+            return False
+        column = where.column(date[1:])
+        length, suffix = _TRUNCATE[args['unit']]
+        keys.append((path, "CASE WHEN %s >= '%s' AND %s < '%s' THEN substr(%s, 1, %d) || '%s' END"
+                     % (column, _DATE, column, _TAG_RANGES[datetime][1], column,
+                        length, suffix)))
+        return True
+    if isinstance(expr, Mapping) and expr and not any(key.startswith('$') for key in expr):
+        if path:
+            return False
+        return all(_group_keys(where, value, (key,), keys) for key, value in expr.items())
+    if expr is None and not path:
+        return True
+    return False
+
+
+class SQLiteDatabase:
+    """Collections of one SQLite file"""
+
+    def __init__(self, client: 'SQLiteClient', name: str):
+        self.client = client
+        self.name = name
+        self._collections: Dict[str, SQLiteCollection] = {}
+
+    def __getitem__(self, name: str) -> SQLiteCollection:
+        if name not in self._collections:
+            self._collections[name] = SQLiteCollection(self, name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> SQLiteCollection:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, **kwargs) -> SQLiteCollection:
+        return self[name]
+
+    def list_collection_names(self) -> List[str]:
+        return [row[0] for row in self.client.rows(
+            "SELECT name FROM sqlite_master WHERE type = 'table'", ())]
+
+    def drop_collection(self, name: str) -> None:
+        with self.client.transaction() as conn:
+            conn.execute('DROP TABLE IF EXISTS %s' % _quote(name))
+        self._collections.pop(name, None)
+
+
+class SQLiteClient:
+    """Stands in for MongoClient: `client[db_name]` is the database in `path`.
+
+    ':memory:' keeps everything in one in-process connection, shared by
+    all threads under a lock; a file gets one connection per thread."""
+
+    def __init__(self, path: str = ':memory:', timeout: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+        self.memory = path == ':memory:'
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._connections: List[sqlite3.Connection] = []
+        self._databases: Dict[str, SQLiteDatabase] = {}
+
+    def __getitem__(self, name: str) -> SQLiteDatabase:
+        with self._lock:
+            if name not in self._databases:
+                self._databases[name] = SQLiteDatabase(self, name)
+            return self._databases[name]
+
+    def get_database(self, name: str, **kwargs) -> SQLiteDatabase:
+        return self[name]
+
+    def connection(self) -> sqlite3.Connection:
+        if self.memory:
+            with self._lock:
+                if not self._connections:
+                    self._connections.append(self._connect())
+                return self._connections[0]
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                               check_same_thread=False, cached_statements=STATEMENT_CACHE)
+        if not self.memory:
+            conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """An immediate (write) transaction on this thread's connection"""
+        conn = self.connection()
+        lock = self._lock if self.memory else _NO_LOCK
+        with lock:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def rows(self, sql: str, params: Any, conn: Optional[sqlite3.Connection] = None):
+        """Run a query; rows are fetched lazily unless it is inside a write"""
+        if conn is not None:
+            return conn.execute(sql, params).fetchall()
+        if not self.memory:
+            return self.connection().execute(sql, params)
+        return self._fetch(sql, params)
+
+    def _fetch(self, sql: str, params: Any) -> Iterator[Tuple[Any, ...]]:
+        # One shared connection: hold the lock only while fetching each batch
+        with self._lock:
+            cursor = self.connection().execute(sql, params)
+            rows = cursor.fetchmany(FETCH_SIZE)
+        while rows:
+            yield from rows
+            with self._lock:
+                rows = cursor.fetchmany(FETCH_SIZE)
+
+    def drop_database(self, name: str) -> None:
+        database = self[name]
+        for collection in database.list_collection_names():
+            database.drop_collection(collection)
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+            self._databases = {}
+            self._local = threading.local()
+
+
+class _NoLock:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_LOCK = _NoLock()
@@ -0,0 +1,251 @@
+"""
+Write paths shared by the API routes and delta sync.
+
+Each write keeps the derived collections (monthly rollups, period
+buckets, reminder schedule) up to date and logs the change for sync.
+`db` is anything that returns a collection for `db[name]`: a pymongo
+Database, or the `mongo` extension inside a request.
+"""
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.write_concern import WriteConcern
+
+from backend import (budget, categories, goals, ledger, periods, recurring,
+                     reminders, rollups, sync)
+
+LEDGER_COLLECTIONS = rollups.LEDGER_COLLECTIONS
+
+
+def _object_id(doc: Dict[str, Any]) -> str:
+    return str(doc['_id'])
+
+
+def serialize_category(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {'name': doc['name']}
+
+
+# How each synced collection names and shows its documents
+SYNCED: Dict[str, Tuple[Callable[[Dict[str, Any]], str],
+                        Callable[[Dict[str, Any]], Dict[str, Any]]]] = {
+    'balances': (lambda doc: 'budget', budget.shape_budget),
+    'expenses': (_object_id, ledger.serialize_entry),
+    'incomes': (_object_id, ledger.serialize_entry),
+    'expense_categories': (lambda doc: doc['name'], serialize_category),
+    'income_categories': (lambda doc: doc['name'], serialize_category),
+    'budget_goals': (_object_id, goals.serialize_goal),
+    'recurring_payments': (_object_id, recurring.serialize_payment),
+}
+
+
+def _log(db, user: str, collection: str, *docs: Dict[str, Any]) -> None:
+    doc_id, serialize = SYNCED[collection]
+    sync.record(db, user, collection, [(doc_id(doc), serialize(doc)) for doc in docs])
+
+
+def _log_deleted(db, user: str, collection: str, doc_id: str) -> None:
+    sync.record(db, user, collection, [(doc_id, None)])
+
+
+# Budget
+
+def save_budget(db, user: str, data: Any,
+                write_concern: WriteConcern = WriteConcern()) -> None:
+    budget.save_budget(db['balances'], user, data, write_concern)
+    _log(db, user, 'balances', budget.budget_document(user, data))
+
+
+# Ledger entries, by rollup type ('expense' or 'income')
+
+def add_entry(db, user: str, type_: str, data: Any) -> Dict[str, Any]:
+    entry = ledger.parse_entry(data)
+    entry['user'] = user
+    collection = LEDGER_COLLECTIONS[type_]
+    entry['_id'] = db[collection].insert_one(entry).inserted_id
+    rollups.record_insert(db['monthly_rollups'], type_, entry)
+    periods.record_insert(db['period_totals'], type_, entry)
+    _log(db, user, collection, entry)
+    return entry
+
+
+def update_entry(db, user: str, type_: str, entry_id: str,
+                 data: Any) -> Optional[Dict[str, Any]]:
+    entry = ledger.parse_entry(data)
+    collection = LEDGER_COLLECTIONS[type_]
+    old = db[collection].find_one_and_update(
+        {'_id': ledger.parse_object_id(entry_id), 'user': user},
+        {'$set': entry},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if old is None:
+        return None
+    doc = dict(old, **entry)
+    rollups.record_update(db['monthly_rollups'], type_, old, doc)
+    periods.record_update(db['period_totals'], type_, old, doc)
+    _log(db, user, collection, doc)
+    return doc
+
+
+def delete_entry(db, user: str, type_: str, entry_id: str) -> Optional[Dict[str, Any]]:
+    collection = LEDGER_COLLECTIONS[type_]
+    doc = db[collection].find_one_and_delete(
+        {'_id': ledger.parse_object_id(entry_id), 'user': user})
+    if doc is None:
+        return None
+    rollups.record_delete(db['monthly_rollups'], type_, doc)
+    periods.record_delete(db['period_totals'], type_, doc)
+    _log_deleted(db, user, collection, entry_id)
+    return doc
+
+
+def entries_inserted(db, user: str, type_: str, docs) -> None:
+    """Follow-up writes for a batch inserted by bulk ingest"""
+    rollups.record_many(db['monthly_rollups'], type_, docs)
+    periods.record_many(db['period_totals'], type_, docs)
+    _log(db, user, LEDGER_COLLECTIONS[type_], *docs)
+
+
+# Categories, by type
+
+def add_category(db, user: str, type_: str, data: Any) -> Dict[str, Any]:
+    doc = {'user': user, 'name': categories.parse_name(data)}
+    collection = categories.CATEGORY_COLLECTIONS[type_]
+    db[collection].replace_one(doc, doc, upsert=True)
+    _log(db, user, collection, doc)
+    return doc
+
+
+def delete_category(db, user: str, type_: str, name: str) -> bool:
+    collection = categories.CATEGORY_COLLECTIONS[type_]
+    result = db[collection].delete_one({'user': user, 'name': name})
+    if result.deleted_count:
+        _log_deleted(db, user, collection, name)
+    return bool(result.deleted_count)
+
+
+# Budget goals
+
+def add_goal(db, user: str, data: Any) -> Dict[str, Any]:
+    goal = goals.parse_goal(data)
+    goal['user'] = user
+    goal['_id'] = db['budget_goals'].insert_one(goal).inserted_id
+    _log(db, user, 'budget_goals', goal)
+    return goal
+
+
+def update_goal(db, user: str, goal_id: str, data: Any) -> Optional[Dict[str, Any]]:
+    doc = db['budget_goals'].find_one_and_update(
+        {'_id': ledger.parse_object_id(goal_id), 'user': user},
+        {'$set': goals.parse_goal(data)},
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc is not None:
+        _log(db, user, 'budget_goals', doc)
+    return doc
+
+
+def delete_goal(db, user: str, goal_id: str) -> bool:
+    result = db['budget_goals'].delete_one(
+        {'_id': ledger.parse_object_id(goal_id), 'user': user})
+    if result.deleted_count:
+        _log_deleted(db, user, 'budget_goals', goal_id)
+    return bool(result.deleted_count)
+
+
+# Recurring payments
+
+def add_payment(db, user: str, data: Any) -> Dict[str, Any]:
+    payment = recurring.parse_payment(data)
+    payment['user'] = user
+    payment['_id'] = db['recurring_payments'].insert_one(payment).inserted_id
+    reminders.schedule(db['reminder_schedule'], payment, datetime.utcnow())
+    _log(db, user, 'recurring_payments', payment)
+    return payment
+
+
+def update_payment(db, user: str, payment_id: str,
+                   data: Any) -> Optional[Dict[str, Any]]:
+    doc = db['recurring_payments'].find_one_and_update(
+        {'_id': ledger.parse_object_id(payment_id), 'user': user},
+        {'$set': recurring.parse_payment(data)},
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc is not None:
+        reminders.schedule(db['reminder_schedule'], doc, datetime.utcnow())
+        _log(db, user, 'recurring_payments', doc)
+    return doc
+
+
+def delete_payment(db, user: str, payment_id: str) -> bool:
+    object_id = ledger.parse_object_id(payment_id)
+    result = db['recurring_payments'].delete_one({'_id': object_id, 'user': user})
+    if result.deleted_count:
+        reminders.unschedule(db['reminder_schedule'], user, object_id)
+        _log_deleted(db, user, 'recurring_payments', payment_id)
+    return bool(result.deleted_count)
+
+
+# Sync mutations: {collection, op: upsert|delete, id, base, doc}
+
+def _apply(db, user: str, collection: str, op: str, doc_id: Optional[str],
+           data: Any) -> Optional[str]:
+    """Apply one mutation; returns the document id, or None if not found"""
+    if collection == 'balances':
+        if op == 'delete':
+            raise ledger.ValidationError('the budget cannot be deleted')
+        save_budget(db, user, data)
+        return 'budget'
+    if collection in categories.CATEGORY_COLLECTIONS.values():
+        type_ = 'expense' if collection == 'expense_categories' else 'income'
+        if op == 'delete':
+            return doc_id if delete_category(db, user, type_, doc_id or '') else None
+        return add_category(db, user, type_, data)['name']
+
+    if collection in LEDGER_COLLECTIONS.values():
+        type_ = 'expense' if collection == 'expenses' else 'income'
+        if op == 'delete':
+            return doc_id if delete_entry(db, user, type_, doc_id) else None
+        result = (update_entry(db, user, type_, doc_id, data) if doc_id
+                  else add_entry(db, user, type_, data))
+    elif collection == 'budget_goals':
+        if op == 'delete':
+            return doc_id if delete_goal(db, user, doc_id) else None
+        result = update_goal(db, user, doc_id, data) if doc_id else add_goal(db, user, data)
+    else:
+        if op == 'delete':
+            return doc_id if delete_payment(db, user, doc_id) else None
+        result = (update_payment(db, user, doc_id, data) if doc_id
+                  else add_payment(db, user, data))
+    return str(result['_id']) if result else None
+
+
+def apply_mutation(db, user: str, index: int, mutation: Any) -> Dict[str, Any]:
+    """Apply one client mutation unless the document changed since `base`"""
+    result: Dict[str, Any] = {'index': index}
+    try:
+        if not isinstance(mutation, dict):
+            raise ledger.ValidationError('mutation must be a JSON object')
+        collection, op = mutation.get('collection'), mutation.get('op')
+        if collection not in SYNCED:
+            raise ledger.ValidationError('unknown collection')
+        if op not in ('upsert', 'delete'):
+            raise ledger.ValidationError('op must be upsert or delete')
+        doc_id = mutation.get('id')
+        if collection == 'balances':
+            doc_id = 'budget'
+        if doc_id is not None:
+            doc_id = str(doc_id)
+            base = sync.parse_token(str(mutation.get('base') or 0))
+            latest = sync.latest(db, user, collection, doc_id)
+            if latest and latest['seq'] > base:
+                return dict(result, status='conflict', id=doc_id,
+                            current=sync.serialize_change(latest))
+        applied_id = _apply(db, user, collection, op, doc_id, mutation.get('doc'))
+    except ledger.ValidationError as error:
+        return dict(result, status='error', error=str(error))
+    if applied_id is None:
+        return dict(result, status='not_found', id=doc_id)
+    latest = sync.latest(db, user, collection, applied_id)
+    return dict(result, status='applied', id=applied_id,
+                seq=latest['seq'] if latest else None)
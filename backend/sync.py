@@ -0,0 +1,157 @@
+"""
+Delta sync: a per-user change log that clients read from a change token.
+
+Every write to a synced collection takes the next number from the user's
+counter in `sync_counters` and upserts one `sync_log` entry per changed
+document, keyed by (user, collection, doc_id), holding that number and
+the document as the API returns it (or a tombstone). The log therefore
+holds the latest change of each document, and `changes_since(n)` is one
+range scan on (user, seq).
+
+A client keeps the `next` token from its last sync. Mutations it sends
+carry the `seq` of the version they were based on; a document changed
+since then is reported as a conflict with the server's version instead of
+being overwritten.
+
+Numbers are taken before the log entry is written, so two racing writes
+of the same user can become visible out of order. The returned token
+therefore never moves past an entry written in the last SETTLE_SECONDS:
+such entries are returned again by the next sync (applying a change twice
+is harmless), and by then any slower write with a lower number is visible.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, IndexModel, ReplaceOne, ReturnDocument
+
+from backend.ledger import ValidationError
+
+DEFAULT_LIMIT = 500
+SETTLE_SECONDS = 5
+MAX_LIMIT = 5000
+
+SYNC_LOG_INDEXES = [
+    IndexModel([('user', ASCENDING), ('seq', ASCENDING)], name='user_seq'),
+    IndexModel([('user', ASCENDING), ('collection', ASCENDING), ('doc_id', ASCENDING)],
+               name='user_collection_doc', unique=True),
+]
+SYNC_COUNTER_INDEXES = [
+    IndexModel([('user', ASCENDING)], name='user', unique=True),
+]
+
+# (doc_id, API view of the document, or None once deleted)
+Change = Tuple[str, Optional[Dict[str, Any]]]
+
+
+def parse_token(value: Optional[str]) -> int:
+    if value in (None, ''):
+        return 0
+    try:
+        seq = int(value)
+    except ValueError:
+        raise ValidationError('since must be a token from a previous sync')
+    if seq < 0:
+        raise ValidationError('since must be a token from a previous sync')
+    return seq
+
+
+def parse_limit(value: Optional[str]) -> int:
+    if value is None:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValidationError('limit must be an integer')
+    if limit < 1:
+        raise ValidationError('limit must be positive')
+    return min(limit, MAX_LIMIT)
+
+
+def reserve_update(count: int) -> Dict[str, Any]:
+    return {'$inc': {'seq': count}}
+
+
+def reserve(db, user: str, count: int) -> int:
+    """Take `count` consecutive change numbers; returns the first"""
+    counter = db['sync_counters'].find_one_and_update(
+        {'user': user}, reserve_update(count),
+        upsert=True, return_document=ReturnDocument.AFTER,
+    )
+    return counter['seq'] - count + 1
+
+
+def log_ops(user: str, collection: str, first: int,
+            changes: List[Change]) -> List[ReplaceOne]:
+    """Log entries for `changes`, numbered from `first`"""
+    written_at = datetime.utcnow()
+    return [
+        ReplaceOne(
+            {'user': user, 'collection': collection, 'doc_id': doc_id},
+            {'user': user, 'collection': collection, 'doc_id': doc_id,
+             'seq': first + offset, 'deleted': doc is None, 'doc': doc,
+             'written_at': written_at},
+            upsert=True,
+        )
+        for offset, (doc_id, doc) in enumerate(changes)
+    ]
+
+
+def record(db, user: str, collection: str, changes: Iterable[Change]) -> None:
+    """Log changed (or deleted, with None) documents of one collection"""
+    changes = list(changes)
+    if changes:
+        first = reserve(db, user, len(changes))
+        db['sync_log'].bulk_write(log_ops(user, collection, first, changes),
+                                  ordered=False)
+
+
+def version(db, user: str) -> int:
+    """The user's last change number (0 before any write).
+
+    Writes take their number after changing the data, so anything read
+    after this call is at least as new as the returned version."""
+    counter = db['sync_counters'].find_one({'user': user}, {'seq': 1, '_id': 0})
+    return counter['seq'] if counter else 0
+
+
+def latest(db, user: str, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+    """The log entry of a document's latest change, if it has one"""
+    return db['sync_log'].find_one(
+        {'user': user, 'collection': collection, 'doc_id': doc_id})
+
+
+def serialize_change(entry: Dict[str, Any]) -> Dict[str, Any]:
+    return {'collection': entry['collection'], 'id': entry['doc_id'],
+            'seq': entry['seq'], 'deleted': entry['deleted'], 'doc': entry['doc']}
+
+
+def changes_since(db, user: str, since: int, limit: int,
+                  now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Changes after `since`, oldest first; pass `next` back as since"""
+    entries = list(db['sync_log'].find({'user': user, 'seq': {'$gt': since}})
+                   .sort('seq', ASCENDING).limit(limit + 1))
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    settled = (now or datetime.utcnow()) - timedelta(seconds=SETTLE_SECONDS)
+    token = since
+    for entry in entries:
+        if entry['written_at'] > settled:
+            break
+        token = entry['seq']
+    return {
+        'changes': [serialize_change(entry) for entry in entries],
+        'next': str(token),
+        # Only ask for the next page once this one is settled, so a burst
+        # of fresh writes cannot make the client re-read it in a loop
+        'has_more': has_more and token == entries[-1]['seq'],
+    }
+
+
+def parse_mutations(data: Any) -> List[Dict[str, Any]]:
+    """Validate the POST /api/sync body and return its mutations"""
+    mutations = data.get('mutations') if isinstance(data, dict) else None
+    if not isinstance(mutations, list):
+        raise ValidationError('mutations must be a list')
+    if len(mutations) > MAX_LIMIT:
+        raise ValidationError('at most %d mutations per request' % MAX_LIMIT)
+    return mutations
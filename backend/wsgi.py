@@ -0,0 +1,15 @@
+"""
+WSGI entry point for production servers, e.g.
+
+    SECRET_KEY=... gunicorn -c python:backend.gunicorn_conf backend.wsgi:app
+
+Importing this module does not connect to MongoDB: each worker process
+creates its client on its first request.
+
+Every request must carry a bearer token (AUTH_REQUIRED), so the app
+refuses to start without a SECRET_KEY of its own. Naming the user with
+X-User-Id is left to the debug server (`python -m backend.app`) and tests.
+"""
+from backend.app import create_app
+
+app = create_app({'AUTH_REQUIRED': True})
@@ -0,0 +1,3 @@
+"""
+Budgetly performance benchmarks (require a running MongoDB unless noted)
+"""
@@ -0,0 +1,116 @@
+"""
+Benchmark: old delete_many + insert_one budget write vs. the keyed upsert
+
+Runs parallel writers against a live MongoDB while a reader polls the
+budget, and reports throughput, latency percentiles and how often the
+reader saw no budget at all.
+
+Usage:
+    python -m benchmarks.bench_budget_upsert --uri mongodb://localhost:27017/ \
+        --threads 16 --requests 500
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from pymongo import MongoClient
+from pymongo.write_concern import WriteConcern
+
+from backend import budget
+
+
+def old_write(collection, owner, data):
+    """The write path POST /api/budget used before the keyed upsert"""
+    collection.delete_many({})
+    collection.insert_one(dict(data))
+
+
+def new_write(collection, owner, data):
+    budget.save_budget(collection, owner, data, WriteConcern())
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(collection, write, threads, requests_per_thread):
+    collection.delete_many({})
+    write(collection, 'bench', {'budget': 0, 'currency': 'USD'})
+    latencies = []
+    lock = threading.Lock()
+    stop = threading.Event()
+    reads = {'total': 0, 'empty': 0}
+
+    def writer(n):
+        local = []
+        for i in range(requests_per_thread):
+            started = time.perf_counter()
+            write(collection, 'bench', {'budget': n * requests_per_thread + i,
+                                        'currency': 'USD'})
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    def reader():
+        while not stop.is_set():
+            reads['total'] += 1
+            if collection.find_one() is None:
+                reads['empty'] += 1
+
+    reader_thread = threading.Thread(target=reader)
+    reader_thread.start()
+    workers = [threading.Thread(target=writer, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    reader_thread.join()
+
+    return {
+        'ops_per_sec': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies) * 1000,
+        'empty_reads': reads['empty'],
+        'reads': reads['total'],
+        'documents_left': collection.count_documents({}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--uri', default='mongodb://localhost:27017/')
+    parser.add_argument('--db', default='budgetly_bench')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500,
+                        help='writes per thread')
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri, maxPoolSize=args.threads + 2)
+    db = client[args.db]
+    old_collection = db['balances_old']
+    new_collection = db['balances_new']
+    old_collection.drop()
+    new_collection.drop()
+    budget.ensure_indexes(new_collection)
+
+    for name, collection, write in [('delete+insert', old_collection, old_write),
+                                    ('upsert', new_collection, new_write)]:
+        result = run(collection, write, args.threads, args.requests)
+        print('%-14s %8.0f ops/s  p50 %6.2f ms  p99 %6.2f ms  max %7.2f ms  '
+              'empty reads %d/%d  docs left %d' % (
+                  name, result['ops_per_sec'], result['p50_ms'], result['p99_ms'],
+                  result['max_ms'], result['empty_reads'], result['reads'],
+                  result['documents_left']))
+
+    client.drop_database(args.db)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark: id and secondary index lookups in the local data layer
+
+Times single-row update and delete by id, category lookups and one-month
+date ranges on an IndexedCollection of N ledger rows, against the linear
+scans tests/mock_db.py and db.ts do on a plain list. Runs in process
+without MongoDB.
+
+Usage:
+    python -m benchmarks.bench_collection --rows 1000 10000 100000 1000000
+"""
+import argparse
+import random
+import time
+import uuid
+from datetime import date, timedelta
+
+from backend.localdb import COLLECTIONS, IndexedCollection
+
+OPS = 200
+
+
+def make_rows(count, seed=0):
+    rng = random.Random(seed)
+    start = date(2015, 1, 1)
+    return [{
+        'id': str(uuid.UUID(int=rng.getrandbits(128))),
+        'category': 'Category %d' % rng.randrange(20),
+        'value': round(rng.uniform(1, 500), 2),
+        'date': (start + timedelta(days=rng.randrange(3650))).isoformat(),
+    } for _ in range(count)]
+
+
+def per_op(func, args):
+    started = time.perf_counter()
+    for arg in args:
+        func(arg)
+    return (time.perf_counter() - started) / len(args) * 1e6
+
+
+def bench_list(rows, ids, months):
+    items = list(rows)
+
+    def update(id_):
+        for item in items:
+            if item['id'] == id_:
+                item['value'] = 1.0
+                break
+
+    def delete(id_):
+        items[:] = [item for item in items if item['id'] != id_]
+
+    return {
+        'update': per_op(update, ids),
+        'category': per_op(lambda c: [i for i in items if i['category'] == c],
+                           ['Category 3'] * 10),
+        'month': per_op(lambda m: [i for i in items if m + '-01' <= i['date'] <= m + '-31'],
+                        months),
+        'delete': per_op(delete, ids[:max(1, OPS // 10)]),
+    }
+
+
+def bench_indexed(rows, ids, months):
+    started = time.perf_counter()
+    entries = IndexedCollection(COLLECTIONS['expenses'])
+    for row in rows:
+        entries.put(row['id'], row)
+    build = (time.perf_counter() - started) / len(rows) * 1e6
+    return {
+        'insert': build,
+        'update': per_op(lambda id_: entries.put(id_, dict(entries.get(id_), value=1.0)), ids),
+        'category': per_op(lambda c: entries.find('category', c), ['Category 3'] * 10),
+        'month': per_op(lambda m: entries.range('date', m + '-01', m + '-31'), months),
+        'delete': per_op(entries.delete, ids),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--list-max', type=int, default=100000,
+                        help='skip the list baseline above this many rows')
+    args = parser.parse_args()
+
+    print('%-8s %9s %9s %9s %11s %11s %9s  (us per op)'
+          % ('', 'rows', 'insert', 'update', 'category', 'month', 'delete'))
+    for count in args.rows:
+        rows = make_rows(count)
+        rng = random.Random(1)
+        ids = [row['id'] for row in rng.sample(rows, min(OPS, count))]
+        months = ['20%02d-%02d' % (rng.randrange(15, 25), rng.randrange(1, 13))
+                  for _ in range(10)]
+        results = [('indexed', bench_indexed(rows, ids, months))]
+        if count <= args.list_max:
+            results.append(('list', bench_list(make_rows(count), ids, months)))
+        for label, timings in results:
+            print('%-8s %9d %9s %9.2f %11.2f %11.2f %9.2f' % (
+                label, count,
+                '%.2f' % timings['insert'] if 'insert' in timings else '-',
+                timings['update'], timings['category'], timings['month'], timings['delete']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark: payload size and latency with compression and version ETags
+
+Seeds a ledger on the in-memory database and requests a 500-entry page,
+a one-year report and both exports through the Flask app with no
+Accept-Encoding, gzip and (when installed) brotli, then revalidates with
+If-None-Match. Prints bytes on the wire, server time per request and the
+end-to-end latency over a slow mobile link, modelled as one round trip
+plus the transfer time at --bandwidth. Runs in process without MongoDB.
+
+Usage:
+    python -m benchmarks.bench_compression --entries 5000 --bandwidth 1600 --rtt 300
+"""
+import argparse
+import statistics
+import time
+
+from backend import compression
+from backend.app import create_app
+from benchmarks.bench_json import make_entries
+
+USER = {'X-User-Id': 'bench-compression'}
+PATHS = [
+    '/api/expenses?limit=500',
+    '/api/reports?from=2022-03-10&to=2023-03-09',
+    '/api/export?format=ndjson',
+    '/api/export?format=csv',
+]
+
+
+def measure(client, path, headers, repeat):
+    """(bytes, median seconds, status) of `repeat` requests"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path, headers=headers)
+        body = response.get_data()
+        timings.append(time.perf_counter() - started)
+    return len(body), statistics.median(timings), response.status_code
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--entries', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--bandwidth', type=float, default=1600,
+                        help='modelled link speed in kbit/s (default: 3G)')
+    parser.add_argument('--rtt', type=float, default=300,
+                        help='modelled round trip in ms')
+    args = parser.parse_args()
+
+    app = create_app({'DATABASE_BACKEND': 'memory'})
+    client = app.test_client()
+    for kind in ('expenses', 'income'):
+        client.post('/api/%s/bulk' % kind, json=make_entries(args.entries, seed=len(kind)),
+                    headers=USER).get_data()
+
+    def link(size):
+        return args.rtt / 1000 + size * 8 / (args.bandwidth * 1000)
+
+    encodings = ['identity'] + list(reversed(compression.ENCODINGS))
+    print('%-44s %-9s %10s %11s %13s' % ('request', 'encoding', 'bytes', 'server ms',
+                                         'end-to-end ms'))
+    for path in PATHS:
+        for encoding in encodings:
+            headers = dict(USER, **{'Accept-Encoding': encoding})
+            size, server, _ = measure(client, path, headers, args.repeat)
+            print('%-44s %-9s %10d %11.2f %13.1f' % (path, encoding, size, server * 1000,
+                                                      (server + link(size)) * 1000))
+        etag = client.get(path, headers=USER).headers['ETag']
+        size, server, status = measure(client, path, dict(USER, **{'If-None-Match': etag}),
+                                       args.repeat)
+        assert status == 304, status
+        print('%-44s %-9s %10d %11.2f %13.1f' % (path, '304', size, server * 1000,
+                                                  (server + link(size)) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark: cash-flow forecast projection
+
+Times build_forecast for a multi-year horizon across many recurring
+payments, and compares the vectorized occurrence matrix with counting
+the expanded occurrences one by one. Runs in process without MongoDB.
+
+Usage:
+    python -m benchmarks.bench_forecast --payments 5000 --months 60
+"""
+import argparse
+import statistics
+import time
+from datetime import date, timedelta
+
+from backend import forecast, recurring
+from benchmarks.bench_occurrences import make_payments
+
+
+def count_by_expansion(payments, today, months):
+    """The loop the occurrence matrix replaces"""
+    end = recurring.add_months(date(today.year, today.month, 1), months) - timedelta(days=1)
+    return sum(1 for _ in recurring.expand(payments, today, end))
+
+
+def timed(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--payments', type=int, default=5000)
+    parser.add_argument('--months', type=int, default=60)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    payments = make_payments(args.payments)
+    averages = {'expense': {'Category %d' % i: 100.0 for i in range(40)},
+                'income': {'Salary': 3000.0}}
+    budget = {'budget': 10000, 'currency': 'USD'}
+    today = date.today()
+
+    matrix = timed(lambda: forecast.occurrence_matrix(
+        *forecast.payment_arrays(payments), today, args.months), args.repeat)
+    full = timed(lambda: forecast.build_forecast(budget, payments, averages, today,
+                                                 args.months), args.repeat)
+    expansion = timed(lambda: count_by_expansion(payments, today, args.months), 1)
+    print('payments                %8d' % args.payments)
+    print('months                  %8d' % args.months)
+    print('occurrence matrix       %8.2f ms' % (matrix * 1000))
+    print('build_forecast          %8.2f ms' % (full * 1000))
+    print('expand and count        %8.2f ms' % (expansion * 1000))
+
+
+if __name__ == '__main__':
+    main()
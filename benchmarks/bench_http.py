@@ -0,0 +1,181 @@
+"""
+HTTP load generator: many concurrent keep-alive connections against one or
+more running servers, reporting requests/sec and latency percentiles.
+
+Compare the sync and async servers at equal worker counts (gunicorn serves
+backend.wsgi, which only accepts bearer tokens, so the clients sign theirs
+with the server's SECRET_KEY):
+    SECRET_KEY=bench WEB_CONCURRENCY=4 GUNICORN_THREADS=8 GUNICORN_BIND=127.0.0.1:8000 \
+        gunicorn -c python:backend.gunicorn_conf
+    uvicorn backend.asgi:app --workers 4 --port 8001
+    python -m benchmarks.bench_http --connections 200 --duration 20 --secret-key bench \
+        --url sync=http://127.0.0.1:8000 --url async=http://127.0.0.1:8001
+
+Or drive the Flask app in this process through its WSGI test client, on the
+in-memory database, without any server or MongoDB:
+    python -m benchmarks.bench_http --in-process memory --connections 8
+"""
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+# SECRET_KEY of the servers the benchmarks start themselves
+BENCH_SECRET_KEY = 'benchmark-only-secret'
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def user_id_headers(user):
+    return {'X-User-Id': user}
+
+
+def token_headers(secret_key=BENCH_SECRET_KEY):
+    """A user_headers function giving bearer tokens signed with secret_key"""
+    from backend.auth import Authenticator
+    authenticator = Authenticator({'AUTH_REQUIRED': True, 'SECRET_KEY': secret_key,
+                                   'AUTH_TOKEN_MAX_AGE': 3600})
+    return lambda user: {'Authorization': 'Bearer ' + authenticator.issue(user)}
+
+
+def _drive(connect, connections, duration, user_headers=user_id_headers):
+    """Run `connections` clients until the deadline; connect() returns a
+    send(headers) function giving the status, or None if the request failed"""
+    deadline = time.perf_counter() + duration
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def worker():
+        send = connect()
+        local, failed = [], 0
+        # Each simulated client gets its own user, like separate phones
+        client_headers = user_headers(str(uuid.uuid4()))
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            status = send(client_headers)
+            if status is None:
+                failed += 1
+                continue
+            local.append(time.perf_counter() - started)
+            if status >= 400:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(connections)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    if not latencies:
+        return {'requests': 0, 'errors': errors[0]}
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies) * 1000,
+    }
+
+
+def run_load(base_url, path='/api/budget', connections=50, duration=10.0,
+             method='GET', body=None, headers=None, user_headers=user_id_headers):
+    """Drive one server for duration seconds and return summary statistics"""
+    parts = urlsplit(base_url)
+    payload = json.dumps(body).encode() if body is not None else None
+    headers = dict(headers or {})
+    if payload is not None:
+        headers['Content-Type'] = 'application/json'
+
+    def connect():
+        conn = [http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)]
+
+        def send(client_headers):
+            try:
+                conn[0].request(method, path, body=payload,
+                                headers=dict(headers, **client_headers))
+                response = conn[0].getresponse()
+                response.read()
+                return response.status
+            except (OSError, http.client.HTTPException):
+                conn[0].close()
+                conn[0] = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+                return None
+        return send
+
+    return _drive(connect, connections, duration, user_headers)
+
+
+def run_app_load(app, path='/api/budget', connections=8, duration=10.0,
+                 method='GET', body=None, headers=None):
+    """Drive a Flask app in this process through its test client"""
+
+    def connect():
+        client = app.test_client()
+
+        def send(client_headers):
+            return client.open(path, method=method, json=body,
+                               headers=dict(headers or {}, **client_headers)).status_code
+        return send
+
+    return _drive(connect, connections, duration)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', action='append', default=[],
+                        help='label=http://host:port (repeat to compare servers)')
+    parser.add_argument('--in-process', metavar='BACKEND', action='append', default=[],
+                        choices=('memory', 'sqlite', 'mongo'),
+                        help='drive create_app() on this DATABASE_BACKEND in-process')
+    parser.add_argument('--path', default='/api/budget')
+    parser.add_argument('--method', default='GET')
+    parser.add_argument('--body', help='JSON request body')
+    parser.add_argument('--connections', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--secret-key',
+                        help="sign bearer tokens with the servers' SECRET_KEY "
+                             '(default: send X-User-Id)')
+    args = parser.parse_args()
+    if not args.url and not args.in_process:
+        parser.error('give at least one --url or --in-process')
+
+    body = json.loads(args.body) if args.body else None
+    user_headers = token_headers(args.secret_key) if args.secret_key else user_id_headers
+    runs = []
+    for target in args.url:
+        label, _, url = target.rpartition('=')
+        runs.append((label or url, lambda url=url: run_load(
+            url, args.path, args.connections, args.duration, args.method, body,
+            user_headers=user_headers)))
+    for backend in args.in_process:
+        from backend.app import create_app
+        app = create_app({'DATABASE_BACKEND': backend, 'SQLITE_PATH': ':memory:'})
+        runs.append((backend, lambda app=app: run_app_load(
+            app, args.path, args.connections, args.duration, args.method, body)))
+
+    for label, run in runs:
+        result = run()
+        if not result['requests']:
+            print('%-10s no successful requests (%d errors)' % (label, result['errors']))
+            continue
+        print('%-10s %8.0f req/s  p50 %7.2f ms  p99 %7.2f ms  max %8.2f ms  errors %d' % (
+            label, result['rps'], result['p50_ms'], result['p99_ms'],
+            result['max_ms'], result['errors']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark: response encoding with orjson vs. the standard library
+
+Encodes the largest API responses (a 500-entry ledger page, a two-year
+report and a five-year forecast) and the NDJSON export of the whole
+ledger, once with orjson and once with the standard library. Prints bytes
+per response, throughput in MB/s and CPU time per response. The data is
+read through the app on the in-memory database; no MongoDB needed.
+
+Usage:
+    python -m benchmarks.bench_json --entries 5000 --repeat 200
+"""
+import argparse
+import json
+import random
+import time
+from datetime import date, timedelta
+
+from backend import jsonprovider, ledger
+from backend.app import create_app
+
+USER = 'bench-json'
+
+
+def make_entries(count, seed=0):
+    rng = random.Random(seed)
+    start = date(2022, 1, 1)
+    return [{'category': 'Category %d' % rng.randrange(40),
+             'value': round(rng.uniform(1, 500), 2),
+             'date': (start + timedelta(days=rng.randrange(730))).isoformat()}
+            for _ in range(count)]
+
+
+def cpu_per_call(func, repeat):
+    """(CPU seconds per call, wall seconds per call)"""
+    cpu, wall = time.process_time(), time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.process_time() - cpu) / repeat, (time.perf_counter() - wall) / repeat
+
+
+def report_row(name, size, cpu, wall):
+    print('%-28s %10d %10.1f %10.3f' % (name, size, size / wall / 1e6, cpu * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--entries', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    app = create_app({'DATABASE_BACKEND': 'memory', 'JSON_FAST_ENCODER': False})
+    client = app.test_client()
+    headers = {'X-User-Id': USER}
+    client.post('/api/expenses/bulk', json=make_entries(args.entries), headers=headers).get_data()
+    documents = {
+        'ledger page': client.get('/api/expenses?limit=%d' % ledger.MAX_PAGE_SIZE,
+                                  headers=headers).get_json(),
+        'report': client.get('/api/reports?from=2022-01-10&to=2023-12-20',
+                             headers=headers).get_json(),
+        'forecast': client.get('/api/forecast?months=60', headers=headers).get_json(),
+    }
+    # Export rows as read from the database: ObjectIds and datetimes
+    rows = [dict(doc, section='expenses') for doc in
+            app.extensions['mongo'].collection('expenses').find({'user': USER}, {'user': 0})]
+
+    apps = {'stdlib': app}
+    if jsonprovider.orjson is not None:
+        apps['orjson'] = create_app({'DATABASE_BACKEND': 'memory'})
+    else:
+        print('orjson is not installed; timing the standard library only')
+
+    print('%-28s %10s %10s %10s' % ('response', 'bytes', 'MB/s', 'CPU ms'))
+    for encoder, encoder_app in apps.items():
+        with encoder_app.app_context():
+            for name, doc in documents.items():
+                size = len(encoder_app.json.response(doc).get_data())
+                cpu, wall = cpu_per_call(lambda: encoder_app.json.response(doc), args.repeat)
+                report_row('%s %s' % (encoder, name), size, cpu, wall)
+
+        if encoder == 'orjson':
+            encode = jsonprovider.dumps
+        else:
+            def encode(row):
+                return json.dumps(row, default=jsonprovider.default, separators=(',', ':'))
+
+        def ndjson():
+            return ''.join([encode(row) + '\n' for row in rows])
+        size = len(ndjson().encode())
+        cpu, wall = cpu_per_call(ndjson, max(args.repeat // 10, 1))
+        report_row('%s export ndjson' % encoder, size, cpu, wall)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark: local data layer writes, localStorage JSON blobs vs. append-only log
+
+Inserts N expenses, then updates and deletes budget goals, once through
+tests/mock_db.py (the db.ts approach of re-serializing the collection on
+every write) and once through backend.localdb. Runs in process without
+MongoDB.
+
+Usage:
+    python -m benchmarks.bench_localdb --rows 500 1000 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from backend.localdb import LocalDB, LogStore
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tests'))
+import mock_db  # noqa: E402
+
+
+def run(db, rows):
+    timings = {}
+    started = time.perf_counter()
+    for i in range(rows):
+        db.addExpense('Category %d' % (i % 20), float(i), '2024-03-04')
+    timings['insert'] = time.perf_counter() - started
+
+    for _ in range(100):
+        db.addBudgetGoal('expense', 'monthly', 100)
+    ids = [goal['id'] for goal in db.getBudgetGoalsList()]
+    started = time.perf_counter()
+    for id_ in ids:
+        db.updateBudgetGoal(id_, 200)
+    for id_ in ids:
+        db.deleteBudgetGoal(id_)
+    timings['update+delete'] = time.perf_counter() - started
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, nargs='+', default=[500, 1000, 2000])
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        mock_db.localStorage.clear()
+        with tempfile.TemporaryDirectory() as tmp:
+            store = LogStore(os.path.join(tmp, 'budgetly.log'))
+            results = [('localStorage', run(mock_db, rows)),
+                       ('log', run(LocalDB(store), rows))]
+            store.close()
+        for label, timings in results:
+            print('%-12s rows %8d  insert %9.2f ms  per row %7.2f us  update+delete %8.2f ms'
+                  % (label, rows, timings['insert'] * 1000, timings['insert'] / rows * 1e6,
+                     timings['update+delete'] * 1000))
+
+
+if __name__ == '__main__':
+    main()
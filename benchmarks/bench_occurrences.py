@@ -0,0 +1,58 @@
+"""
+Benchmark: expanding recurring payments into occurrences
+
+Expands a year of occurrences for a mix of daily/weekly/monthly/yearly
+payments with start dates spread over the previous years. Runs in process
+without MongoDB.
+
+Usage:
+    python -m benchmarks.bench_occurrences --payments 5000
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from bson import ObjectId
+
+from backend import recurring
+
+
+def make_payments(count, seed=0):
+    rng = random.Random(seed)
+    frequencies = ['monthly'] * 6 + ['weekly'] * 2 + ['yearly', 'daily']
+    return [{
+        '_id': ObjectId(),
+        'type': rng.choice(recurring.TYPES),
+        'category': 'Category %d' % rng.randrange(20),
+        'value': round(rng.uniform(1, 500), 2),
+        'startDate': (date(2015, 1, 1) + timedelta(days=rng.randrange(3650))).isoformat(),
+        'frequency': rng.choice(frequencies),
+        'description': '',
+    } for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--payments', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    payments = make_payments(args.payments)
+    start = date(2025, 1, 1)
+    end = recurring.add_months(start, 12)
+    print('payments                %8d' % args.payments)
+    for label, limit in (('full year', None), ('first page', recurring.DEFAULT_LIMIT)):
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            count = sum(1 for _ in recurring.expand(payments, start, end, limit))
+            timings.append(time.perf_counter() - started)
+        median = statistics.median(timings)
+        print('%-12s occurrences %8d' % (label, count))
+        print('%-12s p50         %8.2f ms' % (label, median * 1000))
+        print('%-12s per item    %8.3f us' % (label, median / max(count, 1) * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark: report aggregation latency, SQLite vs. MongoDB
+
+Seeds the same expenses (N per user for a number of users) into a
+scratch SQLite file and, unless --no-mongo is given, a scratch MongoDB
+database, then times the report pipeline for one user over the whole
+history and over one quarter. For SQLite it also times the generic
+Python pipeline, to show what the GROUP BY on the covering index saves.
+
+Usage:
+    python -m benchmarks.bench_reports --entries 10000 --users 20
+    python -m benchmarks.bench_reports --no-mongo
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient
+
+from backend import docquery, ledger, reports
+from backend.config import Config
+from backend.sqlite import SQLiteClient
+
+
+def make_expenses(users, entries, seed=0):
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    return [{'user': 'user-%04d' % u, 'category': 'Category %d' % rng.randrange(20),
+             'value': round(rng.uniform(1, 500), 2),
+             'date': start + timedelta(days=rng.randrange(5 * 365))}
+            for u in range(users) for _ in range(entries)]
+
+
+def time_report(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--entries', type=int, default=10000, help='expenses per user')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--uri', default=Config.MONGO_URI)
+    parser.add_argument('--db', default='budgetly_bench_reports')
+    parser.add_argument('--no-mongo', action='store_true')
+    args = parser.parse_args()
+
+    docs = make_expenses(args.users, args.entries)
+    ranges = {'all': (None, None),
+              'quarter': (datetime(2023, 1, 1), datetime(2023, 3, 31))}
+    tmp = tempfile.mkdtemp()
+    sqlite = SQLiteClient(os.path.join(tmp, 'bench.sqlite3'))[args.db]['expenses']
+    sqlite.create_indexes(ledger.LEDGER_INDEXES)
+    sqlite.insert_many([dict(doc) for doc in docs])
+    backends = [('sqlite', sqlite)]
+    if not args.no_mongo:
+        client = MongoClient(args.uri, serverSelectionTimeoutMS=2000)
+        client.drop_database(args.db)
+        mongo = client[args.db]['expenses']
+        mongo.create_indexes(ledger.LEDGER_INDEXES)
+        mongo.insert_many([dict(doc) for doc in docs])
+        backends.append(('mongo', mongo))
+
+    print('%d users x %d expenses' % (args.users, args.entries))
+    try:
+        for label, (start, end) in ranges.items():
+            for name, collection in backends:
+                ms = time_report(lambda: reports.summarize(collection, 'user-0000', start, end),
+                                 args.repeat)
+                print('%-8s %-18s p50 %9.2f ms' % (label, name, ms))
+            pipeline = reports.build_pipeline('user-0000', start, end)
+            ms = time_report(lambda: docquery.aggregate(
+                (doc for _, doc in sqlite._select(pipeline[0]['$match'])), pipeline[1:]),
+                args.repeat)
+            print('%-8s %-18s p50 %9.2f ms' % (label, 'sqlite (python)', ms))
+    finally:
+        if not args.no_mongo:
+            client.drop_database(args.db)
+        sqlite.database.client.close()
+        for name in os.listdir(tmp):
+            os.remove(os.path.join(tmp, name))
+        os.rmdir(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark: Flask's development server vs. gunicorn with backend.gunicorn_conf
+
+Starts `python -m backend.app` (the debug server, with its reloader) and
+gunicorn with the production settings, each on a port of its own, drives
+them with the bench_http load generator, and prints requests/sec and
+latency percentiles. The in-memory backend is the default, so only the
+servers are compared; use --backend mongo to include the database.
+
+Usage:
+    python -m benchmarks.bench_serving --connections 64 --duration 15
+    WEB_CONCURRENCY=8 GUNICORN_THREADS=8 python -m benchmarks.bench_serving
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_http import BENCH_SECRET_KEY, run_load, token_headers
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server on port %d did not start' % port)
+
+
+def serve(command, env, port):
+    """Start a server in its own process group and wait until it listens"""
+    process = subprocess.Popen(command, env=env, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(port)
+    except RuntimeError:
+        stop(process)
+        raise
+    return process
+
+
+def stop(process):
+    # The reloader and gunicorn workers are children of the started process
+    os.killpg(process.pid, signal.SIGTERM)
+    process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--path', default='/api/budget')
+    parser.add_argument('--connections', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=15.0)
+    parser.add_argument('--backend', default='memory', choices=('memory', 'sqlite', 'mongo'))
+    args = parser.parse_args()
+
+    base = dict(os.environ, DATABASE_BACKEND=args.backend, SQLITE_PATH=':memory:',
+                SECRET_KEY=BENCH_SECRET_KEY)
+    dev_port, prod_port = free_port(), free_port()
+    servers = [
+        ('dev server', [sys.executable, '-m', 'backend.app'],
+         dict(base, PORT=str(dev_port)), dev_port),
+        ('gunicorn', [sys.executable, '-m', 'gunicorn', '-c', 'python:backend.gunicorn_conf'],
+         dict(base, GUNICORN_BIND='127.0.0.1:%d' % prod_port), prod_port),
+    ]
+    print('%-12s %10s %10s %10s %8s' % ('server', 'req/s', 'p50 ms', 'p99 ms', 'errors'))
+    for label, command, env, port in servers:
+        process = serve(command, env, port)
+        try:
+            result = run_load('http://127.0.0.1:%d' % port, args.path,
+                              args.connections, args.duration, user_headers=token_headers())
+        finally:
+            stop(process)
+        if not result['requests']:
+            print('%-12s no successful requests (%d errors)' % (label, result['errors']))
+            continue
+        print('%-12s %10.0f %10.2f %10.2f %8d' % (label, result['rps'], result['p50_ms'],
+                                                   result['p99_ms'], result['errors']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark: app startup time and per-request connection overhead
+
+Measures how long importing backend.app takes in a fresh interpreter, the
+latency of the first request (which opens the pool and creates indexes)
+and of warm requests, and counts pool connections created and checked out.
+
+Usage:
+    python -m benchmarks.bench_startup --requests 1000
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+from pymongo import monitoring
+
+
+class PoolCounter(monitoring.ConnectionPoolListener):
+    """Counts pool connections and the time spent waiting to check one out"""
+
+    def __init__(self):
+        self.created = 0
+        self.checked_out = 0
+        self.started = {}
+        self.wait = 0.0
+
+    def connection_created(self, event):
+        self.created += 1
+
+    def connection_check_out_started(self, event):
+        self.started[event.address] = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        self.checked_out += 1
+        started = self.started.pop(event.address, None)
+        if started is not None:
+            self.wait += time.perf_counter() - started
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): pass
+    def connection_check_out_failed(self, event): pass
+    def connection_checked_in(self, event): pass
+
+
+def import_time():
+    """Seconds to import backend.app in a fresh interpreter"""
+    code = ('import time; t = time.perf_counter(); import backend.app; '
+            'print(time.perf_counter() - t)')
+    output = subprocess.check_output([sys.executable, '-c', code])
+    return float(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--db', default='budgetly_bench')
+    args = parser.parse_args()
+
+    counter = PoolCounter()
+    monitoring.register(counter)
+    from backend.app import create_app
+    app = create_app({'MONGO_DB': args.db})
+    client = app.test_client()
+
+    print('import backend.app      %8.1f ms' % (import_time() * 1000))
+
+    started = time.perf_counter()
+    client.get('/api/budget')
+    print('first request           %8.2f ms' % ((time.perf_counter() - started) * 1000))
+
+    latencies = []
+    for _ in range(args.requests):
+        started = time.perf_counter()
+        client.get('/api/budget')
+        latencies.append(time.perf_counter() - started)
+    print('warm request p50        %8.3f ms' % (statistics.median(latencies) * 1000))
+    print('warm request mean       %8.3f ms' % (statistics.mean(latencies) * 1000))
+    print('connections created     %8d' % counter.created)
+    print('checkouts               %8d' % counter.checked_out)
+    print('mean checkout wait      %8.3f ms' % (
+        counter.wait / max(counter.checked_out, 1) * 1000))
+
+    app.extensions['mongo'].client.drop_database(args.db)
+
+
+if __name__ == '__main__':
+    main()
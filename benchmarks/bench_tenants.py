@@ -0,0 +1,87 @@
+"""
+Benchmark: per-request latency as the number of tenants grows
+
+Seeds a scratch database with a budget and a few ledger entries per user
+in steps (100, 1000, 10000 users by default), and after each step times
+authenticated GET /api/budget and GET /api/expenses requests for random
+users. With every index leading on `user`, latency should stay flat as
+the tenant count grows.
+
+Usage:
+    python -m benchmarks.bench_tenants --users 100,1000,10000 --requests 2000
+    python -m benchmarks.bench_tenants --backend memory   # no MongoDB needed
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from backend.app import create_app
+from backend.config import Config
+from benchmarks.bench_budget_upsert import percentile
+
+
+def seed(db, first, last, entries):
+    """Add users first..last-1, each with a budget and `entries` expenses"""
+    users = ['user-%06d' % i for i in range(first, last)]
+    db['balances'].insert_many([{'user': u, 'budget': 1000.0, 'currency': 'USD'}
+                                for u in users], ordered=False)
+    day = datetime(2024, 1, 1)
+    db['expenses'].insert_many([
+        {'user': u, 'category': 'Food', 'value': 1.0 + n,
+         'date': day + timedelta(days=n)}
+        for u in users for n in range(entries)
+    ], ordered=False)
+
+
+def measure(client, authenticator, users, requests, path, rng):
+    latencies = []
+    for _ in range(requests):
+        token = authenticator.issue('user-%06d' % rng.randrange(users))
+        headers = {'Authorization': 'Bearer ' + token}
+        started = time.perf_counter()
+        response = client.get(path, headers=headers)
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', default='100,1000,10000',
+                        help='comma-separated tenant counts to measure at')
+    parser.add_argument('--entries', type=int, default=20, help='expenses per user')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--backend', default='mongo', choices=('mongo', 'sqlite', 'memory'))
+    parser.add_argument('--uri', default=Config.MONGO_URI)
+    parser.add_argument('--db', default='budgetly_bench_tenants')
+    args = parser.parse_args()
+
+    app = create_app({'DATABASE_BACKEND': args.backend, 'SQLITE_PATH': ':memory:',
+                      'MONGO_URI': args.uri, 'MONGO_DB': args.db,
+                      'CACHE_BACKEND': 'none', 'SECRET_KEY': 'bench'})
+    state = app.extensions['mongo']
+    state.client.drop_database(args.db)
+    client = app.test_client()
+    authenticator = app.extensions['auth']
+    rng = random.Random(0)
+    client.get('/api/budget')  # create indexes before seeding
+
+    seeded = 0
+    print('%8s  %-14s %10s %10s %10s' % ('users', 'path', 'p50 ms', 'p99 ms', 'mean ms'))
+    try:
+        for users in sorted(int(n) for n in args.users.split(',')):
+            seed(state.db, seeded, users, args.entries)
+            seeded = users
+            for path in ('/api/budget', '/api/expenses'):
+                latencies = measure(client, authenticator, users, args.requests, path, rng)
+                print('%8d  %-14s %10.3f %10.3f %10.3f' % (
+                    users, path, statistics.median(latencies) * 1000,
+                    percentile(latencies, 99) * 1000, statistics.mean(latencies) * 1000))
+    finally:
+        state.client.drop_database(args.db)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+"""
+Benchmark suite: API and data layer timings as JSON, compared across commits
+
+Runs a fixed set of cases with fixed seeds and writes one JSON document
+holding, for every case, the number of calls, ops/sec and the p50, p99
+and mean latency, along with the commit, Python version and machine:
+
+- api.*: GET/POST /api/budget, ledger inserts and listing, reports (from
+  the monthly rollups and over an arbitrary date range) and CSV export,
+  through the Flask test client on the in-memory database
+- http.*: the same requests over HTTP against gunicorn with
+  backend.gunicorn_conf (one worker, so every request sees the seeded
+  data), plus a concurrent GET /api/budget load (--http)
+- data.localdb.<rows>.*: the db.ts API of backend.localdb (insert, get,
+  update and delete by id, category and one-month lookups, full listing)
+  at 1k, 100k and 1M rows
+- data.mock_db.<rows>.*: the same operations through tests/mock_db.py,
+  which re-serializes the collection on every write, at 1k rows
+
+--compare takes an earlier results file and flags every case whose p50
+moved by more than --threshold (default 20%). The exit status is 1 if
+any case got slower, so CI can fail on regressions.
+
+Usage:
+    python -m benchmarks.suite --output bench-results/main.json
+    python -m benchmarks.suite --quick --compare bench-results/main.json
+    python -m benchmarks.suite --http --rows 1000 100000 --output head.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from backend.localdb import LocalDB
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tests'))
+import mock_db  # noqa: E402
+
+SCHEMA = 1
+DEFAULT_ROWS = [1000, 100000, 1000000]
+QUICK_ROWS = [1000, 100000]
+MOCK_DB_MAX = 1000
+BENCH_USER = 'bench-reader'
+WRITER_USER = 'bench-writer'
+
+
+# Timing
+
+def summarize(latencies):
+    """Statistics for per-call latencies in seconds"""
+    ordered = sorted(latencies)
+    total = sum(ordered)
+    index = min(len(ordered) - 1, int(round(0.99 * (len(ordered) - 1))))
+    return {
+        'calls': len(ordered),
+        'ops_per_sec': len(ordered) / total if total else None,
+        'p50_us': statistics.median(ordered) * 1e6,
+        'p99_us': ordered[index] * 1e6,
+        'mean_us': total / len(ordered) * 1e6,
+    }
+
+
+def timed(func, calls, warmup=0):
+    """Call func(i) for i in range(calls), after `warmup` untimed calls"""
+    for i in range(warmup):
+        func(i)
+    latencies = []
+    clock = time.perf_counter
+    for i in range(calls):
+        started = clock()
+        func(i)
+        latencies.append(clock() - started)
+    return summarize(latencies)
+
+
+# API
+
+def entry(rng, day=date(2023, 1, 1)):
+    return {'category': 'Category %d' % rng.randrange(20),
+            'value': round(rng.uniform(1, 500), 2),
+            'date': (day + timedelta(days=rng.randrange(730))).isoformat()}
+
+
+def api_requests():
+    """(case, method, path, body) for the API cases; reads go to the seeded user"""
+    rng = random.Random(2)
+    return [
+        ('budget.get', 'GET', '/api/budget', None),
+        ('budget.post', 'POST', '/api/budget', lambda i: {'budget': 1000.0 + i, 'currency': 'USD'}),
+        ('expenses.post', 'POST', '/api/expenses', lambda i: entry(rng)),
+        ('expenses.list', 'GET', '/api/expenses?limit=50', None),
+        ('reports.rollups', 'GET', '/api/reports', None),
+        ('reports.range', 'GET', '/api/reports?from=2023-02-10&to=2024-03-20', None),
+        ('export.csv', 'GET', '/api/export?format=csv', None),
+    ]
+
+
+def seed_entries(count):
+    rng = random.Random(1)
+    return [entry(rng) for _ in range(count)]
+
+
+def run_api(send, prefix, entries, calls):
+    """Seed the reader's ledgers through `send`, then time every request"""
+    for kind in ('expenses', 'income'):
+        status = send('POST', '/api/%s/bulk' % kind, entries, BENCH_USER)
+        assert status < 400, status
+    results = {}
+    for name, method, path, body in api_requests():
+        user = WRITER_USER if method == 'POST' else BENCH_USER
+        # Exports read every entry, so they get fewer calls
+        count = max(calls // 20, 5) if name.startswith('export') else calls
+
+        def call(i, method=method, path=path, body=body, user=user):
+            status = send(method, path, body(i) if body else None, user)
+            assert status < 400, (path, status)
+
+        results['%s.%s' % (prefix, name)] = timed(call, count, warmup=min(count, 10))
+    return results
+
+
+def inprocess_sender(app):
+    client = app.test_client()
+
+    def send(method, path, body, user):
+        response = client.open(path, method=method, json=body, headers={'X-User-Id': user})
+        response.get_data()
+        return response.status_code
+    return send
+
+
+def http_sender(port, user_headers):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+
+    def send(method, path, body, user):
+        headers = user_headers(user)
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        conn.request(method, path, body=payload, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    return send
+
+
+def bench_api(entries, calls):
+    from backend.app import create_app
+    app = create_app({'DATABASE_BACKEND': 'memory'})
+    return run_api(inprocess_sender(app), 'api', entries, calls)
+
+
+def bench_http(entries, calls, duration):
+    from benchmarks.bench_http import BENCH_SECRET_KEY, run_load, token_headers
+    from benchmarks.bench_serving import free_port, serve, stop
+
+    port = free_port()
+    env = dict(os.environ, DATABASE_BACKEND='memory', WEB_CONCURRENCY='1',
+               GUNICORN_BIND='127.0.0.1:%d' % port, SECRET_KEY=BENCH_SECRET_KEY)
+    user_headers = token_headers()
+    process = serve([sys.executable, '-m', 'gunicorn', '-c', 'python:backend.gunicorn_conf'],
+                    env, port)
+    try:
+        results = run_api(http_sender(port, user_headers), 'http', entries, calls)
+        load = run_load('http://127.0.0.1:%d' % port, '/api/budget', 16, duration,
+                        user_headers=user_headers)
+    finally:
+        stop(process)
+    results['http.load.budget.get'] = {
+        'calls': load['requests'], 'ops_per_sec': load.get('rps'),
+        'p50_us': load.get('p50_ms', 0) * 1000, 'p99_us': load.get('p99_ms', 0) * 1000,
+        'errors': load['errors']}
+    return results
+
+
+# Data layer
+
+def bench_data(prefix, db, rows, ops):
+    """Time the db.ts operations on `db` (LocalDB or the mock_db module)"""
+    rng = random.Random(3)
+    start = date(2015, 1, 1)
+    results = {}
+    results[prefix + '.insert'] = timed(lambda i: db.addExpense(
+        'Category %d' % (i % 20), float(i % 500),
+        (start + timedelta(days=i % 3650)).isoformat()), rows)
+    expenses = db.getExpensesList()
+    ids = [item['id'] for item in rng.sample(expenses, min(ops, rows))]
+    del expenses
+    months = ['20%02d-%02d' % (rng.randrange(15, 25), rng.randrange(1, 13)) for _ in range(20)]
+
+    for _ in range(len(ids)):
+        db.addBudgetGoal('expense', 'monthly', 100)
+    goals = [goal['id'] for goal in db.getBudgetGoalsList()]
+    results[prefix + '.list'] = timed(lambda i: db.getExpensesList(), 3)
+    results[prefix + '.goal_update'] = timed(lambda i: db.updateBudgetGoal(goals[i], 200),
+                                             len(goals))
+    results[prefix + '.goal_delete'] = timed(lambda i: db.deleteBudgetGoal(goals[i]),
+                                             len(goals))
+    if isinstance(db, LocalDB):
+        store = db.store
+        results[prefix + '.get'] = timed(lambda i: store.get('expenses', ids[i]), len(ids))
+        results[prefix + '.update'] = timed(lambda i: store.put(
+            'expenses', ids[i], dict(store.get('expenses', ids[i]), value=1.0)), len(ids))
+        results[prefix + '.by_category'] = timed(
+            lambda i: db.getEntriesByCategory('expenses', 'Category %d' % i), 20)
+        results[prefix + '.month'] = timed(
+            lambda i: db.getEntriesBetween('expenses', months[i] + '-01', months[i] + '-31'), 20)
+        results[prefix + '.delete'] = timed(lambda i: store.delete('expenses', ids[i]), len(ids))
+    return results
+
+
+def bench_localdb(rows, ops):
+    return bench_data('data.localdb.%d' % rows, LocalDB(), rows, ops)
+
+
+def bench_mock_db(rows, ops):
+    mock_db.localStorage.clear()
+    try:
+        return bench_data('data.mock_db.%d' % rows, mock_db, rows, ops)
+    finally:
+        mock_db.localStorage.clear()
+
+
+# Results
+
+def environment():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True,
+                                         stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(baseline, current, threshold):
+    """(case, old p50, new p50, change, verdict) for the cases in both runs"""
+    rows = []
+    for case, result in sorted(current['cases'].items()):
+        old = baseline.get('cases', {}).get(case)
+        if not old or not old.get('p50_us') or not result.get('p50_us'):
+            continue
+        change = result['p50_us'] / old['p50_us'] - 1
+        verdict = ''
+        if change > threshold:
+            verdict = 'REGRESSION'
+        elif change < -threshold:
+            verdict = 'improved'
+        rows.append((case, old['p50_us'], result['p50_us'], change, verdict))
+    return rows
+
+
+def print_results(results):
+    print('%-40s %8s %12s %12s %12s' % ('case', 'calls', 'ops/s', 'p50 us', 'p99 us'))
+    for case, result in sorted(results['cases'].items()):
+        print('%-40s %8d %12.0f %12.2f %12.2f' % (case, result['calls'],
+                                                  result['ops_per_sec'] or 0,
+                                                  result['p50_us'], result['p99_us']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, nargs='+',
+                        help='data layer sizes (default 1000 100000 1000000)')
+    parser.add_argument('--quick', action='store_true',
+                        help='fewer calls and no 1M-row data layer run')
+    parser.add_argument('--http', action='store_true', help='also run the cases over HTTP')
+    parser.add_argument('--entries', type=int, default=1000,
+                        help='ledger entries seeded for the API read cases')
+    parser.add_argument('--output', help='write the JSON results here')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative p50 change that counts as a regression')
+    args = parser.parse_args()
+
+    rows = args.rows or (QUICK_ROWS if args.quick else DEFAULT_ROWS)
+    calls = 200 if args.quick else 1000
+    ops = 200 if args.quick else 1000
+    entries = seed_entries(args.entries)
+
+    cases = {}
+    cases.update(bench_api(entries, calls))
+    if args.http:
+        cases.update(bench_http(entries, calls, 5.0 if args.quick else 15.0))
+    for count in rows:
+        cases.update(bench_localdb(count, ops))
+        if count <= MOCK_DB_MAX:
+            cases.update(bench_mock_db(count, ops))
+
+    results = {'schema': SCHEMA, 'environment': environment(),
+               'settings': {'rows': rows, 'calls': calls, 'ops': ops,
+                            'entries': args.entries, 'http': args.http},
+               'cases': cases}
+    print_results(results)
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(baseline, results, args.threshold)
+        print('\n%-40s %12s %12s %9s' % ('compared with ' + (baseline['environment'].get(
+            'commit') or args.compare)[:12], 'old p50 us', 'new p50 us', 'change'))
+        for case, old, new, change, verdict in rows:
+            print('%-40s %12.2f %12.2f %+8.1f%%  %s' % (case, old, new, change * 100, verdict))
+        if any(verdict == 'REGRESSION' for *_, verdict in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
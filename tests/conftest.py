@@ -2,7 +2,7 @@
 Pytest configuration and shared fixtures for Budgetly tests
 """
 import pytest
-from unittest.mock import Mock, patch
+from unittest.mock import Mock
 import json
 
 
@@ -77,37 +77,19 @@ def sample_recurring_payment():
 
 
 @pytest.fixture
-def mock_flask_app():
-    """Mock Flask app for API testing"""
-    from flask import Flask
-
-    app = Flask(__name__)
-
-    # Mock the database functions
-    with patch('backend.app.addExpense'), \
-         patch('backend.app.getExpenses'), \
-         patch('backend.app.addIncome'), \
-         patch('backend.app.getIncomes'), \
-         patch('backend.app.addBudgetGoal'), \
-         patch('backend.app.getBudgetGoals'), \
-         patch('backend.app.addRecurringPayment'), \
-         patch('backend.app.getRecurringPayments'), \
-         patch('backend.app.updateRecurringPayment'), \
-         patch('backend.app.deleteRecurringPayment'), \
-         patch('backend.app.addExpenseCategory'), \
-         patch('backend.app.getExpenseCategories'), \
-         patch('backend.app.addIncomeCategory'), \
-         patch('backend.app.getIncomeCategories'), \
-         patch('backend.app.updateBudgetGoal'), \
-         patch('backend.app.deleteBudgetGoal'):
-
-        yield app
+def app():
+    """The Flask app on a fresh in-memory database"""
+    from backend.app import create_app
+
+    app = create_app({'TESTING': True, 'DATABASE_BACKEND': 'memory'})
+    yield app
+    app.extensions['mongo'].close()
 
 
 @pytest.fixture
-def client(mock_flask_app):
+def client(app):
     """Flask test client"""
-    return mock_flask_app.test_client()
+    return app.test_client()
 
 
 @pytest.fixture(autouse=True)
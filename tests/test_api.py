@@ -2,16 +2,11 @@
 Tests for the Budgetly Flask API
 """
 import json
-import pytest
-from backend.app import app
-
+import uuid
+from datetime import datetime
 
-@pytest.fixture
-def client():
-    """Create a test client for the Flask app"""
-    app.config['TESTING'] = True
-    with app.test_client() as client:
-        yield client
+import pytest
+from backend.app import create_app
 
 
 @pytest.fixture
@@ -105,4 +100,619 @@ class TestBudgetAPI:
         response = client.get('/api/budget')
         data = json.loads(response.data)
         assert data['budget'] == new_budget['budget']
-        assert data['currency'] == new_budget['currency']
\ No newline at end of file
+        assert data['currency'] == new_budget['currency']
+
+    def test_set_budget_write_concern(self, client, sample_budget_data):
+        """Test that the write concern can be chosen per request"""
+        response = client.post('/api/budget?w=1&j=true',
+                               data=json.dumps(sample_budget_data),
+                               content_type='application/json')
+        assert response.status_code == 200
+
+        response = client.post('/api/budget?w=fast',
+                               data=json.dumps(sample_budget_data),
+                               content_type='application/json')
+        assert response.status_code == 400
+
+    def test_budget_is_per_user(self, client, sample_budget_data):
+        """Test that each owner has their own budget document"""
+        owner = {'X-User-Id': str(uuid.uuid4())}
+        client.post('/api/budget', json=sample_budget_data, headers=owner)
+
+        other = client.get('/api/budget', headers={'X-User-Id': str(uuid.uuid4())})
+        assert other.get_json() == {'budget': 0, 'currency': 'IRR'}
+
+        mine = client.get('/api/budget', headers=owner)
+        assert mine.get_json() == sample_budget_data
+
+    def test_budget_etag(self, client, sample_budget_data):
+        """Test conditional GETs and that a write changes the ETag"""
+        owner = {'X-User-Id': str(uuid.uuid4())}
+        response = client.get('/api/budget', headers=owner)
+        etag = response.headers['ETag']
+
+        response = client.get('/api/budget', headers=dict(owner, **{'If-None-Match': etag}))
+        assert response.status_code == 304
+
+        client.post('/api/budget', json=sample_budget_data, headers=owner)
+        response = client.get('/api/budget', headers=dict(owner, **{'If-None-Match': etag}))
+        assert response.status_code == 200
+        assert response.get_json() == sample_budget_data
+        assert response.headers['ETag'] != etag
+
+    def test_budget_cache_race(self, app, client, monkeypatch, sample_budget_data):
+        """Test that a read racing a write cannot cache the old budget"""
+        from backend import budget
+        owner = {'X-User-Id': str(uuid.uuid4())}
+        load_budget = budget.load_budget
+
+        def load_then_write(collection, user):
+            # The old budget is read, then a POST lands before it is cached
+            data = load_budget(collection, user)
+            app.test_client().post('/api/budget', json=sample_budget_data, headers=owner)
+            return data
+
+        monkeypatch.setattr(budget, 'load_budget', load_then_write)
+        assert client.get('/api/budget', headers=owner).get_json()['budget'] == 0
+        monkeypatch.setattr(budget, 'load_budget', load_budget)
+        assert client.get('/api/budget', headers=owner).get_json() == sample_budget_data
+
+    def test_cache_stats(self, client):
+        """Test that budget cache counters are exposed"""
+        owner = {'X-User-Id': str(uuid.uuid4())}
+        before = client.get('/api/cache/stats').get_json()['budget']
+        client.get('/api/budget', headers=owner)
+        client.get('/api/budget', headers=owner)
+        after = client.get('/api/cache/stats').get_json()['budget']
+        assert after['misses'] == before['misses'] + 1
+        assert after['hits'] == before['hits'] + 1
+
+    def test_set_budget_non_object(self, client):
+        """Test that a budget body must be a JSON object"""
+        response = client.post('/api/budget', json=[1, 2, 3])
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize('body', [
+        {'$set': 1}, {'budget': 1, 'a.b': 2}, {'budget': 1, 'user': 'mallory'},
+        {'budget': '100'}, {'budget': True}, {'currency': ''},
+    ])
+    def test_set_budget_rejects_fields(self, client, body):
+        """Test that only a numeric budget and a currency can be stored"""
+        response = client.post('/api/budget', json=body)
+        assert response.status_code == 400
+        assert 'error' in response.get_json()
+        assert client.get('/api/budget').get_json() == {'budget': 0, 'currency': 'IRR'}
+
+    def test_set_budget_rejects_non_finite(self, client):
+        """Test that NaN and Infinity literals are rejected"""
+        response = client.post('/api/budget', data='{"budget": NaN}',
+                               content_type='application/json')
+        assert response.status_code == 400
+
+@pytest.fixture
+def user_headers():
+    """Headers for a fresh user so ledger tests don't see each other's rows"""
+    return {'X-User-Id': str(uuid.uuid4())}
+
+
+class TestLedgerAPI:
+    """Test cases for expense/income ledger endpoints"""
+
+    def test_add_and_list_expenses(self, client, user_headers, sample_expense_data):
+        """Test adding an expense and listing it back"""
+        response = client.post('/api/expenses', json=sample_expense_data,
+                               headers=user_headers)
+        assert response.status_code == 201
+        created = response.get_json()
+        assert created['category'] == 'Food'
+        assert created['date'] == '2024-01-01'
+
+        response = client.get('/api/expenses', headers=user_headers)
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['items'] == [created]
+        assert data['next_cursor'] is None
+
+    def test_cursor_pagination(self, client, user_headers):
+        """Test that paging with cursors visits every entry exactly once"""
+        for day in range(1, 8):
+            client.post('/api/income',
+                        json={'category': 'Salary', 'value': day,
+                              'date': '2024-01-0%d' % (day % 3 + 1)},
+                        headers=user_headers)
+
+        seen = []
+        url = '/api/income?limit=3'
+        while url:
+            data = client.get(url, headers=user_headers).get_json()
+            seen.extend(data['items'])
+            url = ('/api/income?limit=3&cursor=' + data['next_cursor']
+                   if data['next_cursor'] else None)
+
+        assert len(seen) == 7
+        assert len({item['id'] for item in seen}) == 7
+        dates = [item['date'] for item in seen]
+        assert dates == sorted(dates, reverse=True)
+
+    def test_filter_by_category_and_date(self, client, user_headers):
+        """Test category and date range filters"""
+        for category, date in [('Food', '2024-01-01'), ('Food', '2024-02-01'),
+                               ('Rent', '2024-02-01')]:
+            client.post('/api/expenses',
+                        json={'category': category, 'value': 10, 'date': date},
+                        headers=user_headers)
+
+        response = client.get('/api/expenses?category=Food&from=2024-01-15',
+                              headers=user_headers)
+        items = response.get_json()['items']
+        assert [(i['category'], i['date']) for i in items] == [('Food', '2024-02-01')]
+
+    def test_update_and_delete_expense(self, client, user_headers, sample_expense_data):
+        """Test updating and deleting an expense by id"""
+        created = client.post('/api/expenses', json=sample_expense_data,
+                              headers=user_headers).get_json()
+
+        updated = dict(sample_expense_data, value=75.0)
+        response = client.put('/api/expenses/' + created['id'], json=updated,
+                              headers=user_headers)
+        assert response.status_code == 200
+        assert response.get_json()['value'] == 75.0
+
+        response = client.delete('/api/expenses/' + created['id'], headers=user_headers)
+        assert response.status_code == 204
+        response = client.delete('/api/expenses/' + created['id'], headers=user_headers)
+        assert response.status_code == 404
+
+    def test_bulk_add_expenses(self, client, user_headers):
+        """Test bulk ingest in small batches, with the rejected rows listed"""
+        rows = [{'category': 'Food', 'value': i, 'date': '2024-01-01'}
+                for i in range(5)]
+        rows.insert(2, {'category': 'Food', 'value': 'abc', 'date': '2024-01-01'})
+        response = client.post('/api/expenses/bulk?chunk_size=2',
+                               data=json.dumps(rows),
+                               content_type='application/json',
+                               headers=user_headers)
+        assert response.status_code == 200
+        summary = response.get_json()
+        assert (summary['inserted'], summary['failed']) == (5, 1)
+        assert [error['index'] for error in summary['errors']] == [2]
+        assert [row['index'] for row in summary['ids']] == [0, 1, 3, 4, 5]
+
+        items = client.get('/api/expenses', headers=user_headers).get_json()['items']
+        assert {item['id'] for item in items} == {row['id'] for row in summary['ids']}
+
+    def test_bulk_add_income_ndjson(self, client, user_headers, sample_income_data):
+        """Test bulk ingest of an NDJSON body"""
+        body = '\n'.join(json.dumps(sample_income_data) for _ in range(3))
+        response = client.post('/api/income/bulk', data=body,
+                               content_type='application/x-ndjson',
+                               headers=user_headers)
+        summary = response.get_json()
+        assert (summary['inserted'], summary['failed'], summary['errors']) == (3, 0, [])
+        assert [row['index'] for row in summary['ids']] == [0, 1, 2]
+
+    def test_bulk_add_rejects_non_finite_values(self, client, user_headers):
+        """Test that NaN and Infinity literals are rejected row by row"""
+        body = ('[{"category": "a", "value": NaN, "date": "2024-01-01"},'
+                ' {"category": "a", "value": Infinity, "date": "2024-01-01"},'
+                ' {"category": "a", "value": 2, "date": "2024-01-01"}]')
+        response = client.post('/api/expenses/bulk', data=body,
+                               content_type='application/json', headers=user_headers)
+        summary = response.get_json()
+        assert (summary['inserted'], summary['failed']) == (1, 2)
+        assert [(e['index'], e['error']) for e in summary['errors']] == [
+            (0, 'value must be a finite number'), (1, 'value must be a finite number')]
+        report = client.get('/api/reports', headers=user_headers).get_json()
+        assert report['monthly']['expenses'] == [2]
+
+    def test_bulk_add_reports_first_errors(self, client, user_headers):
+        """Test that only the first rejected rows are listed, and malformed bodies"""
+        rows = [{'category': 'Food', 'value': 'abc', 'date': '2024-01-01'}] * 150
+        response = client.post('/api/expenses/bulk', json=rows, headers=user_headers)
+        summary = response.get_json()
+        assert summary['failed'] == 150
+        assert [error['index'] for error in summary['errors']] == list(range(100))
+
+        body = '[{"category": "Food", "value": 1, "date": "2024-01-01"}, {"categ'
+        response = client.post('/api/expenses/bulk?chunk_size=1', data=body,
+                               content_type='application/json', headers=user_headers)
+        assert response.status_code == 400
+        assert response.get_json()['inserted'] == 1
+        assert 'malformed' in response.get_json()['error']
+
+    def test_add_expense_invalid_data(self, client, user_headers):
+        """Test that invalid entries are rejected"""
+        response = client.post('/api/expenses',
+                               json={'category': 'Food', 'value': 'abc',
+                                     'date': '2024-01-01'},
+                               headers=user_headers)
+        assert response.status_code == 400
+        assert 'error' in response.get_json()
+
+
+class TestReportsAPI:
+    """Test cases for the reports endpoint"""
+
+    def test_reports(self, client, user_headers):
+        """Test category totals and monthly series"""
+        for category, value, date in [('Food', 10, '2024-01-05'),
+                                      ('Food', 5, '2024-02-01'),
+                                      ('Rent', 100, '2024-02-03')]:
+            client.post('/api/expenses',
+                        json={'category': category, 'value': value, 'date': date},
+                        headers=user_headers)
+        client.post('/api/income',
+                    json={'category': 'Salary', 'value': 1000, 'date': '2024-03-01'},
+                    headers=user_headers)
+
+        response = client.get('/api/reports', headers=user_headers)
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['categories']['expenses'] == [
+            {'category': 'Rent', 'total': 100.0},
+            {'category': 'Food', 'total': 15.0},
+        ]
+        assert data['monthly'] == {
+            'labels': ['2024-01', '2024-02', '2024-03'],
+            'expenses': [10.0, 105.0, 0],
+            'incomes': [0, 0, 1000.0],
+        }
+
+    def test_reports_date_range(self, client, user_headers):
+        """Test that ?from= and ?to= limit the aggregated range"""
+        for date in ['2024-01-05', '2024-02-05']:
+            client.post('/api/expenses',
+                        json={'category': 'Food', 'value': 10, 'date': date},
+                        headers=user_headers)
+        response = client.get('/api/reports?from=2024-02-01&to=2024-02-28',
+                              headers=user_headers)
+        assert response.get_json()['monthly']['labels'] == ['2024-02']
+
+    def test_reports_follow_updates_and_deletes(self, client, user_headers):
+        """Test that edits and deletes are reflected in the monthly rollups"""
+        created = client.post('/api/expenses',
+                              json={'category': 'Food', 'value': 10, 'date': '2024-01-05'},
+                              headers=user_headers).get_json()
+        doomed = client.post('/api/expenses',
+                             json={'category': 'Gift', 'value': 50, 'date': '2024-01-06'},
+                             headers=user_headers).get_json()
+        client.put('/api/expenses/' + created['id'],
+                   json={'category': 'Rent', 'value': 30, 'date': '2024-02-05'},
+                   headers=user_headers)
+        client.delete('/api/expenses/' + doomed['id'], headers=user_headers)
+
+        data = client.get('/api/reports', headers=user_headers).get_json()
+        assert data['categories']['expenses'] == [{'category': 'Rent', 'total': 30.0}]
+        assert data['monthly']['labels'] == ['2024-02']
+
+
+class TestExportAPI:
+    """Test cases for the export endpoint"""
+
+    def test_export_csv(self, client, user_headers, sample_expense_data):
+        """Test that ledger rows appear in the CSV export"""
+        created = client.post('/api/expenses', json=sample_expense_data,
+                              headers=user_headers).get_json()
+        response = client.get('/api/export', headers=user_headers)
+        assert response.status_code == 200
+        assert response.mimetype == 'text/csv'
+        assert ('%s,Food,50.0,2024-01-01' % created['id']) in response.get_data(as_text=True)
+
+    def test_export_ndjson_gzip(self, client, user_headers, sample_income_data):
+        """Test gzip-encoded NDJSON export"""
+        import gzip
+        client.post('/api/income', json=sample_income_data, headers=user_headers)
+        response = client.get('/api/export?format=ndjson',
+                              headers=dict(user_headers, **{'Accept-Encoding': 'gzip'}))
+        assert response.headers['Content-Encoding'] == 'gzip'
+        rows = [json.loads(line) for line in gzip.decompress(response.data).splitlines()]
+        assert [r['section'] for r in rows] == ['incomes']
+
+    def test_export_unknown_format(self, client):
+        """Test that unsupported formats are rejected"""
+        assert client.get('/api/export?format=xml').status_code == 400
+
+
+class TestImportAPI:
+    """Test cases for the import endpoint"""
+
+    def test_export_import_round_trip(self, client, user_headers, sample_expense_data):
+        """Test that re-importing an export dedupes by id"""
+        client.post('/api/expenses', json=sample_expense_data, headers=user_headers)
+        exported = client.get('/api/export', headers=user_headers).data
+
+        response = client.post('/api/import', data=exported, content_type='text/csv',
+                               headers=user_headers)
+        assert response.status_code == 200
+        result = response.get_json()
+        assert result['written'] == 1
+        assert result['error_count'] == 0
+        assert 'rows_per_sec' in result
+
+        items = client.get('/api/expenses', headers=user_headers).get_json()['items']
+        assert len(items) == 1
+
+    def test_import_resumes_from_checkpoint(self, client, user_headers):
+        """Test that re-sending a finished import does no work"""
+        body = b'Expenses\nid,category,value,date\n,Food,1,2024-01-01\n'
+        url = '/api/import?import_id=' + str(uuid.uuid4())
+        first = client.post(url, data=body, content_type='text/csv',
+                            headers=user_headers).get_json()
+        second = client.post(url, data=body, content_type='text/csv',
+                             headers=user_headers).get_json()
+        assert first['written'] == 1
+        assert second['already_complete'] is True
+        items = client.get('/api/expenses', headers=user_headers).get_json()['items']
+        assert len(items) == 1
+
+    def test_import_rejects_non_utf8(self, client, user_headers):
+        """Test that an upload that is not UTF-8 is a 400, not a server error"""
+        body = 'Expenses\nid,category,value,date\n,Caf\xe9,1,2024-01-01\n'.encode('latin-1')
+        response = client.post('/api/import', data=body, content_type='text/csv',
+                               headers=user_headers)
+        assert response.status_code == 400
+        assert 'UTF-8' in response.get_json()['error']
+
+    def test_import_moves_totals_of_replaced_rows(self, app, client, user_headers):
+        """Test that re-imported rows move rollups, buckets and reminders by delta"""
+        from backend import rollups
+
+        db = app.extensions['mongo'].db
+        user = user_headers['X-User-Id']
+        app.config['IMPORT_BATCH_SIZE'] = 2
+        kept = client.post('/api/expenses', json={'category': 'Food', 'value': 7,
+                                                  'date': '2024-01-20'},
+                           headers=user_headers).get_json()
+        first = ('Expenses\nid,category,value,date\n'
+                 '6ad4d66998fa090c5e119dd4,Rent,100,2024-01-02\n'
+                 '6ad4d66998fa090c5e119dd5,Food,10,2024-01-03\n')
+        client.post('/api/import', data=first.encode(), content_type='text/csv',
+                    headers=user_headers)
+        # One row moves month and category, one changes value, and the last
+        # row repeats an id within its batch, so only its second value counts
+        second = ('Expenses\nid,category,value,date\n'
+                  '6ad4d66998fa090c5e119dd4,Fun,50,2024-02-02\n'
+                  '6ad4d66998fa090c5e119dd5,Food,12,2024-01-03\n'
+                  '6ad4d66998fa090c5e119dd6,Food,1,2024-01-04\n'
+                  '6ad4d66998fa090c5e119dd6,Food,3,2024-01-04\n'
+                  '\n'
+                  'Recurring Payments\n'
+                  'id,type,category,value,start_date,frequency,note,reminders\n'
+                  ',expense,Rent,900,2024-01-31,monthly,,"[{""days"":1}]"\n')
+        result = client.post('/api/import', data=second.encode(), content_type='text/csv',
+                             headers=user_headers).get_json()
+        assert result['error_count'] == 0
+
+        assert rollups.verify(db, user) == []
+        january = db['period_totals'].find_one({'user': user, 'type': 'expense',
+                                                'period': 'monthly',
+                                                'start': datetime(2024, 1, 1)})
+        assert (january['total'], january['count']) == (7 + 12 + 3, 3)
+        assert db['reminder_schedule'].count_documents({'user': user}) == 1
+        items = client.get('/api/expenses', headers=user_headers).get_json()['items']
+        assert kept['id'] in {item['id'] for item in items}
+        assert len(items) == 4
+
+    def test_import_logs_written_rows(self, app, client, user_headers):
+        """Test that an import adds one sync log entry per written row"""
+        app.config['IMPORT_BATCH_SIZE'] = 2
+        client.post('/api/expenses', json={'category': 'Food', 'value': 1,
+                                           'date': '2024-01-01'}, headers=user_headers)
+        before = client.get('/api/sync', headers=user_headers).get_json()['changes']
+
+        body = b'Expenses\nid,category,value,date\n' + b''.join(
+            b',Rent,%d,2024-01-%02d\n' % (i, i + 1) for i in range(5)) + b',Bad,x,2024-01-01\n'
+        result = client.post('/api/import', data=body, content_type='text/csv',
+                             headers=user_headers).get_json()
+        assert (result['written'], result['error_count']) == (5, 1)
+
+        changes = client.get('/api/sync', headers=user_headers).get_json()['changes']
+        assert len(changes) == len(before) + 5
+        assert changes[:len(before)] == before
+        assert changes[-1]['seq'] == before[-1]['seq'] + 5
+        assert sorted(c['doc']['value'] for c in changes[len(before):]) == [0, 1, 2, 3, 4]
+
+
+class TestRecurringAPI:
+    """Test cases for recurring payment endpoints"""
+
+    def test_recurring_crud(self, client, user_headers):
+        """Test creating, updating, listing and deleting a payment"""
+        payment = {'type': 'expense', 'category': 'Rent', 'value': 900,
+                   'startDate': '2024-01-31', 'frequency': 'monthly'}
+        created = client.post('/api/recurring', json=payment, headers=user_headers)
+        assert created.status_code == 201
+        payment_id = created.get_json()['id']
+
+        updated = client.put('/api/recurring/' + payment_id,
+                             json=dict(payment, value=950), headers=user_headers)
+        assert updated.get_json()['value'] == 950.0
+        listed = client.get('/api/recurring', headers=user_headers).get_json()
+        assert [p['id'] for p in listed] == [payment_id]
+
+        assert client.delete('/api/recurring/' + payment_id,
+                             headers=user_headers).status_code == 204
+        assert client.get('/api/recurring', headers=user_headers).get_json() == []
+
+    def test_occurrences(self, client, user_headers):
+        """Test that occurrences of all payments are merged in date order"""
+        client.post('/api/recurring', headers=user_headers, json={
+            'type': 'expense', 'category': 'Rent', 'value': 900,
+            'startDate': '2024-01-31', 'frequency': 'monthly'})
+        client.post('/api/recurring', headers=user_headers, json={
+            'type': 'income', 'category': 'Salary', 'value': 2000,
+            'startDate': '2024-01-15', 'frequency': 'monthly'})
+        response = client.get('/api/recurring/occurrences?from=2024-02-01&to=2024-03-31',
+                              headers=user_headers)
+        data = response.get_json()
+        assert [(o['date'], o['category']) for o in data['occurrences']] == [
+            ('2024-02-15', 'Salary'),
+            ('2024-02-29', 'Rent'),
+            ('2024-03-15', 'Salary'),
+            ('2024-03-31', 'Rent'),
+        ]
+
+    def test_occurrences_invalid_window(self, client):
+        """Test that a window ending before it starts is rejected"""
+        response = client.get('/api/recurring/occurrences?from=2024-02-01&to=2024-01-01')
+        assert response.status_code == 400
+
+    def test_reminders_follow_payment_changes(self, app, client, user_headers):
+        """Test that reminders are scheduled and dropped with their payment"""
+        schedule = app.extensions['mongo'].db['reminder_schedule']
+        user = {'user': user_headers['X-User-Id']}
+        created = client.post('/api/recurring', headers=user_headers, json={
+            'type': 'expense', 'category': 'Rent', 'value': 900,
+            'startDate': '2024-01-31', 'frequency': 'monthly',
+            'reminders': [{'days': 1}, {'hours': 2}]}).get_json()
+        assert schedule.count_documents(user) == 2
+        client.delete('/api/recurring/' + created['id'], headers=user_headers)
+        assert schedule.count_documents(user) == 0
+        assert client.get('/api/notifications', headers=user_headers).get_json() == []
+
+
+class TestForecastAPI:
+    """Test cases for the forecast endpoint"""
+
+    def test_forecast(self, client, user_headers):
+        """Test that the forecast starts from the stored budget"""
+        client.post('/api/budget', json={'budget': 500, 'currency': 'USD'},
+                    headers=user_headers)
+        client.post('/api/recurring', headers=user_headers, json={
+            'type': 'income', 'category': 'Salary', 'value': 100,
+            'startDate': '2000-01-01', 'frequency': 'monthly'})
+        data = client.get('/api/forecast?months=60', headers=user_headers).get_json()
+        assert len(data['months']) == 60
+        assert data['start_balance'] == 500
+        assert data['balance'][-1] == 500 + sum(data['net'])
+        assert data['income'][1:] == [100.0] * 59
+
+    def test_forecast_invalid_months(self, client):
+        """Test that an invalid horizon is rejected"""
+        assert client.get('/api/forecast?months=0').status_code == 400
+
+
+class TestBudgetGoalsAPI:
+    """Test cases for budget goal endpoints"""
+
+    def test_goal_status(self, client, user_headers):
+        """Test that goal status follows ledger writes in the current period"""
+        today = datetime.utcnow().strftime('%Y-%m-%d')
+        created = client.post('/api/budget-goals', headers=user_headers, json={
+            'type': 'expense', 'period': 'daily', 'amount': 100}).get_json()
+        client.post('/api/budget-goals', headers=user_headers, json={
+            'type': 'income', 'period': 'yearly', 'amount': 1000})
+        expense = client.post('/api/expenses', headers=user_headers, json={
+            'category': 'Food', 'value': 40, 'date': today}).get_json()
+        client.put('/api/expenses/' + expense['id'], headers=user_headers,
+                   json={'category': 'Food', 'value': 60, 'date': today})
+
+        status = client.get('/api/budget-goals/status', headers=user_headers).get_json()
+        by_id = {goal['id']: goal for goal in status}
+        assert by_id[created['id']]['total'] == 60.0
+        assert by_id[created['id']]['percent_used'] == 60.0
+        assert [goal['total'] for goal in status if goal['type'] == 'income'] == [0]
+
+        client.delete('/api/expenses/' + expense['id'], headers=user_headers)
+        status = client.get('/api/budget-goals/status', headers=user_headers).get_json()
+        assert {goal['id']: goal for goal in status}[created['id']]['total'] == 0
+
+    def test_add_goal_invalid(self, client, user_headers):
+        """Test that an invalid goal is rejected"""
+        response = client.post('/api/budget-goals', headers=user_headers,
+                               json={'type': 'expense', 'period': 'hourly', 'amount': 1})
+        assert response.status_code == 400
+
+
+class TestAuthAPI:
+    """Test cases for resolving users from bearer tokens"""
+
+    def test_token_required(self):
+        """Test that a token-only app rejects anonymous requests"""
+        secure = create_app({'AUTH_REQUIRED': True, 'SECRET_KEY': 'test-secret',
+                             'DATABASE_BACKEND': 'memory'})
+        client = secure.test_client()
+        assert client.get('/api/budget').status_code == 401
+        assert client.get('/api/budget', headers={'X-User-Id': 'bob'}).status_code == 401
+
+        token = secure.extensions['auth'].issue(str(uuid.uuid4()))
+        headers = {'Authorization': 'Bearer ' + token}
+        client.post('/api/budget', json={'budget': 42.0, 'currency': 'USD'}, headers=headers)
+        assert client.get('/api/budget', headers=headers).get_json()['budget'] == 42.0
+
+    def test_invalid_token(self, client):
+        """Test that a forged token is rejected even when tokens are optional"""
+        response = client.get('/api/budget', headers={'Authorization': 'Bearer forged'})
+        assert response.status_code == 401
+
+
+class TestCategoriesAPI:
+    """Test cases for category endpoints"""
+
+    def test_categories(self, client, user_headers):
+        """Test adding, listing and deleting categories per type"""
+        for name in ('Rent', 'Food', 'Food'):
+            client.post('/api/categories/expense', json={'name': name},
+                        headers=user_headers)
+        client.post('/api/categories/income', json={'name': 'Salary'}, headers=user_headers)
+        listed = client.get('/api/categories', headers=user_headers).get_json()
+        assert listed == {'expense': ['Food', 'Rent'], 'income': ['Salary']}
+        assert client.delete('/api/categories/expense/Rent',
+                             headers=user_headers).status_code == 204
+        assert client.delete('/api/categories/expense/Rent',
+                             headers=user_headers).status_code == 404
+
+
+class TestSyncAPI:
+    """Test cases for delta sync"""
+
+    def test_changes_and_tombstones(self, client, user_headers):
+        """Test that writes show up as changes and deletes as tombstones"""
+        entry = client.post('/api/expenses', headers=user_headers,
+                            json={'category': 'Food', 'value': 12.5,
+                                  'date': '2024-03-04'}).get_json()
+        client.delete('/api/expenses/' + entry['id'], headers=user_headers)
+        client.post('/api/categories/expense', json={'name': 'Food'}, headers=user_headers)
+
+        data = client.get('/api/sync', headers=user_headers).get_json()
+        changes = {(c['collection'], c['id']): c for c in data['changes']}
+        assert changes[('expenses', entry['id'])]['deleted'] is True
+        assert changes[('expenses', entry['id'])]['doc'] is None
+        assert changes[('expense_categories', 'Food')]['doc'] == {'name': 'Food'}
+        # Fresh writes are not settled yet, so the token stays put
+        assert data['next'] == '0'
+        assert data['has_more'] is False
+
+    def test_mutations_and_conflicts(self, client, user_headers):
+        """Test that a mutation based on an old version is a conflict"""
+        response = client.post('/api/sync', headers=user_headers, json={'mutations': [
+            {'collection': 'incomes', 'op': 'upsert',
+             'doc': {'category': 'Salary', 'value': 3000, 'date': '2024-03-01'}},
+            {'collection': 'balances', 'op': 'upsert',
+             'doc': {'budget': 100.0, 'currency': 'USD'}},
+            {'collection': 'nope', 'op': 'upsert', 'doc': {}},
+        ]})
+        assert response.status_code == 200
+        results = response.get_json()['results']
+        assert [r['status'] for r in results] == ['applied', 'applied', 'error']
+        assert client.get('/api/budget', headers=user_headers).get_json()['budget'] == 100.0
+
+        income_id, base = results[0]['id'], results[0]['seq']
+        client.put('/api/income/' + income_id, headers=user_headers,
+                   json={'category': 'Salary', 'value': 3100, 'date': '2024-03-01'})
+        stale = {'collection': 'incomes', 'op': 'upsert', 'id': income_id, 'base': base,
+                 'doc': {'category': 'Salary', 'value': 2900, 'date': '2024-03-01'}}
+        result = client.post('/api/sync', headers=user_headers,
+                             json={'mutations': [stale]}).get_json()['results'][0]
+        assert result['status'] == 'conflict'
+        assert result['current']['doc']['value'] == 3100
+
+        stale['base'] = result['current']['seq']
+        result = client.post('/api/sync', headers=user_headers,
+                             json={'mutations': [stale]}).get_json()['results'][0]
+        assert result['status'] == 'applied'
+
+    def test_invalid_token(self, client, user_headers):
+        """Test that a malformed token is rejected"""
+        response = client.get('/api/sync?since=abc', headers=user_headers)
+        assert response.status_code == 400
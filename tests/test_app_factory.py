@@ -0,0 +1,99 @@
+"""
+Tests for the app factory and lazy MongoDB client
+"""
+import importlib
+import os
+import sys
+
+import pytest
+
+from backend.app import create_app
+from backend.config import Config
+
+
+class TestAppFactory:
+    """Test cases for create_app and the shared client"""
+
+    def test_client_is_lazy(self):
+        """Test that creating the app does not create a client"""
+        app = create_app()
+        assert app.extensions['mongo']._client is None
+
+    def test_pool_settings_from_config(self):
+        """Test that pool and timeout settings reach the MongoClient"""
+        app = create_app({
+            'MONGO_URI': 'mongodb://db.example:27017/',
+            'MONGO_DB': 'budgetly_test',
+            'MONGO_MAX_POOL_SIZE': 7,
+            'MONGO_MIN_POOL_SIZE': 2,
+            'MONGO_SERVER_SELECTION_TIMEOUT_MS': 1500,
+        })
+        state = app.extensions['mongo']
+        pool = state.client.options.pool_options
+        assert pool.max_pool_size == 7
+        assert pool.min_pool_size == 2
+        assert state.client.options.server_selection_timeout == 1.5
+        assert state.db.name == 'budgetly_test'
+        state.close()
+
+    def test_client_is_reused(self):
+        """Test that every access in one process shares one client"""
+        state = create_app().extensions['mongo']
+        assert state.client is state.client
+        state.close()
+
+    def test_new_client_after_fork(self, monkeypatch):
+        """Test that a forked worker builds its own client"""
+        state = create_app().extensions['mongo']
+        parent = state.client
+        monkeypatch.setattr(os, 'getpid', lambda: -1)
+        assert state.client is not parent
+        monkeypatch.undo()
+        parent.close()
+
+    def test_memory_backend(self):
+        """Test that DATABASE_BACKEND=memory keeps the data in the app's process"""
+        app = create_app({'DATABASE_BACKEND': 'memory'})
+        client = app.test_client()
+        client.post('/api/budget', json={'budget': 12.5, 'currency': 'EUR'})
+        assert client.get('/api/budget').get_json()['budget'] == 12.5
+        assert create_app({'DATABASE_BACKEND': 'memory'}).test_client() \
+            .get('/api/budget').get_json()['budget'] == 0
+
+    def test_wsgi_entry_point_is_lazy(self, monkeypatch):
+        """Test that the production entry point does not connect on import"""
+        monkeypatch.setattr(Config, 'SECRET_KEY', 'wsgi-test-secret')
+        monkeypatch.delitem(sys.modules, 'backend.wsgi', raising=False)
+        from backend.wsgi import app
+        assert app.extensions['mongo']._client is None
+
+    def test_wsgi_requires_tokens(self, monkeypatch):
+        """Test that the production entry point ignores X-User-Id and needs a SECRET_KEY"""
+        monkeypatch.delitem(sys.modules, 'backend.wsgi', raising=False)
+        with pytest.raises(ValueError):
+            importlib.import_module('backend.wsgi')
+
+        monkeypatch.setattr(Config, 'SECRET_KEY', 'wsgi-test-secret')
+        monkeypatch.delitem(sys.modules, 'backend.wsgi', raising=False)
+        app = importlib.import_module('backend.wsgi').app
+        app.config['DATABASE_BACKEND'] = 'memory'
+        client = app.test_client()
+        assert client.get('/api/budget', headers={'X-User-Id': 'alice'}).status_code == 401
+        token = app.extensions['auth'].issue('alice')
+        response = client.get('/api/budget', headers={'Authorization': 'Bearer ' + token})
+        assert response.status_code == 200
+
+    def test_gunicorn_settings(self, monkeypatch):
+        """Test that worker, thread and keep-alive settings follow the environment"""
+        from backend import gunicorn_conf
+        assert gunicorn_conf.default_workers(1) == 3
+        assert gunicorn_conf.default_workers(64) == gunicorn_conf.MAX_WORKERS
+
+        monkeypatch.setenv('WEB_CONCURRENCY', '5')
+        monkeypatch.setenv('GUNICORN_THREADS', '12')
+        monkeypatch.setenv('GUNICORN_KEEPALIVE', '75')
+        monkeypatch.setenv('MONGO_MAX_POOL_SIZE', '40')
+        conf = importlib.reload(gunicorn_conf)
+        assert (conf.workers, conf.threads, conf.keepalive) == (5, 12, 75)
+        assert conf.worker_class == 'gthread'
+        assert os.environ['MONGO_MAX_POOL_SIZE'] == '40'
@@ -0,0 +1,103 @@
+"""
+Tests for the async (ASGI) variant of the API
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip('quart')
+
+from backend.app import create_app  # noqa: E402
+from backend.asgi import create_async_app  # noqa: E402
+
+
+def _routes(app):
+    return {(rule.rule, method)
+            for rule in app.url_map.iter_rules()
+            for method in rule.methods - {'HEAD', 'OPTIONS'}
+            if rule.endpoint != 'static'}
+
+
+class TestAsyncApp:
+    """Test cases for the Quart app"""
+
+    def test_home_endpoint(self):
+        """Test the home endpoint without a database"""
+        async def get_home():
+            response = await create_async_app().test_client().get('/')
+            return response.status_code, await response.get_data()
+
+        assert asyncio.run(get_home()) == (200, b'Hello, the Flask backend is ready!')
+
+    def test_routes_match_sync_app(self):
+        """Test that every async route is also served by the sync app"""
+        assert _routes(create_async_app()) <= _routes(create_app())
+
+
+class TestAsyncAPI:
+    """Test cases for the async routes on the in-memory database"""
+
+    def run(self, steps):
+        app = create_async_app({'DATABASE_BACKEND': 'memory'})
+        return app, asyncio.run(steps(app.test_client()))
+
+    def test_ledger_and_sync_log(self):
+        """Test adding, listing, updating and deleting entries, with their side writes"""
+        headers = {'X-User-Id': 'async-user'}
+
+        async def steps(client):
+            created = []
+            for value in (10, 20):
+                response = await client.post('/api/expenses', headers=headers, json={
+                    'category': 'Food', 'value': value, 'date': '2024-01-0%d' % (value // 10)})
+                assert response.status_code == 201
+                created.append(await response.get_json())
+            response = await client.put('/api/expenses/' + created[0]['id'], headers=headers,
+                                        json={'category': 'Rent', 'value': 15,
+                                              'date': '2024-01-01'})
+            assert (await response.get_json())['category'] == 'Rent'
+            response = await client.delete('/api/expenses/' + created[1]['id'],
+                                           headers=headers)
+            assert response.status_code == 204
+            response = await client.get('/api/expenses', headers=headers)
+            return created, await response.get_json()
+
+        app, (created, page) = self.run(steps)
+        assert [(item['id'], item['value']) for item in page['items']] == [
+            (created[0]['id'], 15.0)]
+
+        db = app.extensions['mongo']
+        log = {entry['doc_id']: entry for entry in db['sync_log'].find({'user': 'async-user'})}
+        assert log[created[0]['id']]['doc']['category'] == 'Rent'
+        assert log[created[1]['id']]['deleted']
+        assert db['sync_counters'].find_one({'user': 'async-user'})['seq'] == 4
+        rollup = db['monthly_rollups'].find_one({'user': 'async-user', 'category': 'Rent'})
+        assert rollup['total'] == 15.0
+
+    def test_budget(self):
+        """Test saving and reading the budget, which is logged for sync"""
+        headers = {'X-User-Id': 'async-user'}
+
+        async def steps(client):
+            response = await client.post('/api/budget', headers=headers,
+                                         json={'budget': 250.0, 'currency': 'EUR'})
+            assert response.status_code == 200
+            response = await client.get('/api/budget', headers=headers)
+            return await response.get_json()
+
+        app, data = self.run(steps)
+        assert data['budget'] == 250.0
+        assert data['currency'] == 'EUR'
+        entry = app.extensions['mongo']['sync_log'].find_one({'collection': 'balances'})
+        assert entry['doc_id'] == 'budget'
+        assert entry['doc']['budget'] == 250.0
+
+    def test_db_threads_from_config(self):
+        """Test that database calls run on ASYNC_DB_THREADS threads"""
+        app = create_async_app({'DATABASE_BACKEND': 'memory', 'ASYNC_DB_THREADS': 3})
+
+        async def steps(client):
+            await client.get('/api/budget', headers={'X-User-Id': 'async-user'})
+
+        asyncio.run(steps(app.test_client()))
+        assert app.extensions['db_executor']._max_workers == 3
@@ -0,0 +1,78 @@
+"""
+Tests for token authentication and the per-user data layout
+"""
+import pytest
+from pymongo import ASCENDING
+
+from backend import auth, sharding
+from backend.config import DEV_SECRET_KEY
+from backend.mongo import COLLECTION_INDEXES
+
+
+def make_auth(**overrides):
+    config = {'SECRET_KEY': 'test-secret', 'AUTH_REQUIRED': False,
+              'AUTH_TOKEN_MAX_AGE': 3600}
+    config.update(overrides)
+    return auth.Authenticator(config)
+
+
+class TestAuthenticator:
+    """Test cases for resolving the user of a request"""
+
+    def test_bearer_token(self):
+        """Test that an issued token resolves to its user"""
+        authenticator = make_auth()
+        token = authenticator.issue('alice')
+        assert authenticator.resolve({'Authorization': 'Bearer ' + token}) == 'alice'
+
+    @pytest.mark.parametrize('header', ['Bearer nonsense', 'Basic abc', 'Bearer'])
+    def test_invalid_credentials(self, header):
+        """Test that malformed or forged tokens are rejected"""
+        with pytest.raises(auth.AuthError):
+            make_auth().resolve({'Authorization': header})
+
+    def test_token_from_other_secret(self):
+        """Test that a token signed with another key is rejected"""
+        token = make_auth(SECRET_KEY='other').issue('alice')
+        with pytest.raises(auth.AuthError):
+            make_auth().resolve({'Authorization': 'Bearer ' + token})
+
+    def test_expired_token(self):
+        """Test that tokens older than AUTH_TOKEN_MAX_AGE are rejected"""
+        token = make_auth().issue('alice')
+        with pytest.raises(auth.AuthError, match='expired'):
+            make_auth(AUTH_TOKEN_MAX_AGE=-1).resolve({'Authorization': 'Bearer ' + token})
+
+    def test_user_header_only_when_not_required(self):
+        """Test the development fallbacks and that AUTH_REQUIRED disables them"""
+        assert make_auth().resolve({}) == auth.DEFAULT_USER
+        assert make_auth().resolve({'X-User-Id': 'bob'}) == 'bob'
+        with pytest.raises(auth.AuthError):
+            make_auth(AUTH_REQUIRED=True).resolve({'X-User-Id': 'bob'})
+
+    def test_required_needs_secret(self):
+        """Test that requiring auth with the development key is refused"""
+        with pytest.raises(ValueError):
+            make_auth(AUTH_REQUIRED=True, SECRET_KEY=DEV_SECRET_KEY)
+
+
+class TestDataLayout:
+    """Test cases for per-user keys and shard readiness"""
+
+    def test_indexes_lead_with_user(self):
+        """Test that every index but the reminder worker's starts with user"""
+        for name, indexes in COLLECTION_INDEXES.items():
+            for index in indexes:
+                keys = list(index.document['key'].items())
+                if index.document['name'] == 'fire_at':
+                    continue
+                assert keys[0] == ('user', ASCENDING), (name, index.document['name'])
+
+    def test_shard_commands(self):
+        """Test that every collection is sharded on a hashed user key"""
+        commands = sharding.shard_commands('budgetly')
+        assert commands[0] == {'enableSharding': 'budgetly'}
+        sharded = {c['shardCollection'] for c in commands[1:]}
+        assert 'budgetly.expenses' in sharded
+        assert 'budgetly.import_checkpoints' in sharded
+        assert all(c['key'] == {'user': 'hashed'} for c in commands[1:])
@@ -0,0 +1,59 @@
+"""
+Tests for the streaming bulk ingest parsers
+"""
+import io
+import json
+
+import pytest
+
+from backend import bulk
+from backend.ledger import ValidationError
+
+
+class TestBulkParsers:
+    """Test cases for JSON array and NDJSON row parsing"""
+
+    @pytest.mark.parametrize('read_size', [1, 2, 3, 7, 4096])
+    def test_json_array_any_read_size(self, read_size):
+        """Test that values split across reads are decoded correctly"""
+        values = [{'category': 'Food', 'value': 12345, 'date': '2024-01-01'},
+                  1.5e3, 'ü]', [1, {'a': None}], True]
+        stream = io.BytesIO(json.dumps(values).encode())
+        rows = list(bulk.iter_json_array(stream, read_size))
+        assert rows == list(enumerate(values))
+
+    def test_json_array_empty(self):
+        """Test that an empty array yields no rows"""
+        assert list(bulk.iter_json_array(io.BytesIO(b' [ ] '))) == []
+
+    @pytest.mark.parametrize('body', [b'{"a": 1}', b'[1, 2', b'[1 2]', b''])
+    def test_json_array_malformed(self, body):
+        """Test that a malformed array is rejected"""
+        with pytest.raises(ValidationError):
+            list(bulk.iter_json_array(io.BytesIO(body)))
+
+    def test_ndjson_skips_blank_lines_and_reports_bad_rows(self):
+        """Test that a bad NDJSON line fails only that row"""
+        stream = io.BytesIO(b'{"a": 1}\n\n{oops\n{"b": 2}\n')
+        rows = list(bulk.iter_ndjson(stream))
+        assert rows[0] == (0, {'a': 1})
+        assert rows[1][0] == 1 and isinstance(rows[1][1], ValidationError)
+        assert rows[2] == (2, {'b': 2})
+
+    def test_parse_chunk_size(self):
+        """Test chunk size defaults and clamping"""
+        assert bulk.parse_chunk_size(None) == bulk.DEFAULT_CHUNK_SIZE
+        assert bulk.parse_chunk_size('10') == 10
+        assert bulk.parse_chunk_size('999999') == bulk.MAX_CHUNK_SIZE
+        with pytest.raises(ValidationError):
+            bulk.parse_chunk_size('-1')
+
+    def test_summarize_keeps_lowest_indexes(self):
+        """Test that results arriving out of order are reported by row index"""
+        results = [{'index': 5, 'error': 'x'}, {'index': 0, 'id': 'a'},
+                   {'index': 3, 'error': 'y'}, {'index': 1, 'error': 'z'},
+                   {'index': 4, 'id': 'b'}, {'index': 2, 'id': 'c'}]
+        summary = bulk.summarize(iter(results), max_errors=2, max_ids=2)
+        assert (summary['inserted'], summary['failed']) == (3, 3)
+        assert [error['index'] for error in summary['errors']] == [1, 3]
+        assert summary['ids'] == [{'index': 0, 'id': 'a'}, {'index': 2, 'id': 'c'}]
@@ -0,0 +1,110 @@
+"""
+Tests for the read-through cache backends
+"""
+import pytest
+
+from backend.app import create_app
+from backend.cache import NullCache, TTLCache, make_cache
+from backend.memory import MemoryCollection
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+    """Test cases for the in-process TTL/LRU cache"""
+
+    def test_hit_and_miss_counters(self):
+        """Test that lookups are counted"""
+        cache = TTLCache()
+        assert cache.get('a') is None
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['size']) == (1, 1, 1)
+        assert stats['hit_ratio'] == 0.5
+
+    def test_entries_expire(self):
+        """Test that entries are dropped after the TTL"""
+        clock = FakeClock()
+        cache = TTLCache(ttl=10, clock=clock)
+        cache.set('a', 1)
+        clock.now = 9.9
+        assert cache.get('a') == 1
+        clock.now = 10.0
+        assert cache.get('a') is None
+        assert cache.stats()['size'] == 0
+
+    def test_least_recently_used_is_evicted(self):
+        """Test LRU eviction once maxsize is reached"""
+        cache = TTLCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.stats()['evictions'] == 1
+
+    def test_delete(self):
+        """Test invalidation"""
+        cache = TTLCache()
+        cache.set('a', 1)
+        cache.delete('a')
+        cache.delete('missing')
+        assert cache.get('a') is None
+
+
+class TestMakeCache:
+    """Test cases for choosing a cache backend"""
+
+    def test_backends(self):
+        """Test that CACHE_BACKEND selects the backend"""
+        config = {'CACHE_BACKEND': 'memory', 'CACHE_SIZE': 5, 'CACHE_TTL': 1.0}
+        assert isinstance(make_cache(config), TTLCache)
+        assert isinstance(make_cache(dict(config, CACHE_BACKEND='none')), NullCache)
+        with pytest.raises(ValueError):
+            make_cache(dict(config, CACHE_BACKEND='memcached'))
+
+
+class TestWorkerCaches:
+    """Test cases for budget caches kept per worker"""
+
+    def test_write_in_one_worker_is_seen_by_another(self, tmp_path):
+        """Test that a budget saved through one app is seen by another within CACHE_VERSION_TTL"""
+        config = {'DATABASE_BACKEND': 'sqlite', 'SQLITE_PATH': str(tmp_path / 'shared.sqlite3'),
+                  'CACHE_BACKEND': 'memory', 'CACHE_TTL': 3600, 'CACHE_VERSION_TTL': 1}
+        first = create_app(config).test_client()
+        second_app = create_app(config)
+        clock = second_app.extensions['sync_versions'].clock = FakeClock()
+        second = second_app.test_client()
+        headers = {'X-User-Id': 'alice'}
+        assert second.get('/api/budget', headers=headers).get_json()['budget'] == 0
+        assert second.get('/api/budget', headers=headers).get_json()['budget'] == 0
+
+        first.post('/api/budget', json={'budget': 250, 'currency': 'EUR'}, headers=headers)
+        assert first.get('/api/budget', headers=headers).get_json()['budget'] == 250
+        assert second.get('/api/budget', headers=headers).get_json()['budget'] == 0
+        clock.now = 1.5
+        assert second.get('/api/budget', headers=headers).get_json()['budget'] == 250
+
+    def test_hit_does_not_read_the_database(self, monkeypatch):
+        """Test that a cache hit reads neither the change number nor the budget"""
+        app = create_app({'DATABASE_BACKEND': 'memory', 'CACHE_VERSION_TTL': 3600})
+        client = app.test_client()
+        headers = {'X-User-Id': 'alice'}
+        client.post('/api/budget', json={'budget': 250, 'currency': 'EUR'}, headers=headers)
+        assert client.get('/api/budget', headers=headers).get_json()['budget'] == 250
+
+        reads = []
+        select = MemoryCollection._select
+        monkeypatch.setattr(MemoryCollection, '_select', lambda self, *args:
+                            reads.append(self.name) or select(self, *args))
+        response = client.get('/api/budget', headers=headers)
+        assert response.get_json()['budget'] == 250
+        assert reads == []
@@ -0,0 +1,157 @@
+"""
+Tests for response compression and version ETags
+"""
+import gzip
+import json
+import zlib
+
+import pytest
+
+from backend import compression
+from backend.app import create_app
+
+OWNER = {'X-User-Id': 'compression-user'}
+
+
+def seed(client, count=100, headers=OWNER):
+    rows = [{'category': 'Category %d' % (i % 7), 'value': i + 0.5,
+             'date': '2024-%02d-%02d' % (i % 12 + 1, i % 28 + 1)} for i in range(count)]
+    client.post('/api/expenses/bulk', json=rows, headers=headers).get_data()
+
+
+class TestCompression:
+    """Test cases for negotiated compression"""
+
+    def test_gzip_stream(self):
+        """Test that streamed gzip output decompresses to the input"""
+        chunks = [b'a,b\n', b'c,d\n' * 1000]
+        data = b''.join(compression.compress_stream(chunks, 'gzip'))
+        assert gzip.decompress(data) == b''.join(chunks)
+
+    @pytest.mark.parametrize('encoding', ['gzip', pytest.param('br', marks=pytest.mark.skipif(
+        compression.brotli is None, reason='brotli is not installed'))])
+    def test_stream_flushes(self, encoding):
+        """Test that the input a stream holds back never reaches flush_bytes"""
+        consumed = []
+
+        def rows():
+            for i in range(20):
+                consumed.append(b'%04d,Food,12.50\n' % i * 40)
+                yield consumed[-1]
+
+        if encoding == 'br':
+            decompress = compression.brotli.Decompressor().process
+        else:
+            decompress = zlib.decompressobj(31).decompress
+        received = b''
+        pieces = 0
+        for piece in compression.compress_stream(rows(), encoding, flush_bytes=1000):
+            received += decompress(piece)
+            pieces += 1
+            sent = b''.join(consumed)
+            assert sent.startswith(received) and len(sent) - len(received) < 1000
+        assert received == b''.join(consumed)
+        assert pieces > 5
+
+    def test_large_responses(self, client):
+        """Test that large bodies are compressed and small ones are not"""
+        seed(client)
+        headers = dict(OWNER, **{'Accept-Encoding': 'gzip'})
+        response = client.get('/api/expenses?limit=100', headers=headers)
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.vary
+        assert int(response.headers['Content-Length']) == len(response.data)
+        page = json.loads(gzip.decompress(response.data))
+        assert len(page['items']) == 100
+        assert response.get_etag() == (response.get_etag()[0], False)
+        assert response.get_etag()[0].endswith('-gzip')
+
+        response = client.get('/api/expenses?limit=1', headers=headers)
+        assert 'Content-Encoding' not in response.headers
+        assert 'Accept-Encoding' in response.vary
+
+    def test_negotiation(self, client):
+        """Test q-values, and brotli ahead of gzip when it is installed"""
+        seed(client)
+
+        def encoding(accept):
+            response = client.get('/api/expenses?limit=100',
+                                  headers=dict(OWNER, **{'Accept-Encoding': accept}))
+            return response.headers.get('Content-Encoding')
+
+        assert encoding('gzip;q=0') is None
+        assert encoding('identity') is None
+        assert encoding('br;q=0.5, gzip') == 'gzip'
+        assert encoding('gzip, br') == ('br' if compression.brotli else 'gzip')
+
+    @pytest.mark.skipif(compression.brotli is None, reason='brotli is not installed')
+    def test_streamed_brotli(self, client):
+        """Test that a streamed export is compressed as it is generated"""
+        seed(client)
+        response = client.get('/api/export?format=ndjson',
+                              headers=dict(OWNER, **{'Accept-Encoding': 'br'}))
+        assert response.is_streamed
+        assert response.headers['Content-Encoding'] == 'br'
+        lines = compression.brotli.decompress(response.data).splitlines()
+        assert len(lines) == 100
+
+    def test_disabled(self):
+        """Test that COMPRESSION_ENABLED off sends identity bodies"""
+        app = create_app({'DATABASE_BACKEND': 'memory', 'COMPRESSION_ENABLED': False})
+        client = app.test_client()
+        seed(client)
+        response = client.get('/api/expenses?limit=100',
+                              headers=dict(OWNER, **{'Accept-Encoding': 'gzip'}))
+        assert 'Content-Encoding' not in response.headers
+
+
+class TestVersionETags:
+    """Test cases for ETags from the user's change counter"""
+
+    def test_not_modified_until_a_write(self, client):
+        """Test 304s, in any encoding, until the user writes"""
+        seed(client)
+        response = client.get('/api/reports', headers=OWNER)
+        etag = response.headers['ETag']
+        assert response.headers['Cache-Control'] == 'private, no-cache'
+
+        for tag in (etag, etag[:-1] + '-gzip"', 'W/' + etag):
+            response = client.get('/api/reports', headers=dict(OWNER, **{'If-None-Match': tag}))
+            assert response.status_code == 304
+            assert response.data == b''
+            assert response.headers['ETag'] == tag.replace('W/', '')
+            assert 'Accept-Encoding' in response.vary
+
+        other = {'X-User-Id': 'someone-else'}
+        seed(client, 1, other)
+        assert client.get('/api/reports', headers=dict(
+            OWNER, **{'If-None-Match': etag})).status_code == 304
+        assert client.get('/api/reports', headers=dict(
+            other, **{'If-None-Match': etag})).status_code == 200
+
+        client.post('/api/categories/expense', json={'name': 'Travel'}, headers=OWNER)
+        response = client.get('/api/reports', headers=dict(OWNER, **{'If-None-Match': etag}))
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+
+    def test_not_modified_repeats_the_compressed_tag(self, client):
+        """Test that a 304 sends the same ETag as the compressed 200"""
+        seed(client)
+        headers = dict(OWNER, **{'Accept-Encoding': 'gzip'})
+        response = client.get('/api/expenses?limit=100', headers=headers)
+        etag = response.headers['ETag']
+        assert etag.endswith('-gzip"')
+        response = client.get('/api/expenses?limit=100',
+                              headers=dict(headers, **{'If-None-Match': etag}))
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+
+    def test_tags_differ_per_query(self, client):
+        """Test that each URL gets its own tag and errors get none"""
+        seed(client)
+        first = client.get('/api/expenses?limit=5', headers=OWNER).headers['ETag']
+        second = client.get('/api/expenses?limit=6', headers=OWNER).headers['ETag']
+        assert first != second
+        response = client.get('/api/expenses?limit=x', headers=OWNER)
+        assert response.status_code == 400
+        assert 'ETag' not in response.headers
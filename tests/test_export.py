@@ -0,0 +1,66 @@
+"""
+Tests for the streaming export writers
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from backend import export
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None, batch_size=None):
+        return [d for d in self.docs if d.get('user') == query['user']]
+
+
+class FakeDB(dict):
+    def __missing__(self, name):
+        return FakeCollection([])
+
+
+def _db():
+    return FakeDB({
+        'expenses': FakeCollection([
+            {'_id': 'e1', 'user': 'alice', 'category': 'Food, "fancy"',
+             'value': 1.5, 'date': datetime(2024, 1, 1)},
+            {'_id': 'e2', 'user': 'bob', 'category': 'Other',
+             'value': 2.0, 'date': datetime(2024, 1, 1)},
+        ]),
+        'recurring_payments': FakeCollection([
+            {'_id': 'r1', 'user': 'alice', 'type': 'expense', 'category': 'Rent',
+             'value': 1000.0, 'startDate': '2024-01-01', 'frequency': 'monthly',
+             'description': 'Rent\nflat 2', 'reminders': [{'days': 1, 'hours': 9}]},
+        ]),
+    })
+
+
+class TestExport:
+    """Test cases for CSV and NDJSON export"""
+
+    def test_csv_is_quoted(self):
+        """Test that commas, quotes and newlines survive a CSV round trip"""
+        body = ''.join(export.iter_csv(_db(), 'alice'))
+        rows = list(csv.reader(io.StringIO(body)))
+        assert ['e1', 'Food, "fancy"', '1.5', '2024-01-01'] in rows
+        recurring = next(r for r in rows if r and r[0] == 'r1')
+        assert recurring[6] == 'Rent\nflat 2'
+        assert json.loads(recurring[7]) == [{'days': 1, 'hours': 9}]
+        assert not any('Other' in r for r in rows)
+
+    def test_csv_sections(self):
+        """Test that every section has a title and header, even when empty"""
+        rows = list(csv.reader(io.StringIO(''.join(export.iter_csv(FakeDB(), 'alice')))))
+        titles = [title for title, _, _, _ in export.SECTIONS]
+        assert [r[0] for r in rows if r and r[0] in titles] == titles
+
+    def test_ndjson(self):
+        """Test one tagged object per document"""
+        lines = ''.join(export.iter_ndjson(_db(), 'alice')).splitlines()
+        rows = [json.loads(line) for line in lines]
+        assert rows[0] == {'section': 'expenses', 'id': 'e1', 'category': 'Food, "fancy"',
+                           'value': 1.5, 'date': '2024-01-01'}
+        assert rows[1]['reminders'] == [{'days': 1, 'hours': 9}]
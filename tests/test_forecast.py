@@ -0,0 +1,80 @@
+"""
+Tests for the cash-flow forecast
+"""
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from backend import forecast, recurring
+from backend.ledger import ValidationError
+
+
+class FakeRollups:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        month = query['month']
+        return [d for d in self.docs
+                if month['$gte'] <= d['month'] < month['$lt']]
+
+
+def payment(type_, category, value, start, frequency):
+    return {'_id': ObjectId(), 'type': type_, 'category': category,
+            'value': value, 'startDate': start, 'frequency': frequency}
+
+
+class TestForecast:
+    """Test cases for the forecast projection"""
+
+    def test_occurrence_matrix_matches_expansion(self):
+        """Test the vectorized counts against the occurrence engine"""
+        rng = random.Random(1)
+        today = date(2024, 10, 16)
+        payments = [payment('expense', 'X', 1.0,
+                            (date(2019, 1, 1) + timedelta(days=rng.randrange(2400))).isoformat(),
+                            rng.choice(recurring.FREQUENCIES))
+                    for _ in range(200)]
+        counts = forecast.occurrence_matrix(*forecast.payment_arrays(payments), today, 30)
+        end = recurring.add_months(date(2024, 10, 1), 30) - timedelta(days=1)
+        for row, p in zip(counts, payments):
+            expected = [0] * 30
+            for when in recurring.occurrences(recurring.payment_start(p), p['frequency'],
+                                              today, end):
+                expected[(when.year - 2024) * 12 + when.month - 10] += 1
+            assert row.tolist() == expected
+
+    def test_build_forecast(self):
+        """Test that recurring payments and averages add up per month"""
+        payments = [payment('income', 'Salary', 2000.0, '2024-01-15', 'monthly'),
+                    payment('expense', 'Rent', 900.0, '2024-01-31', 'monthly')]
+        averages = {'expense': {'Food': 310.0, 'Rent': 880.0}, 'income': {}}
+        result = forecast.build_forecast({'budget': 1000, 'currency': 'USD'}, payments,
+                                         averages, date(2024, 11, 16), 3)
+        assert result['months'] == ['2024-11', '2024-12', '2025-01']
+        assert result['income'] == [0.0, 2000.0, 2000.0]
+        # Food is averaged (pro rata for the rest of November); Rent only
+        # counts once, as a recurring payment
+        assert result['expenses'] == [1055.0, 1210.0, 1210.0]
+        assert result['balance'] == [-55.0, 735.0, 1525.0]
+        assert result['categories']['expenses'][0] == {'category': 'Rent', 'total': 2700.0}
+
+    def test_monthly_averages_since_first_month(self):
+        """Test that a new user's averages only span the months they have"""
+        rollup_collection = FakeRollups([
+            {'type': 'expense', 'category': 'Food', 'month': datetime(2024, 8, 1), 'total': 200.0},
+            {'type': 'expense', 'category': 'Food', 'month': datetime(2024, 9, 1), 'total': 400.0},
+            {'type': 'income', 'category': 'Salary', 'month': datetime(2024, 9, 1), 'total': 900.0},
+            {'type': 'expense', 'category': 'Food', 'month': datetime(2024, 10, 1), 'total': 999.0},
+        ])
+        averages = forecast.monthly_averages(rollup_collection, 'alice', date(2024, 10, 16), 12)
+        assert averages == {'expense': {'Food': 300.0}, 'income': {'Salary': 450.0}}
+
+    @pytest.mark.parametrize('args', [{'months': '0'}, {'months': 'x'},
+                                      {'months': '121'}, {'history': '61'}])
+    def test_parse_args_invalid(self, args):
+        """Test that out-of-range horizons are rejected"""
+        with pytest.raises(ValidationError):
+            forecast.parse_args(args)
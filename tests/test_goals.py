@@ -0,0 +1,83 @@
+"""
+Tests for period buckets and budget goal status
+"""
+from datetime import datetime
+
+import pytest
+
+from backend import goals, periods
+from backend.ledger import ValidationError
+
+
+def entry(value, date):
+    return {'user': 'alice', 'value': value, 'date': date}
+
+
+class TestPeriods:
+    """Test cases for period bucket helpers"""
+
+    @pytest.mark.parametrize('period,start,end', [
+        ('daily', datetime(2024, 2, 14), datetime(2024, 2, 14)),
+        ('weekly', datetime(2024, 2, 12), datetime(2024, 2, 18)),
+        ('monthly', datetime(2024, 2, 1), datetime(2024, 2, 29)),
+        ('yearly', datetime(2024, 1, 1), datetime(2024, 12, 31)),
+    ])
+    def test_period_bounds(self, period, start, end):
+        """Test the first and last day of each period"""
+        assert periods.period_start(datetime(2024, 2, 14, 15), period) == start
+        assert periods.period_end(start, period) == end
+
+    def test_batch_ops_one_update_per_bucket(self):
+        """Test that a batch touches each bucket once"""
+        ops = periods.batch_ops('expense', [entry(5, datetime(2024, 2, 12)),
+                                            entry(7, datetime(2024, 2, 13))])
+        totals = {(op._filter['period'], op._filter['start']): op._doc['$inc']['total']
+                  for op in ops}
+        assert totals == {
+            ('daily', datetime(2024, 2, 12)): 5,
+            ('daily', datetime(2024, 2, 13)): 7,
+            ('weekly', datetime(2024, 2, 12)): 12,
+            ('monthly', datetime(2024, 2, 1)): 12,
+            ('yearly', datetime(2024, 1, 1)): 12,
+        }
+
+    def test_update_ops_moves_changed_buckets_only(self):
+        """Test that moving an entry within a week leaves the week's count alone"""
+        ops = periods.update_ops('expense', entry(5, datetime(2024, 2, 12)),
+                                 entry(5, datetime(2024, 2, 13)))
+        assert sorted(op._filter['period'] for op in ops) == ['daily', 'daily']
+
+
+class TestGoalStatus:
+    """Test cases for evaluating budget goals"""
+
+    def test_status(self):
+        """Test usage and projection halfway through a month"""
+        goal = {'_id': 1, 'type': 'expense', 'period': 'monthly', 'amount': 300.0}
+        [result] = goals.status([goal], {('expense', 'monthly'): 200.0},
+                                datetime(2024, 4, 15, 18))
+        assert result['start'] == '2024-04-01'
+        assert result['end'] == '2024-04-30'
+        assert result['percent_used'] == 66.7
+        assert result['projected'] == 400.0
+        assert result['projected_overrun'] == 100.0
+
+    def test_status_without_spending(self):
+        """Test that goals with no bucket yet report zero usage"""
+        goal = {'_id': 1, 'type': 'income', 'period': 'weekly', 'amount': 0}
+        [result] = goals.status([goal], {},
+                                datetime(2024, 4, 15))
+        assert result['total'] == 0
+        assert result['percent_used'] is None
+        assert result['projected_overrun'] == 0
+
+    @pytest.mark.parametrize('data', [
+        None,
+        {'type': 'expense', 'period': 'hourly', 'amount': 1},
+        {'type': 'expense', 'period': 'weekly', 'amount': -1},
+        {'type': 'saving', 'period': 'weekly', 'amount': 1},
+    ])
+    def test_parse_goal_invalid(self, data):
+        """Test that invalid goals are rejected"""
+        with pytest.raises(ValidationError):
+            goals.parse_goal(data)
@@ -0,0 +1,105 @@
+"""
+Tests for parsing and validating import rows
+"""
+import io
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from pymongo import ReplaceOne
+
+from backend import importer
+from backend.ledger import ValidationError
+
+CSV_EXPORT = b'''Expense Categories
+name
+Food
+
+Expenses
+id,category,value,date
+6ad4d66998fa090c5e119dd4,"Food, ""fancy""",1.5,2024-01-01
+,Rent,1000,2024-01-02
+
+Recurring Payments
+id,type,category,value,start_date,frequency,note,reminders
+,expense,Rent,1000.0,2024-01-01,monthly,"Monthly
+rent","[{""days"":1,""hours"":9}]"
+'''
+
+
+class TestImportParsing:
+    """Test cases for import row parsing"""
+
+    def test_csv_sections(self):
+        """Test that rows are tagged with their section and numbered"""
+        rows = list(importer.iter_csv_rows(io.BytesIO(CSV_EXPORT)))
+        assert [(index, section) for index, section, _ in rows] == [
+            (0, 'expense_categories'), (1, 'expenses'), (2, 'expenses'),
+            (3, 'recurring_payments'),
+        ]
+        assert rows[1][2]['category'] == 'Food, "fancy"'
+        assert rows[3][2]['note'] == 'Monthly\nrent'
+
+    def test_csv_unknown_section(self):
+        """Test that an unknown section title is rejected"""
+        with pytest.raises(ValidationError):
+            list(importer.iter_csv_rows(io.BytesIO(b'Bogus\nname\n')))
+
+    @pytest.mark.parametrize('body', [
+        'Expenses\nid,category,value,date\n,Caf\xe9,1,2024-01-01\n'.encode('latin-1'),
+        b'Expenses\nid,category,value,date\n,' + b'x' * (2 ** 17 + 1) + b',1,2024-01-01\n',
+    ])
+    def test_csv_undecodable_or_malformed(self, body):
+        """Test that non-UTF-8 bodies and csv errors become validation errors"""
+        with pytest.raises(ValidationError):
+            list(importer.iter_csv_rows(io.BytesIO(body)))
+
+    def test_ndjson_rows(self):
+        """Test NDJSON rows and per-row section errors"""
+        body = b'{"section": "expenses", "value": 1}\n{"section": "nope"}\n'
+        rows = list(importer.iter_ndjson_rows(io.BytesIO(body)))
+        assert rows[0] == (0, 'expenses', {'section': 'expenses', 'value': 1})
+        assert isinstance(rows[1][1], ValidationError)
+
+    def test_expense_operation_keeps_id(self):
+        """Test that an exported id is reused so re-imports dedupe"""
+        row = {'id': '6ad4d66998fa090c5e119dd4', 'category': 'Food',
+               'value': '1.5', 'date': '2024-01-01'}
+        doc = importer.to_document('expenses', row, 'alice')
+        oid = ObjectId('6ad4d66998fa090c5e119dd4')
+        assert doc == {'_id': oid, 'user': 'alice', 'category': 'Food',
+                       'value': 1.5, 'date': datetime(2024, 1, 1)}
+        assert importer.to_operation('expenses', doc) == ReplaceOne(
+            {'_id': oid, 'user': 'alice'}, doc, upsert=True)
+
+    def test_recurring_operation_parses_reminders(self):
+        """Test that CSV reminders are decoded from JSON"""
+        row = {'type': 'expense', 'category': 'Rent', 'value': '1000',
+               'start_date': '2024-01-01', 'frequency': 'monthly', 'note': '',
+               'reminders': '[{"days":1,"hours":9}]'}
+        doc = importer.to_document('recurring_payments', row, 'alice')
+        assert doc['reminders'] == [{'days': 1, 'hours': 9}]
+        assert doc['startDate'] == '2024-01-01'
+
+    @pytest.mark.parametrize('section,row', [
+        ('expenses', {'category': 'Food', 'value': 'abc', 'date': '2024-01-01'}),
+        ('budget_goals', {'type': 'expense', 'period': 'monthly', 'amount': ''}),
+        ('expenses', {'category': 'Food', 'value': 'nan', 'date': '2024-01-01'}),
+        ('incomes', {'category': 'Salary', 'value': float('inf'), 'date': '2024-01-01'}),
+        ('budget_goals', {'type': 'expense', 'period': 'hourly', 'amount': '1'}),
+        ('budget_goals', {'type': 'expense', 'period': 'monthly', 'amount': '-inf'}),
+        ('recurring_payments', {'type': 'expense', 'category': 'Rent', 'value': '1',
+                                'start_date': '2024-01-01', 'frequency': 'hourly'}),
+        ('recurring_payments', {'type': 'gift', 'category': 'Rent', 'value': '1',
+                                'start_date': '2024-01-01', 'frequency': 'monthly'}),
+        ('recurring_payments', {'type': 'expense', 'category': 'Rent', 'value': '1',
+                                'start_date': '2024-01-01', 'frequency': 'monthly',
+                                'reminders': '[1]'}),
+        ('expense_categories', {'name': ''}),
+        ('incomes', {'id': 'not-an-id', 'category': 'S', 'value': '1',
+                     'date': '2024-01-01'}),
+    ])
+    def test_invalid_rows(self, section, row):
+        """Test that invalid rows are rejected"""
+        with pytest.raises(ValidationError):
+            importer.to_document(section, row, 'alice')
@@ -0,0 +1,83 @@
+"""
+Tests for the JSON provider
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from bson import Decimal128, ObjectId
+
+from backend import jsonprovider
+from backend.app import create_app
+
+DOC = {
+    'id': ObjectId('65a1b2c3d4e5f60718293a4b'),
+    'when': datetime(2024, 3, 4, 5, 6, 7, 891000),
+    'day': date(2024, 3, 4),
+    'amount': Decimal('12.10'),
+    'stored': Decimal128('0.30'),
+    'mean': np.float64(2.5),
+    'series': np.array([1.0, 2.0]),
+    'name': 'Café',
+}
+EXPECTED = {
+    'id': '65a1b2c3d4e5f60718293a4b',
+    'when': '2024-03-04T05:06:07.891000',
+    'day': '2024-03-04',
+    'amount': '12.10',
+    'stored': '0.30',
+    'mean': 2.5,
+    'series': [1.0, 2.0],
+    'name': 'Café',
+}
+
+
+@pytest.fixture(params=[True, False], ids=['orjson', 'stdlib'])
+def app(request):
+    if request.param and jsonprovider.orjson is None:
+        pytest.skip('orjson is not installed')
+    return create_app({'TESTING': True, 'DATABASE_BACKEND': 'memory',
+                       'JSON_FAST_ENCODER': request.param})
+
+
+class TestJSONProvider:
+    """Test cases for both encoders"""
+
+    def test_response_types(self, app):
+        """Test that ObjectId, dates, decimals and numpy values are encoded alike"""
+        with app.app_context():
+            response = app.json.response(DOC)
+        assert response.mimetype == 'application/json'
+        assert json.loads(response.get_data()) == EXPECTED
+        assert json.loads(app.json.dumps(DOC)) == EXPECTED
+
+    def test_sorted_compact_output(self, app):
+        """Test that keys are sorted, so equal documents give equal bytes"""
+        with app.app_context():
+            body = app.json.response({'b': 1, 'a': [1, 2]}).get_data()
+        assert body == b'{"a":[1,2],"b":1}\n'
+
+    def test_unknown_type(self, app):
+        """Test that unsupported values still raise TypeError"""
+        with app.app_context(), pytest.raises(TypeError):
+            app.json.dumps({'values': {1, 2}})
+
+    def test_request_bodies(self, app):
+        """Test parsing bodies, and a 400 for malformed JSON"""
+        client = app.test_client()
+        headers = {'X-User-Id': 'json-user'}
+        response = client.post('/api/expenses', headers=headers,
+                               json={'category': 'Café', 'value': 3, 'date': '2024-01-02'})
+        assert response.status_code == 201
+        assert response.get_json()['category'] == 'Café'
+        response = client.post('/api/expenses', headers=headers, data='{"value": ',
+                               content_type='application/json')
+        assert response.status_code == 400
+
+
+def test_ndjson_line():
+    """Test the compact line used by the NDJSON streams"""
+    line = jsonprovider.dumps({'id': DOC['id'], 'day': DOC['day'], 'value': 1.5})
+    assert line == '{"id":"65a1b2c3d4e5f60718293a4b","day":"2024-03-04","value":1.5}'
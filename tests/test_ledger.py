@@ -0,0 +1,64 @@
+"""
+Tests for the ledger helpers (validation and cursor pagination)
+"""
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from backend import ledger
+
+
+class TestLedgerHelpers:
+    """Test cases for ledger validation and query building"""
+
+    def test_parse_entry(self, sample_expense_data):
+        """Test that a valid entry is normalised for storage"""
+        entry = ledger.parse_entry(sample_expense_data)
+        assert entry == {
+            'category': 'Food',
+            'value': 50.0,
+            'date': datetime(2024, 1, 1),
+        }
+
+    @pytest.mark.parametrize('data', [
+        None,
+        {'value': 1, 'date': '2024-01-01'},
+        {'category': 'Food', 'value': 'abc', 'date': '2024-01-01'},
+        {'category': 'Food', 'value': True, 'date': '2024-01-01'},
+        {'category': 'Food', 'value': 1, 'date': '01/01/2024'},
+    ])
+    def test_parse_entry_invalid(self, data):
+        """Test that invalid entries are rejected"""
+        with pytest.raises(ledger.ValidationError):
+            ledger.parse_entry(data)
+
+    def test_cursor_round_trip(self):
+        """Test that a cursor decodes to the sort key it was built from"""
+        doc = {'_id': ObjectId(), 'date': datetime(2024, 3, 5)}
+        assert ledger.decode_cursor(ledger.encode_cursor(doc)) == (doc['date'], doc['_id'])
+
+    def test_decode_cursor_invalid(self):
+        """Test that a malformed cursor is rejected"""
+        with pytest.raises(ledger.ValidationError):
+            ledger.decode_cursor('not-a-cursor')
+
+    def test_build_query_with_cursor(self):
+        """Test that the cursor continues strictly after the last entry"""
+        doc = {'_id': ObjectId(), 'date': datetime(2024, 3, 5)}
+        query = ledger.build_query('alice', category='Food',
+                                   cursor=ledger.encode_cursor(doc))
+        assert query['user'] == 'alice'
+        assert query['category'] == 'Food'
+        assert query['$or'] == [
+            {'date': {'$lt': doc['date']}},
+            {'date': doc['date'], '_id': {'$lt': doc['_id']}},
+        ]
+
+    def test_parse_limit(self):
+        """Test page size defaults and clamping"""
+        assert ledger.parse_limit(None) == ledger.DEFAULT_PAGE_SIZE
+        assert ledger.parse_limit('10') == 10
+        assert ledger.parse_limit('100000') == ledger.MAX_PAGE_SIZE
+        with pytest.raises(ledger.ValidationError):
+            ledger.parse_limit('0')
@@ -0,0 +1,130 @@
+"""
+Tests for the append-only local storage engine
+"""
+import pytest
+
+from backend import localdb
+from backend.localdb import IndexedCollection, LocalDB, LogStore
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    return str(tmp_path / 'budgetly.log')
+
+
+class TestLocalDB:
+    """Test cases for the db.ts function API"""
+
+    def test_crud(self):
+        """Test that writes behave like the localStorage data layer"""
+        db = LocalDB()
+        db.addExpenseCategory('Food')
+        db.addExpenseCategory('Food')
+        db.addExpense('Food', 12.5, '2024-03-04')
+        db.addBudgetGoal('expense', 'monthly', 500)
+        goal = db.getBudgetGoalsList()[0]
+        db.updateBudgetGoal(goal['id'], 750)
+        db.addRecurringPayment('expense', 'Rent', 900, '2024-01-31', 'monthly', '', [])
+        payment = db.getRecurringPaymentsList()[0]
+        db.deleteRecurringPayment(payment['id'])
+
+        assert db.getExpenseCategoriesList() == ['Food']
+        assert db.getExpensesList()[0]['value'] == 12.5
+        assert db.getBudgetGoalsList()[0]['amount'] == 750
+        assert db.getRecurringPaymentsList() == []
+        found = []
+        db.getExpenses(found.extend)
+        assert len(found) == 1
+
+
+    def test_reads_are_copies(self):
+        """Test that changing returned or written records leaves the store intact"""
+        db = LocalDB()
+        db.addExpense('Food', 12.5, '2024-03-04')
+        entry = db.getExpensesList()[0]
+        entry['category'] = 'Rent'
+        db.getEntriesByCategory('expenses', 'Food')[0]['date'] = '2030-01-01'
+        db.getEntriesBetween('expenses', '2024-03-01', '2024-03-31')[0]['value'] = 0
+        db.store.get('expenses', entry['id'])['category'] = 'Rent'
+
+        reminders = [{'days': 1, 'hours': 9}]
+        db.addRecurringPayment('expense', 'Rent', 900, '2024-01-31', 'monthly', '', reminders)
+        reminders[0]['days'] = 7
+
+        assert db.getEntriesByCategory('expenses', 'Rent') == []
+        assert db.getEntriesBetween('expenses', '2030-01-01') == []
+        [stored] = db.getEntriesByCategory('expenses', 'Food')
+        assert (stored['date'], stored['value']) == ('2024-03-04', 12.5)
+        assert db.getRecurringPaymentsList()[0]['reminders'] == [{'days': 1, 'hours': 9}]
+
+
+class TestIndexedCollection:
+    """Test cases for secondary indexes"""
+
+    def test_indexes_follow_writes(self):
+        """Test that updates and deletes move records between index keys"""
+        entries = IndexedCollection(('category', 'date'))
+        entries.put('a', {'category': 'Food', 'date': '2024-03-04'})
+        entries.put('b', {'category': 'Rent', 'date': '2024-03-01'})
+        entries.put('c', {'category': 'Food', 'date': '2024-04-02'})
+        entries.put('a', {'category': 'Fuel', 'date': '2024-02-28'})
+        assert entries.delete('c')
+        assert not entries.delete('c')
+
+        assert entries.find('category', 'Food') == []
+        assert entries.find('category', 'Fuel') == [entries.get('a')]
+        assert entries.keys['category'] == ['Fuel', 'Rent']
+        assert [doc['date'] for doc in entries.range('date', '2024-03-01')] == ['2024-03-01']
+        assert [doc['date'] for doc in entries.range('date', end='2024-03-31')] == [
+            '2024-02-28', '2024-03-01']
+
+    def test_date_range(self):
+        """Test that a range query matches a full scan"""
+        db = LocalDB()
+        for day in range(1, 29):
+            db.addExpense('Food' if day % 2 else 'Fuel', day, '2024-02-%02d' % day)
+        expected = [e for e in db.getExpensesList() if '2024-02-10' <= e['date'] <= '2024-02-20']
+        assert db.getEntriesBetween('expenses', '2024-02-10', '2024-02-20') == expected
+        assert len(db.getEntriesByCategory('expenses', 'Food')) == 14
+
+
+class TestLogStore:
+    """Test cases for the log file"""
+
+    def test_replay(self, log_path):
+        """Test that reopening a store replays its log"""
+        db = LocalDB(LogStore(log_path))
+        db.addIncome('Salary', 3000, '2024-03-01')
+        db.addBudgetGoal('income', 'monthly', 3000)
+        db.deleteBudgetGoal(db.getBudgetGoalsList()[0]['id'])
+        db.store.close()
+
+        reopened = LocalDB(LogStore(log_path))
+        assert reopened.getIncomesList() == db.getIncomesList()
+        assert reopened.getBudgetGoalsList() == []
+
+    def test_torn_write(self, log_path):
+        """Test that a half-written last line is dropped on open"""
+        store = LogStore(log_path)
+        store.put('expenses', 'a', {'id': 'a'})
+        store.close()
+        with open(log_path, 'a') as log:
+            log.write('{"c":"expenses","op":"put","id":"b"')
+
+        store = LogStore(log_path)
+        assert store.values('expenses') == [{'id': 'a'}]
+        store.put('expenses', 'c', {'id': 'c'})
+        store.close()
+        assert [doc['id'] for doc in LogStore(log_path).values('expenses')] == ['a', 'c']
+
+    def test_compaction(self, log_path, monkeypatch):
+        """Test that rewrites of the same records keep the log short"""
+        monkeypatch.setattr(localdb, 'COMPACT_MIN_LINES', 10)
+        store = LogStore(log_path)
+        for i in range(100):
+            store.put('budget_goals', 'goal', {'id': 'goal', 'amount': i})
+        store.close()
+
+        with open(log_path) as log:
+            assert len(log.readlines()) <= 10
+        assert LogStore(log_path).get('budget_goals', 'goal')['amount'] == 99
@@ -0,0 +1,148 @@
+"""
+Tests for the in-memory MongoDB stand-in
+"""
+import random
+from datetime import datetime, timedelta, timezone
+from functools import cmp_to_key
+
+import pytest
+from bson import ObjectId
+from bson.errors import InvalidDocument
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from backend import docquery, ledger, reports, rollups
+from backend.memory import MemoryClient
+
+
+@pytest.fixture
+def db():
+    return MemoryClient()['budgetly_test']
+
+
+def seed_expenses(collection):
+    docs = [{'user': user, 'category': category, 'value': value,
+             'date': datetime(2024, month, day)}
+            for user in ('alice', 'bob')
+            for month, day, category, value in [
+                (1, 5, 'Food', 10.0), (1, 20, 'Rent', 900), (2, 3, 'Food', 12.5),
+                (3, 31, 'Fuel', 40.0), (3, 1, 'Food', 7.25)]]
+    collection.insert_many(docs)
+    return docs
+
+
+class TestMemoryCollection:
+    """Test cases for the pymongo collection methods"""
+
+    def test_documents_come_back_like_bson(self, db):
+        """Test that stored documents are copies at millisecond precision"""
+        when = datetime(2024, 3, 4, 5, 6, 7, 891234, tzinfo=timezone(timedelta(hours=2)))
+        doc = {'user': 'alice', 'when': when, 'ref': ObjectId(), 'tags': ('a', 'b')}
+        db['things'].insert_one(doc)
+        doc['user'] = 'changed'
+        found = db['things'].find_one(doc['_id'])
+        assert found['user'] == 'alice'
+        assert found['when'] == datetime(2024, 3, 4, 3, 6, 7, 891000)
+        assert found['tags'] == ['a', 'b']
+
+        found['user'] = 'changed again'
+        assert db['things'].find_one({'user': 'alice'}) is not None
+        with pytest.raises(InvalidDocument):
+            db['things'].insert_one({'amounts': {1.5}})
+
+    def test_find_by_index_bucket(self, db):
+        """Test that pinned fields, $or and array elements find the same documents"""
+        expenses = db['expenses']
+        expenses.create_indexes(ledger.LEDGER_INDEXES)
+        seed_expenses(expenses)
+        page = list(expenses.find(ledger.build_query('alice', category='Food'),
+                                  {'value': 1, '_id': 0}).sort(ledger.SORT_ORDER).limit(2))
+        assert page == [{'value': 7.25}, {'value': 12.5}]
+        assert expenses.count_documents({'user': 'alice', '$or': [
+            {'category': 'Rent'}, {'value': {'$lt': 10}}]}) == 2
+
+        expenses.update_one({'user': 'bob', 'category': 'Rent'},
+                            {'$set': {'user': ['bob', 'carol']}})
+        assert [doc['value'] for doc in expenses.find({'user': 'carol'})] == [900]
+        assert expenses.count_documents({'user': 'bob'}) == 5
+        assert expenses.delete_many({'user': 'alice'}).deleted_count == 5
+        assert expenses.find_one({'user': 'alice'}) is None
+
+    def test_unique_indexes(self, db):
+        """Test $inc upserts on a unique key and duplicate key errors"""
+        totals = db['monthly_rollups']
+        totals.create_indexes(rollups.ROLLUP_INDEXES)
+        key = {'user': 'alice', 'type': 'expense', 'category': 'Food',
+               'month': datetime(2024, 1, 1)}
+        for _ in range(3):
+            totals.bulk_write([UpdateOne(key, {'$inc': {'total': 2.5, 'count': 1}},
+                                         upsert=True)])
+        assert totals.find_one(key, {'_id': 0}) == dict(key, total=7.5, count=3)
+
+        with pytest.raises(DuplicateKeyError):
+            totals.insert_one(dict(key))
+        with pytest.raises(BulkWriteError) as error:
+            totals.insert_many([dict(key), dict(key, category='Rent')], ordered=False)
+        assert [e['index'] for e in error.value.details['writeErrors']] == [0]
+        with pytest.raises(DuplicateKeyError):
+            totals.update_one(dict(key, category='Rent'), {'$set': {'category': 'Food'}})
+        assert totals.count_documents({}) == 2
+
+    def test_find_one_and_update(self, db):
+        """Test returning the document before or after an update"""
+        counters = db['sync_counters']
+        first = counters.find_one_and_update({'user': 'alice'}, {'$inc': {'seq': 1}},
+                                             upsert=True,
+                                             return_document=ReturnDocument.AFTER)
+        before = counters.find_one_and_update({'user': 'alice'}, {'$inc': {'seq': 5}})
+        assert (first['seq'], before['seq']) == (1, 1)
+        assert counters.find_one_and_delete({'user': 'alice'})['seq'] == 6
+        assert counters.find_one({'user': 'alice'}) is None
+
+
+    @pytest.mark.parametrize('sort', [[('a', 1), ('b', 1)], [('a', -1), ('b', -1)],
+                                      [('a', 1), ('b', -1)]])
+    def test_sort_matches_compare(self, db, sort):
+        """Test that sorted, limited and skipped pages follow compare() order"""
+        rng = random.Random(7)
+        values = [None, 0, 1.5, 2, 'x', 'y', {'k': 1}, [1, 2], [1], ObjectId(), False, True,
+                  datetime(2024, 1, 1)]
+        db['things'].insert_many([{'n': i, 'a': rng.choice(values), 'b': rng.choice(values)}
+                                  for i in range(200)])
+        db['things'].insert_one({'n': 200})
+
+        def order(x, y):
+            for path, direction in sort:
+                result = docquery.compare(x.get(path), y.get(path))
+                if result:
+                    return result * direction
+            return 0
+        expected = [doc['n'] for doc in sorted(db['things'].find(), key=cmp_to_key(order))]
+        assert [doc['n'] for doc in db['things'].find().sort(sort)] == expected
+        assert [doc['n'] for doc in db['things'].find().sort(sort).limit(15)] == expected[:15]
+        assert [doc['n'] for doc in db['things'].find(
+            sort=sort, skip=20, limit=10)] == expected[20:30]
+
+        [extremes] = db['things'].aggregate([{'$group': {
+            '_id': None, 'low': {'$min': '$a'}, 'high': {'$max': '$a'}}}])
+        present = sorted((doc['a'] for doc in db['things'].find({'a': {'$ne': None}})),
+                         key=cmp_to_key(docquery.compare))
+        assert (extremes['low'], extremes['high']) == (present[0], present[-1])
+
+
+class TestMemoryAggregation:
+    """Test cases for aggregation pipelines"""
+
+    def test_reports(self, db):
+        """Test the report pipeline over one user's documents"""
+        expenses = db['expenses']
+        expenses.create_indexes(ledger.LEDGER_INDEXES)
+        docs = seed_expenses(expenses)
+        pipeline = reports.build_pipeline('alice', datetime(2024, 1, 10), datetime(2024, 3, 1))
+        assert list(expenses.aggregate(pipeline)) == docquery.aggregate(docs, pipeline)
+
+    def test_rollup_verification(self, db):
+        """Test grouping by a compound _id with $dateTrunc"""
+        seed_expenses(db['expenses'])
+        rollups.rebuild(db)
+        assert rollups.verify(db) == []
@@ -0,0 +1,104 @@
+"""
+Tests for the Prometheus metrics
+"""
+import threading
+from types import SimpleNamespace
+
+from backend import metrics
+from backend.app import create_app
+
+
+def samples(text):
+    """{sample name with labels: value} from the text format"""
+    return {line.rpartition(' ')[0]: float(line.rpartition(' ')[2])
+            for line in text.splitlines() if line and not line.startswith('#')}
+
+
+class TestMetricTypes:
+    """Test cases for the per-thread metrics"""
+
+    def test_histogram_buckets(self):
+        """Test cumulative buckets, sum and count"""
+        histogram = metrics.Histogram('latency_seconds', 'Latency', ('route',),
+                                      buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, '/a')
+        rendered = samples('\n'.join(histogram.render()))
+        assert rendered['latency_seconds_bucket{route="/a",le="0.1"}'] == 2
+        assert rendered['latency_seconds_bucket{route="/a",le="1.0"}'] == 3
+        assert rendered['latency_seconds_bucket{route="/a",le="+Inf"}'] == 4
+        assert rendered['latency_seconds_count{route="/a"}'] == 4
+        assert rendered['latency_seconds_sum{route="/a"}'] == 3.65
+
+    def test_threads_are_merged(self):
+        """Test that shards of live and finished threads are added up"""
+        counter = metrics.Counter('events_total', 'Events', ('kind',))
+        gauge = metrics.Gauge('busy', 'Busy')
+
+        def work():
+            for _ in range(1000):
+                counter.inc('a')
+                gauge.inc()
+                gauge.dec()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc('b', amount=2)
+        assert samples('\n'.join(counter.render())) == {
+            'events_total{kind="a"}': 8000, 'events_total{kind="b"}': 2}
+        assert samples('\n'.join(gauge.render())) == {'busy': 0}
+        assert len(counter._shards) == 1
+
+    def test_label_escaping(self):
+        """Test that quotes and backslashes in label values are escaped"""
+        counter = metrics.Counter('errors_total', 'Errors', ('reason',))
+        counter.inc('bad "quote" \\')
+        assert 'errors_total{reason="bad \\"quote\\" \\\\"} 1' in counter.render()
+
+
+class TestMetricsEndpoint:
+    """Test cases for GET /metrics"""
+
+    def test_request_and_cache_metrics(self, client):
+        """Test that requests are counted by route, status and cache hits"""
+        headers = {'X-User-Id': 'metrics-user'}
+        client.get('/api/budget', headers=headers)
+        client.get('/api/budget', headers=headers)
+        client.post('/api/expenses', json={}, headers=headers)
+        client.get('/no/such/page')
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        assert response.content_type == metrics.CONTENT_TYPE
+
+        rendered = samples(response.get_data(as_text=True))
+        duration = 'budgetly_http_request_duration_seconds_count'
+        assert rendered[duration + '{route="/api/budget",method="GET",status="200"}'] == 2
+        assert rendered[duration + '{route="/api/<any(expenses, income):kind>",'
+                                   'method="POST",status="400"}'] == 1
+        assert rendered[duration + '{route="<unmatched>",method="GET",status="404"}'] == 1
+        assert rendered['budgetly_http_requests_in_flight'] == 1
+        assert rendered['budgetly_cache_hits_total{cache="budget"}'] == 1
+        assert rendered['budgetly_cache_hit_ratio{cache="budget"}'] == 0.5
+
+    def test_mongo_listeners(self, app):
+        """Test that command and pool events feed the MongoDB metrics"""
+        collected = app.extensions['metrics']
+        command, pool = app.extensions['mongo'].listeners
+        command.succeeded(SimpleNamespace(duration_micros=2500, command_name='find'))
+        command.failed(SimpleNamespace(duration_micros=100, command_name='insert'))
+        pool.connection_check_out_started(None)
+        pool.connection_checked_out(None)
+
+        rendered = samples(collected.render())
+        assert rendered['budgetly_mongo_command_duration_seconds_sum{command="find"}'] == 0.0025
+        assert rendered['budgetly_mongo_command_failures_total{command="insert"}'] == 1
+        assert rendered['budgetly_mongo_pool_checkout_wait_seconds_count'] == 1
+
+    def test_disabled(self):
+        """Test that METRICS_ENABLED off leaves requests untimed"""
+        app = create_app({'DATABASE_BACKEND': 'memory', 'METRICS_ENABLED': False})
+        assert 'metrics' not in app.extensions
+        assert app.test_client().get('/metrics').status_code == 404
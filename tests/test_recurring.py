@@ -0,0 +1,94 @@
+"""
+Tests for the recurring payment occurrence engine
+"""
+from datetime import date
+
+import pytest
+from bson import ObjectId
+
+from backend import recurring
+from backend.ledger import ValidationError
+
+
+def payment(start, frequency, **fields):
+    return dict({'_id': ObjectId(), 'type': 'expense', 'category': 'Rent',
+                 'value': 10.0, 'startDate': start, 'frequency': frequency},
+                **fields)
+
+
+class TestOccurrences:
+    """Test cases for computing occurrences inside a window"""
+
+    def test_monthly_clamps_without_drift(self):
+        """Test that the 31st clamps to short months and then recovers"""
+        dates = list(recurring.occurrences(date(2024, 1, 31), 'monthly',
+                                           date(2024, 1, 1), date(2024, 5, 31)))
+        assert dates == [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31),
+                         date(2024, 4, 30), date(2024, 5, 31)]
+
+    def test_yearly_leap_day(self):
+        """Test that Feb 29 falls on Feb 28 in non-leap years"""
+        dates = list(recurring.occurrences(date(2024, 2, 29), 'yearly',
+                                           date(2025, 1, 1), date(2028, 12, 31)))
+        assert dates == [date(2025, 2, 28), date(2026, 2, 28), date(2027, 2, 28),
+                         date(2028, 2, 29)]
+
+    @pytest.mark.parametrize('frequency,expected', [
+        ('daily', [date(2030, 1, 6), date(2030, 1, 7), date(2030, 1, 8)]),
+        ('weekly', [date(2030, 1, 7)]),
+    ])
+    def test_window_far_from_start(self, frequency, expected):
+        """Test that a window years after the start begins on the right date"""
+        dates = list(recurring.occurrences(date(2024, 1, 1), frequency,
+                                           date(2030, 1, 6), date(2030, 1, 8)))
+        assert dates == expected
+
+    def test_window_before_start(self):
+        """Test that nothing is produced before the start date"""
+        dates = list(recurring.occurrences(date(2024, 6, 1), 'weekly',
+                                           date(2024, 1, 1), date(2024, 6, 10)))
+        assert dates == [date(2024, 6, 1), date(2024, 6, 8)]
+
+    def test_expand_merges_in_date_order(self):
+        """Test that occurrences of several payments come out sorted"""
+        payments = [payment('2024-01-01', 'weekly', category='Gym'),
+                    payment('2024-01-03', 'monthly')]
+        result = list(recurring.expand(payments, date(2024, 1, 1), date(2024, 1, 15)))
+        assert [(o['date'], o['category']) for o in result] == [
+            ('2024-01-01', 'Gym'), ('2024-01-03', 'Rent'),
+            ('2024-01-08', 'Gym'), ('2024-01-15', 'Gym'),
+        ]
+
+    def test_expand_limit(self):
+        """Test that expansion stops after limit occurrences"""
+        result = recurring.expand([payment('2024-01-01', 'daily')],
+                                  date(2024, 1, 1), date(2024, 12, 31), limit=3)
+        assert len(list(result)) == 3
+
+
+class TestPaymentValidation:
+    """Test cases for recurring payment validation"""
+
+    def test_parse_payment(self):
+        """Test that a valid payment is normalised for storage"""
+        parsed = recurring.parse_payment({
+            'type': 'income', 'category': 'Salary', 'value': 2000,
+            'startDate': '2024-01-15', 'frequency': 'monthly',
+            'reminders': [{'days': 1}]})
+        assert parsed['value'] == 2000.0
+        assert parsed['reminders'] == [{'days': 1, 'hours': 0}]
+        assert parsed['description'] == ''
+
+    @pytest.mark.parametrize('data', [
+        None,
+        {'type': 'expense', 'category': 'Rent', 'value': 1,
+         'startDate': '2024-01-01', 'frequency': 'hourly'},
+        {'type': 'gift', 'category': 'Rent', 'value': 1,
+         'startDate': '2024-01-01', 'frequency': 'daily'},
+        {'type': 'expense', 'category': 'Rent', 'value': 1,
+         'startDate': '2024-01-01', 'frequency': 'daily', 'reminders': 'soon'},
+    ])
+    def test_parse_payment_invalid(self, data):
+        """Test that invalid payments are rejected"""
+        with pytest.raises(ValidationError):
+            recurring.parse_payment(data)
@@ -0,0 +1,109 @@
+"""
+Tests for the reminder scheduler
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from backend import reminders
+from backend.memory import MemoryClient
+
+
+class FakeClock:
+    """A clock that only moves when the scheduler sleeps"""
+
+    def __init__(self, now):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += timedelta(seconds=seconds)
+
+
+@pytest.fixture
+def db():
+    """A throwaway database, since the scheduler reads every user's entries"""
+    return MemoryClient()['budgetly_test']
+
+
+def payment(**fields):
+    return dict({'_id': ObjectId(), 'user': 'alice', 'type': 'expense',
+                 'category': 'Rent', 'value': 900.0, 'description': '',
+                 'startDate': '2024-01-31', 'frequency': 'monthly',
+                 'reminders': [{'days': 1, 'hours': 0}]}, **fields)
+
+
+class TestNextFire:
+    """Test cases for computing the next fire time"""
+
+    def test_next_fire(self):
+        """Test that the reminder fires before the occurrence it belongs to"""
+        result = reminders.next_fire(date(2024, 1, 31), 'monthly', timedelta(days=1),
+                                     datetime(2024, 2, 1))
+        assert result == (datetime(2024, 2, 29), datetime(2024, 2, 28))
+
+    def test_next_fire_skips_fired(self):
+        """Test that a reminder firing exactly at `after` is not repeated"""
+        result = reminders.next_fire(date(2024, 1, 1), 'weekly', timedelta(hours=2),
+                                     datetime(2024, 1, 7, 22))
+        assert result == (datetime(2024, 1, 15), datetime(2024, 1, 14, 22))
+
+
+class TestScheduler:
+    """Test cases for scheduling and firing reminders"""
+
+    def test_fires_due_reminders_in_batches(self, db):
+        """Test that due entries fire once and move to the next occurrence"""
+        schedule = db['reminder_schedule']
+        clock = FakeClock(datetime(2024, 2, 1))
+        for _ in range(5):
+            reminders.schedule(schedule, payment(), clock())
+        fired = []
+        scheduler = reminders.Scheduler(db, clock=clock, batch_size=2,
+                                        deliver=fired.append)
+
+        assert scheduler.run_due() == 0
+        clock.now = datetime(2024, 2, 28)
+        assert scheduler.run_due() == 5
+        assert [len(batch) for batch in fired] == [2, 2, 1]
+        assert scheduler.run_due() == 0
+        assert scheduler.next_fire_at() == datetime(2024, 3, 30)
+
+    def test_edit_and_delete_reschedule_one_payment(self, db):
+        """Test that editing a payment only rewrites its own entries"""
+        schedule = db['reminder_schedule']
+        now = datetime(2024, 2, 1)
+        rent, gym = payment(), payment(category='Gym', startDate='2024-01-10')
+        reminders.schedule(schedule, rent, now)
+        reminders.schedule(schedule, gym, now)
+        gym_entry = schedule.find_one({'payment_id': gym['_id']})
+
+        rent['reminders'] = [{'days': 3}, {'hours': 1}]
+        reminders.schedule(schedule, rent, now)
+        assert sorted(e['fire_at'] for e in schedule.find({'payment_id': rent['_id']})) == [
+            datetime(2024, 2, 26), datetime(2024, 2, 28, 23)]
+        assert schedule.find_one({'payment_id': gym['_id']}) == gym_entry
+
+        rent['reminders'] = [{'days': 3}]
+        reminders.schedule(schedule, rent, now)
+        assert schedule.count_documents({'payment_id': rent['_id']}) == 1
+        reminders.unschedule(schedule, 'alice', rent['_id'])
+        assert schedule.count_documents({}) == 1
+
+    def test_run_forever_sleeps_until_next_reminder(self, db):
+        """Test the worker loop against a fake clock"""
+        clock = FakeClock(datetime(2024, 2, 27, 12))
+        reminders.schedule(db['reminder_schedule'], payment(), clock())
+        scheduler = reminders.Scheduler(db, clock=clock)
+        scheduler.run_forever(poll_interval=3600, sleep=clock.sleep,
+                              stop=lambda: len(clock.sleeps) >= 26)
+
+        notifications = list(db['notifications'].find())
+        assert len(notifications) == 1
+        assert notifications[0]['occurs_at'] == datetime(2024, 2, 29)
+        assert reminders.serialize_notification(notifications[0])['date'] == '2024-02-29'
@@ -0,0 +1,42 @@
+"""
+Tests for report aggregation helpers
+"""
+from datetime import datetime
+
+from backend import reports, rollups
+
+
+class TestReports:
+    """Test cases for the report pipeline and chart series"""
+
+    def test_pipeline_matches_user_and_range(self):
+        """Test that the $match stage filters by owner and date range"""
+        start, end = datetime(2024, 1, 1), datetime(2024, 6, 30)
+        match = reports.build_pipeline('alice', start, end)[0]['$match']
+        assert match == {'user': 'alice', 'date': {'$gte': start, '$lte': end}}
+
+    def test_build_report_aligns_months(self):
+        """Test that both series share one sorted set of month labels"""
+        expenses = {'categories': [{'category': 'Food', 'total': 15.0}],
+                    'months': {'2024-02': 15.0, '2024-01': 5.0}}
+        incomes = {'categories': [{'category': 'Salary', 'total': 100.0}],
+                   'months': {'2024-03': 100.0}}
+        report = reports.build_report(expenses, incomes)
+        assert report['categories']['expenses'] == expenses['categories']
+        assert report['monthly'] == {
+            'labels': ['2024-01', '2024-02', '2024-03'],
+            'expenses': [5.0, 15.0, 0],
+            'incomes': [0, 0, 100.0],
+        }
+
+
+class TestRollups:
+    """Test cases for monthly rollup helpers"""
+
+    def test_month_aligned_ranges(self):
+        """Test which date ranges can be answered from monthly rollups"""
+        assert rollups.is_month_aligned(None, None)
+        assert rollups.is_month_aligned(datetime(2024, 1, 1), datetime(2024, 2, 29))
+        assert rollups.is_month_aligned(None, datetime(2024, 12, 31))
+        assert not rollups.is_month_aligned(datetime(2024, 1, 2), None)
+        assert not rollups.is_month_aligned(None, datetime(2024, 2, 28))
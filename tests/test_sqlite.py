@@ -0,0 +1,130 @@
+"""
+Tests for the SQLite storage backend
+"""
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from backend import docquery, ledger, reports, rollups
+from backend.sqlite import SQLiteClient
+
+
+@pytest.fixture
+def db():
+    client = SQLiteClient(':memory:')
+    yield client['budgetly_test']
+    client.close()
+
+
+def seed_expenses(collection):
+    docs = [{'user': user, 'category': category, 'value': value,
+             'date': datetime(2024, month, day)}
+            for user in ('alice', 'bob')
+            for month, day, category, value in [
+                (1, 5, 'Food', 10.0), (1, 20, 'Rent', 900), (2, 3, 'Food', 12.5),
+                (3, 31, 'Fuel', 40.0), (3, 1, 'Food', 7.25)]]
+    collection.insert_many(docs)
+    return docs
+
+
+class TestSQLiteCollection:
+    """Test cases for the pymongo collection methods"""
+
+    def test_round_trip(self, db):
+        """Test that dates, ObjectIds and nested values come back as stored"""
+        doc = {'user': 'alice', 'when': datetime(2024, 3, 4, 5, 6, 7, 891234),
+               'ref': ObjectId(), 'reminders': [{'days': 1, 'hours': 0}]}
+        inserted = db['things'].insert_one(doc).inserted_id
+        assert inserted == doc['_id']
+        found = db['things'].find_one({'_id': inserted})
+        assert found == dict(doc, when=datetime(2024, 3, 4, 5, 6, 7, 891000))
+
+    def test_find_sort_limit_projection(self, db):
+        """Test keyset pagination over the ledger indexes"""
+        expenses = db['expenses']
+        expenses.create_indexes(ledger.LEDGER_INDEXES)
+        seed_expenses(expenses)
+        query = ledger.build_query('alice', category='Food')
+        page = list(expenses.find(query, {'value': 1, '_id': 0})
+                    .sort(ledger.SORT_ORDER).limit(2))
+        assert page == [{'value': 7.25}, {'value': 12.5}]
+
+        last = expenses.find_one({'user': 'alice', 'value': 12.5})
+        rest = expenses.find({'user': 'alice', '$or': [
+            {'date': {'$lt': last['date']}},
+            {'date': last['date'], '_id': {'$lt': last['_id']}}]})
+        assert sorted(doc['value'] for doc in rest) == [10.0, 900]
+        assert expenses.count_documents({'value': {'$gte': 40}}) == 4
+
+    def test_upserts_and_unique_indexes(self, db):
+        """Test $inc upserts on a unique key and duplicate key errors"""
+        totals = db['monthly_rollups']
+        totals.create_indexes(rollups.ROLLUP_INDEXES)
+        key = {'user': 'alice', 'type': 'expense', 'category': 'Food',
+               'month': datetime(2024, 1, 1)}
+        for _ in range(3):
+            totals.bulk_write([UpdateOne(key, {'$inc': {'total': 2.5, 'count': 1}},
+                                         upsert=True)])
+        assert totals.find_one(key, {'_id': 0}) == dict(key, total=7.5, count=3)
+
+        with pytest.raises(DuplicateKeyError):
+            totals.insert_one(dict(key))
+        with pytest.raises(BulkWriteError) as error:
+            totals.insert_many([dict(key), dict(key, category='Rent')], ordered=False)
+        assert [e['index'] for e in error.value.details['writeErrors']] == [0]
+        assert totals.count_documents({}) == 2
+
+    def test_find_one_and_update(self, db):
+        """Test returning the document before or after an update"""
+        counters = db['sync_counters']
+        first = counters.find_one_and_update({'user': 'alice'}, {'$inc': {'seq': 1}},
+                                             upsert=True,
+                                             return_document=ReturnDocument.AFTER)
+        before = counters.find_one_and_update({'user': 'alice'}, {'$inc': {'seq': 5}})
+        assert (first['seq'], before['seq']) == (1, 1)
+        assert counters.find_one_and_delete({'user': 'alice'})['seq'] == 6
+        assert counters.find_one({'user': 'alice'}) is None
+
+
+class TestSQLiteAggregation:
+    """Test cases for pipelines run as GROUP BY"""
+
+    def test_reports_match_python(self, db):
+        """Test that the report pipeline gives the same rows in SQL and Python"""
+        expenses = db['expenses']
+        docs = seed_expenses(expenses)
+        for start, end in [(None, None), (datetime(2024, 1, 10), datetime(2024, 3, 1))]:
+            pipeline = reports.build_pipeline('alice', start, end)
+            assert list(expenses.aggregate(pipeline)) == docquery.aggregate(docs, pipeline)
+        assert expenses._aggregate_in_sql({'user': 'alice'}, pipeline[1:]) is not None
+
+    def test_rollup_verification(self, db):
+        """Test grouping by a compound _id with $dateTrunc"""
+        seed_expenses(db['expenses'])
+        rollups.rebuild(db)
+        assert rollups.verify(db) == []
+        march = db['monthly_rollups'].find_one({'user': 'bob', 'month': datetime(2024, 3, 1),
+                                                'category': 'Food'})
+        assert (march['total'], march['count']) == (7.25, 1)
+
+
+class TestSQLiteFile:
+    """Test cases for the on-disk database"""
+
+    def test_reopen(self, tmp_path):
+        """Test that data and index columns survive reopening in WAL mode"""
+        path = str(tmp_path / 'budgetly.sqlite3')
+        client = SQLiteClient(path)
+        client['budgetly']['budget_goals'].create_indexes(
+            [IndexModel([('user', ASCENDING), ('period', ASCENDING)], name='user_period')])
+        client['budgetly']['budget_goals'].insert_one({'user': 'alice', 'period': 'monthly'})
+        mode = next(iter(client.rows('PRAGMA journal_mode', ())))[0]
+        client.close()
+
+        reopened = SQLiteClient(path)['budgetly']['budget_goals']
+        assert mode == 'wal'
+        assert 'period' in reopened.columns
+        assert reopened.find_one({'period': 'monthly'})['user'] == 'alice'
@@ -0,0 +1,69 @@
+"""
+Tests for the delta sync change log
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend import sync
+from backend.ledger import ValidationError
+from backend.memory import MemoryClient
+
+
+@pytest.fixture
+def db():
+    """A throwaway database, so change numbers start from scratch"""
+    return MemoryClient()['budgetly_test']
+
+
+def later(seconds=sync.SETTLE_SECONDS + 1):
+    return datetime.utcnow() + timedelta(seconds=seconds)
+
+
+class TestChangeLog:
+    """Test cases for recording and reading changes"""
+
+    def test_latest_change_per_document(self, db):
+        """Test that only the newest change of a document is kept"""
+        sync.record(db, 'alice', 'expenses', [('a', {'value': 1}), ('b', {'value': 2})])
+        sync.record(db, 'alice', 'expenses', [('a', None)])
+        sync.record(db, 'bob', 'expenses', [('c', {'value': 3})])
+
+        data = sync.changes_since(db, 'alice', 0, 10, now=later())
+        assert [(c['id'], c['seq'], c['deleted']) for c in data['changes']] == [
+            ('b', 2, False), ('a', 3, True)]
+        assert data['next'] == '3'
+        assert sync.changes_since(db, 'alice', 3, 10, now=later())['changes'] == []
+
+    def test_paging(self, db):
+        """Test that has_more pages through the log with the returned token"""
+        sync.record(db, 'alice', 'incomes', [(str(i), {}) for i in range(5)])
+        data = sync.changes_since(db, 'alice', 0, 2, now=later())
+        assert (data['next'], data['has_more']) == ('2', True)
+        data = sync.changes_since(db, 'alice', 4, 2, now=later())
+        assert (data['next'], data['has_more']) == ('5', False)
+
+    def test_unsettled_changes_are_repeated(self, db):
+        """Test that the token does not move past changes still settling"""
+        sync.record(db, 'alice', 'incomes', [('a', {}), ('b', {})])
+        data = sync.changes_since(db, 'alice', 0, 1)
+        assert len(data['changes']) == 1
+        assert (data['next'], data['has_more']) == ('0', False)
+
+
+class TestParsing:
+    """Test cases for request parsing"""
+
+    def test_parse_token(self):
+        """Test that tokens are non-negative integers, empty meaning a full sync"""
+        assert sync.parse_token(None) == 0
+        assert sync.parse_token('12') == 12
+        with pytest.raises(ValidationError):
+            sync.parse_token('-1')
+
+    def test_parse_limit(self):
+        """Test that limits are positive and capped"""
+        assert sync.parse_limit(None) == sync.DEFAULT_LIMIT
+        assert sync.parse_limit('999999') == sync.MAX_LIMIT
+        with pytest.raises(ValidationError):
+            sync.parse_limit('0')